@@ -0,0 +1,279 @@
+"""Headless bulk analysis: python -m app.batch <videos dir | manifest> --protocol protocol.csv"""
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from app.fingerprint import ContentIndex, get_index, quick_fingerprint, sha256_file
+from app.processing import ensure_playable_input, run_protocol_analysis, select_analysis_input
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".ts", ".m4v", ".mts"}
+CSV_FIELDS = ["video", "sha256", "time", "label"]
+
+
+def collect_tasks(source: Path, default_protocol: Path | None) -> list[dict]:
+    """Build tasks from a directory of videos or a manifest (.csv with video[,protocol] columns, or .jsonl)."""
+    if source.is_dir():
+        if default_protocol is None:
+            raise SystemExit("--protocol is required when processing a directory")
+        videos = sorted(p for p in source.iterdir() if p.is_file() and p.suffix.lower() in VIDEO_EXTENSIONS)
+        return [{"video": str(p), "protocol": str(default_protocol)} for p in videos]
+
+    if source.suffix.lower() == ".jsonl":
+        rows = [json.loads(line) for line in source.read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        with source.open(newline="", encoding="utf-8") as fh:
+            rows = list(csv.DictReader(fh))
+
+    tasks = []
+    for row in rows:
+        video = (row.get("video") or "").strip()
+        if not video:
+            continue
+        protocol = (row.get("protocol") or "").strip() or (str(default_protocol) if default_protocol else "")
+        if not protocol:
+            raise SystemExit(f"no protocol for {video}: add a protocol column or pass --protocol")
+        # Relative paths in a manifest are relative to the manifest itself.
+        video_path = Path(video) if Path(video).is_absolute() else source.parent / video
+        protocol_path = Path(protocol) if Path(protocol).is_absolute() else source.parent / protocol
+        tasks.append({"video": str(video_path), "protocol": str(protocol_path)})
+    return tasks
+
+
+def load_done(output_path: Path) -> set[tuple[str, str]]:
+    """(video fingerprint or sha256, protocol sha256) pairs already finished successfully in an earlier run."""
+    done = set()
+    if not output_path.exists():
+        return done
+    for line in output_path.read_text(encoding="utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # torn last line from an interrupted run
+        if record.get("status") == "done":
+            for video_key in (record.get("fingerprint"), record.get("sha256")):
+                if video_key:
+                    done.add((video_key, record.get("protocol_sha256")))
+    return done
+
+
+def process_video(task: dict, converted_dir: str, model_path: str, settings: dict) -> dict:
+    video_path = Path(task["video"])
+    started = time.perf_counter()
+    record = {
+        "video": video_path.name,
+        "path": str(video_path),
+        "fingerprint": task.get("fingerprint"),
+        "sha256": None,
+        "protocol": task["protocol"],
+        "protocol_sha256": task.get("protocol_sha256"),
+    }
+    try:
+        # The full hash is read here, in parallel with other videos, not before the first job starts.
+        hashes = get_index(Path(task["hashes"])) if task.get("hashes") else None
+        record["sha256"] = hashes.sha256(video_path) if hashes is not None else sha256_file(video_path)
+        analysis_path, was_converted = ensure_playable_input(
+            video_path,
+            Path(converted_dir),
+            check_cancel=lambda: False,
+            progress_cb=lambda _p: None,
+            event_cb=lambda _msg: None,
+        )
+        analysis_input = select_analysis_input(
+            video_path,
+            analysis_path,
+            Path(converted_dir).parent / "proxy",
+            settings,
+            check_cancel=lambda: False,
+            progress_cb=lambda _p: None,
+            event_cb=lambda _msg: None,
+        )
+        analysis = run_protocol_analysis(
+            analysis_input,
+            Path(task["protocol"]),
+            Path(model_path),
+            settings=settings,
+            check_cancel=lambda: False,
+            progress_cb=lambda _p: None,
+            event_cb=lambda _msg: None,
+        )
+        record.update({
+            "status": "done",
+            "converted": analysis_path.name if was_converted else None,
+            "timestamps": analysis["timestamps"],
+            "results_text": analysis["results_text"],
+        })
+    except Exception as exc:
+        record.update({"status": "error", "error": str(exc)})
+    record["elapsed_sec"] = round(time.perf_counter() - started, 2)
+    return record
+
+
+class ResultWriter:
+    """Appends one JSONL record (and CSV rows per detected climber) as each video finishes."""
+
+    def __init__(self, jsonl_path: Path, csv_path: Path | None = None):
+        jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+        self._jsonl = jsonl_path.open("a", encoding="utf-8")
+        self._csv_file = None
+        self._csv = None
+        if csv_path is not None:
+            new_file = not csv_path.exists() or csv_path.stat().st_size == 0
+            self._csv_file = csv_path.open("a", newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, record: dict):
+        self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._jsonl.flush()
+        if self._csv is not None and record.get("status") == "done":
+            for item in record.get("timestamps") or []:
+                self._csv.writerow({
+                    "video": record["video"],
+                    "sha256": record["sha256"],
+                    "time": item.get("time"),
+                    "label": item.get("label"),
+                })
+            self._csv_file.flush()
+
+    def close(self):
+        self._jsonl.close()
+        if self._csv_file is not None:
+            self._csv_file.close()
+
+
+def run_batch(
+    tasks: list[dict],
+    writer: ResultWriter,
+    *,
+    done: set[tuple[str, str]],
+    workers: int,
+    converted_dir: Path,
+    model_path: Path,
+    settings: dict,
+    hashes: ContentIndex | None = None,
+    log=print,
+) -> dict:
+    # The resume key is the quick fingerprint (sampled blocks), so the first job starts right
+    # away; remembered fingerprints make re-runs cost one stat per unchanged video.
+    fingerprint_file = hashes.fingerprint if hashes is not None else quick_fingerprint
+    protocol_hashes: dict[str, str] = {}
+    pending = []
+    counts = {"done": 0, "error": 0, "skipped": 0}
+    for task in tasks:
+        video_path = Path(task["video"])
+        if not video_path.exists():
+            writer.write({"video": video_path.name, "path": str(video_path), "status": "error", "error": "file not found"})
+            counts["error"] += 1
+            continue
+        if task["protocol"] not in protocol_hashes:
+            protocol_hashes[task["protocol"]] = sha256_file(Path(task["protocol"]))
+        task = {
+            **task,
+            "fingerprint": fingerprint_file(video_path),
+            "protocol_sha256": protocol_hashes[task["protocol"]],
+            "hashes": str(hashes.path) if hashes is not None else None,
+        }
+        key = (task["fingerprint"], task["protocol_sha256"])
+        # Records from runs that keyed on sha256 still count when that hash is remembered.
+        legacy = hashes.cached_sha256(video_path) if hashes is not None else None
+        if key in done or (legacy, task["protocol_sha256"]) in done:
+            counts["skipped"] += 1
+            continue
+        done.add(key)  # identical copies in the same run are analysed once
+        pending.append(task)
+
+    log(f"{len(pending)} to process, {counts['skipped']} already done")
+
+    def _finish(record: dict):
+        counts[record["status"]] += 1
+        writer.write(record)
+        log(f"[{counts['done'] + counts['error']}/{len(tasks)}] {record['video']}: {record['status']}"
+            + (f" ({record['error']})" if record.get("error") else ""))
+
+    args = (str(converted_dir), str(model_path), settings)
+    if workers <= 1:
+        for task in pending:
+            _finish(process_video(task, *args))
+        return counts
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = {pool.submit(process_video, task, *args): task for task in pending}
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = futures.pop(future)
+                try:
+                    record = future.result()
+                except Exception as exc:  # worker crashed (e.g. OOM kill)
+                    record = {
+                        "video": Path(task["video"]).name,
+                        "path": task["video"],
+                        "fingerprint": task["fingerprint"],
+                        "sha256": None,
+                        "protocol": task["protocol"],
+                        "protocol_sha256": task["protocol_sha256"],
+                        "status": "error",
+                        "error": str(exc),
+                    }
+                _finish(record)
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.batch", description=__doc__)
+    parser.add_argument("source", type=Path, help="directory with videos or manifest (.csv/.jsonl with video[,protocol])")
+    parser.add_argument("--protocol", type=Path, help="protocol CSV used for videos without their own")
+    parser.add_argument("--output", type=Path, default=BASE_DIR / "outputs" / "batch" / "results.jsonl")
+    parser.add_argument("--csv", type=Path, help="also write one CSV row per detected climber")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--model", type=Path, default=BASE_DIR / "models" / "yolov8n.pt")
+    parser.add_argument("--converted-dir", type=Path, default=BASE_DIR / "outputs" / "converted")
+    parser.add_argument("--frame-interval", type=int, dest="frame_interval_sec")
+    parser.add_argument("--conf-limit", type=int, dest="conf_limit")
+    parser.add_argument("--session-timeout", type=int, dest="session_timeout_sec")
+    parser.add_argument("--phantom-timeout", type=int, dest="phantom_timeout_sec")
+    parser.add_argument("--proxy", action="store_true", help="analyse a cached low-resolution proxy (outputs/proxy)")
+    parser.add_argument(
+        "--sampling",
+        choices=["exact", "keyframes", "auto"],
+        help="keyframes: snap samples to nearby keyframes (much less decoding); auto: only when the GOP is short",
+    )
+    args = parser.parse_args(argv)
+
+    settings = {
+        name: getattr(args, name)
+        for name in ("frame_interval_sec", "conf_limit", "session_timeout_sec", "phantom_timeout_sec", "sampling")
+        if getattr(args, name) is not None
+    }
+    if args.proxy:
+        settings["analysis_proxy"] = True
+    tasks = collect_tasks(args.source, args.protocol)
+    writer = ResultWriter(args.output, args.csv)
+    try:
+        counts = run_batch(
+            tasks,
+            writer,
+            done=load_done(args.output),
+            workers=args.workers,
+            converted_dir=args.converted_dir,
+            model_path=args.model,
+            settings=settings,
+            hashes=get_index(args.output.parent / ".hashes.json"),
+            log=lambda msg: print(msg, file=sys.stderr, flush=True),
+        )
+    finally:
+        writer.close()
+    print(json.dumps(counts), file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
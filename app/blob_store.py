@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from threading import Lock
+
+from app import metrics
+
+OBJECTS_DIR_NAME = ".objects"
+INDEX_NAME = "index.json"
+STALE_TMP_SEC = 24 * 3600
+
+
+class BlobWriter:
+    """Temp file inside the object store that hashes bytes as they are written."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._fh = path.open("wb")
+
+    def write(self, chunk: bytes):
+        self._fh.write(chunk)
+        self._fh.flush()  # a reader may be following the file while it grows
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+class BlobStore:
+    """Content-addressed video store: ``.objects/<sha256>`` blobs, user-visible names are hardlinks.
+
+    A sidecar ``.objects/index.json`` records size, the names pointing at each blob and
+    its probe metadata, so a re-upload of known bytes is linked without being read or
+    probed again.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects_dir = self.root / OBJECTS_DIR_NAME
+        self.index_path = self.objects_dir / INDEX_NAME
+        self._lock = Lock()
+        self._index: dict = {}
+        self._loaded_mtime: int | None = None
+        self._remove_stale_tmp()
+
+    def _remove_stale_tmp(self):
+        # Leftovers of uploads interrupted by a crash or restart.
+        cutoff = time.time() - STALE_TMP_SEC
+        for path in self.objects_dir.glob("tmp-*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def _load(self) -> dict:
+        # Other API workers write the same index; pick up their changes by mtime.
+        try:
+            mtime = self.index_path.stat().st_mtime_ns
+        except OSError:
+            return self._index
+        if mtime != self._loaded_mtime:
+            try:
+                self._index = json.loads(self.index_path.read_text(encoding="utf-8"))
+                self._loaded_mtime = mtime
+            except (OSError, json.JSONDecodeError):
+                pass
+        return self._index
+
+    def _save(self):
+        tmp_path = self.index_path.with_name(f".{INDEX_NAME}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self._index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.index_path)
+        self._loaded_mtime = self.index_path.stat().st_mtime_ns
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest
+
+    def writer(self) -> BlobWriter:
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        return BlobWriter(self.objects_dir / f"tmp-{uuid.uuid4().hex}")
+
+    def lookup(self, digest: str) -> dict | None:
+        with self._lock:
+            entry = self._load().get(digest)
+            if entry is None or not self.blob_path(digest).exists():
+                return None
+            return dict(entry)
+
+    def expose(self, writer: BlobWriter, name: str) -> Path:
+        """Make the bytes written so far visible as ``name`` (a hardlink to the temp file) before commit."""
+        target = self.root / name
+        target.unlink(missing_ok=True)
+        os.link(writer.path, target)
+        return target
+
+    def commit(self, writer: BlobWriter, name: str, *, probe: dict | None = None) -> tuple[Path, bool]:
+        """Move the written bytes into the store (or drop them if already stored) and link ``name``."""
+        writer.close()
+        digest = writer.hexdigest()
+        blob = self.blob_path(digest)
+        deduplicated = blob.exists()
+        if deduplicated:
+            writer.discard()
+            metrics.inc("climbtag_blob_dedup_bytes_total", writer.size)
+        else:
+            os.replace(writer.path, blob)
+        return self._link(digest, blob, name, probe=probe), deduplicated
+
+    def adopt(self, path: Path, *, probe: dict | None = None, digest: str | None = None) -> tuple[str, bool]:
+        """Bring a file written elsewhere in ``root`` (e.g. a download) into the store.
+
+        ``digest`` is the sha256 if the writer already hashed the bytes; otherwise the file is read.
+        """
+        if digest is None:
+            h = hashlib.sha256()
+            with path.open("rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+        blob = self.blob_path(digest)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        deduplicated = blob.exists()
+        if deduplicated:
+            if not _same_file(blob, path):
+                metrics.inc("climbtag_blob_dedup_bytes_total", path.stat().st_size)
+        else:
+            try:
+                os.link(path, blob)
+            except OSError:
+                shutil.copy2(path, blob)
+        self._link(digest, blob, path.name, probe=probe)
+        return digest, deduplicated
+
+    def set_probe(self, digest: str, probe: dict):
+        with self._lock:
+            entry = self._load().get(digest)
+            if entry is not None:
+                entry["probe"] = probe
+                self._save()
+
+    def forget(self, name: str):
+        """Remove a user-visible name; the blob goes too once no name points at it."""
+        (self.root / name).unlink(missing_ok=True)
+        with self._lock:
+            index = self._load()
+            for digest, entry in list(index.items()):
+                if name in entry.get("names", []):
+                    entry["names"].remove(name)
+                    if not entry["names"]:
+                        self.blob_path(digest).unlink(missing_ok=True)
+                        del index[digest]
+            self._save()
+
+    def drop(self, digest: str):
+        self.blob_path(digest).unlink(missing_ok=True)
+        with self._lock:
+            if self._load().pop(digest, None) is not None:
+                self._save()
+
+    def _link(self, digest: str, blob: Path, name: str, *, probe: dict | None) -> Path:
+        target = self.root / name
+        if not _same_file(blob, target):
+            # Never write through an existing name: it may be a hardlink to another blob.
+            target.unlink(missing_ok=True)
+            try:
+                os.link(blob, target)
+            except OSError:  # filesystem without hardlinks
+                shutil.copy2(blob, target)
+        with self._lock:
+            index = self._load()
+            entry = index.setdefault(digest, {"size": blob.stat().st_size, "names": [], "created_at": time.time()})
+            if name not in entry["names"]:
+                entry["names"].append(name)
+            for other_digest, other in list(index.items()):
+                if other_digest != digest and name in other.get("names", []):
+                    other["names"].remove(name)
+                    # The name was the last link to the old bytes: drop them too.
+                    if not other["names"]:
+                        self.blob_path(other_digest).unlink(missing_ok=True)
+                        del index[other_digest]
+            if probe is not None:
+                entry["probe"] = probe
+            self._save()
+        return target
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import time
+
+from app import metrics
+from app.state import (
+    add_change_listener,
+    get_event_seq,
+    get_events,
+    get_state_delta,
+    get_state_snapshot,
+    remove_change_listener,
+    state_epoch,
+)
+
+FULL_SNAPSHOT_EVERY = 50
+FULL_SNAPSHOT_INTERVAL_SEC = 60.0
+PING_INTERVAL_SEC = 20.0
+SUBSCRIBER_QUEUE_SIZE = 64
+
+PING_FRAME = b"event: ping\ndata: {}\n\n"
+
+
+def parse_cursor(raw: str | None) -> int | None:
+    """Version from a Last-Event-ID of ``<epoch>:<version>``; None when it is from another epoch.
+
+    In memory mode versions restart with the process, so a cursor from a previous run
+    must not be resolved against the new history.
+    """
+    epoch, _, version = str(raw or "").strip().rpartition(":")
+    if epoch != state_epoch() or not version.isdigit():
+        return None
+    return int(version)
+
+
+def _event_id(version: int) -> str:
+    return f"{state_epoch()}:{version}"
+
+
+def _state_frame(version: int, state: dict) -> bytes:
+    with metrics.stage("sse_serialize"):
+        return f"id: {_event_id(version)}\nevent: state\ndata: {json.dumps(state, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _patch_frame(base: int, version: int, changes: dict) -> bytes:
+    with metrics.stage("sse_serialize"):
+        payload = json.dumps({"base": base, "version": version, "changes": changes}, ensure_ascii=False)
+        return f"id: {_event_id(version)}\nevent: patch\ndata: {payload}\n\n".encode("utf-8")
+
+
+def _log_frame(batch: dict) -> bytes:
+    with metrics.stage("sse_serialize"):
+        return f"event: log\ndata: {json.dumps(batch, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    def __init__(self, version: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Highest state version already delivered; stale frames are skipped.
+        self.version = version
+        self.dropped = False
+
+
+class StateBroadcaster:
+    """Serializes each state version / event batch once and fans the bytes out to SSE subscribers.
+
+    Slow clients whose queue fills up are disconnected; the UI reconnects with its
+    last version and receives only the missed delta.
+    """
+
+    def __init__(self, reconcile=None):
+        self._reconcile = reconcile
+        self._subscribers: set[Subscriber] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._version = 0
+        self._event_seq = 0
+
+    def _on_change(self):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:  # loop already closed
+            pass
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        remove_change_listener(self._on_change)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._version, _state = get_state_snapshot()
+        self._event_seq = get_event_seq()
+        add_change_listener(self._on_change)
+        self._task = loop.create_task(self._run())
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, resume_version: int | None = None, after_seq: int = 0) -> tuple[Subscriber, list[bytes]]:
+        """Register a subscriber and return the frames that bring it up to date."""
+        self._ensure_running()
+        if self._reconcile is not None:
+            self._reconcile()
+        frames = []
+        changes = None
+        version = None
+        if resume_version is not None:
+            version, changes = get_state_delta(resume_version)
+        if changes is None:
+            version, state = get_state_snapshot()
+            frames.append(_state_frame(version, state))
+        elif changes:
+            frames.append(_patch_frame(resume_version, version, changes))
+        frames.append(_log_frame(get_events(after_seq)))
+
+        subscriber = Subscriber(version)
+        self._subscribers.add(subscriber)
+        metrics.set_gauge("climbtag_sse_subscribers", len(self._subscribers))
+        return subscriber, frames
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        metrics.set_gauge("climbtag_sse_subscribers", len(self._subscribers))
+
+    def _drop(self, subscriber: Subscriber):
+        subscriber.dropped = True
+        self._subscribers.discard(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        metrics.inc("climbtag_sse_dropped_total")
+        metrics.set_gauge("climbtag_sse_subscribers", len(self._subscribers))
+
+    def _publish(self, frame: bytes, version: int | None = None):
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait((version, frame))
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    async def _run(self):
+        patches_since_full = 0
+        last_full_at = time.monotonic()
+        wakeup = self._wakeup
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=PING_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                if self._subscribers:
+                    self._publish(PING_FRAME)
+                continue
+            wakeup.clear()
+            if not self._subscribers:
+                self._version, _state = get_state_snapshot()
+                self._event_seq = get_event_seq()
+                continue
+
+            if self._reconcile is not None:
+                self._reconcile()
+
+            if get_event_seq() > self._event_seq:
+                batch = get_events(self._event_seq)
+                self._event_seq = batch["last_seq"]
+                self._publish(_log_frame(batch))
+
+            full_due = (
+                patches_since_full >= FULL_SNAPSHOT_EVERY
+                or time.monotonic() - last_full_at >= FULL_SNAPSHOT_INTERVAL_SEC
+            )
+            version, changes = get_state_delta(self._version)
+            if version == self._version:
+                continue
+            if changes is None or full_due:
+                version, state = get_state_snapshot()
+                self._publish(_state_frame(version, state), version)
+                patches_since_full = 0
+                last_full_at = time.monotonic()
+            elif changes:
+                self._publish(_patch_frame(self._version, version, changes), version)
+                patches_since_full += 1
+            self._version = version
+
+    async def stream(self, subscriber: Subscriber, initial: list[bytes]):
+        try:
+            for frame in initial:
+                yield frame
+            while True:
+                item = await subscriber.queue.get()
+                if item is None:
+                    break
+                version, frame = item
+                if version is not None:
+                    if version <= subscriber.version:
+                        continue
+                    subscriber.version = version
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
@@ -1,5 +1,7 @@
 from pathlib import Path
 
+from app import metrics
+
 
 class DetectorUnavailableError(RuntimeError):
     pass
@@ -32,7 +34,8 @@ class PersonNumberDetector:
         self.reader = self._easyocr.Reader(["en"], gpu=False)
 
     def detect(self, frame, matcher):
-        results = self.model(frame, verbose=False)[0]
+        with metrics.stage("yolo"):
+            results = self.model(frame, verbose=False)[0]
         matched = []
         # TODO: bbox rendering temporarily disabled to reduce UI noise.
         bboxes = []
@@ -57,9 +60,11 @@ class PersonNumberDetector:
             if crop_back.size == 0:
                 continue
 
-            ocr_results = self.reader.readtext(crop_back)
+            with metrics.stage("ocr"):
+                ocr_results = self.reader.readtext(crop_back)
             for _, text, _conf in ocr_results:
-                num, name = matcher.find_participant(text)
+                with metrics.stage("match"):
+                    num, name = matcher.find_participant(text)
                 if not num:
                     continue
 
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECTIONS_ENV = "CLIMBTAG_DOWNLOAD_CONNECTIONS"
+DEFAULT_CONNECTIONS = 4
+MAX_CONNECTIONS = 16
+PART_SIZE = 32 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+PROGRESS_INTERVAL_SEC = 0.5
+SIDECAR_INTERVAL_SEC = 1.0
+CANCEL_POLL_SEC = 0.25
+PART_RETRIES = 3
+SIDECAR_SUFFIX = ".parts.json"
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class RangeNotHonoured(RuntimeError):
+    pass
+
+
+def configured_connections() -> int:
+    try:
+        value = int(os.environ.get(CONNECTIONS_ENV) or DEFAULT_CONNECTIONS)
+    except ValueError:
+        return DEFAULT_CONNECTIONS
+    return max(1, min(MAX_CONNECTIONS, value))
+
+
+def session() -> requests.Session:
+    """Process-wide session, so keep-alive connections are reused across parts and downloads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def sidecar_path(target: Path) -> Path:
+    return target.with_name(target.name + SIDECAR_SUFFIX)
+
+
+def _pwrite(fd: int, data: bytes, offset: int, lock: threading.Lock):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+        return
+    # No positional write (Windows): seek+write must not interleave between threads.
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _split(total: int, connections: int) -> list[list[int]]:
+    """[start, end_inclusive, done] parts: at least one per connection, none larger than PART_SIZE."""
+    count = max(connections, math.ceil(total / PART_SIZE))
+    size = math.ceil(total / count)
+    return [[start, min(total, start + size) - 1, 0] for start in range(0, total, size)]
+
+
+class _Progress:
+    """Byte counter shared by the part workers; reports and checkpoints at a fixed rate."""
+
+    def __init__(self, total: int, parts: list[list[int]], progress_cb, save_sidecar):
+        self.total = total
+        self.parts = parts
+        self.done = sum(part[2] for part in parts)
+        self._cb = progress_cb
+        self._save = save_sidecar
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+        self._last_percent = -1
+        self._last_save = time.monotonic()
+
+    def add(self, part: list[int], count: int):
+        with self._lock:
+            part[2] += count
+            self.done += count
+            self.flush()
+
+    def checkpoint(self):
+        with self._lock:
+            self.flush(force=True)
+
+    def flush(self, force: bool = False):
+        now = time.monotonic()
+        percent = int(self.done * 100 / self.total) if self.total else 0
+        if force or (percent != self._last_percent and now - self._last_report >= PROGRESS_INTERVAL_SEC):
+            self._last_report = now
+            self._last_percent = percent
+            self._cb(percent)
+        if self._save is not None and (force or now - self._last_save >= SIDECAR_INTERVAL_SEC):
+            self._last_save = now
+            self._save()
+
+
+def _load_sidecar(target: Path, url: str, total: int, validator: str | None) -> list[list[int]] | None:
+    try:
+        data = json.loads(sidecar_path(target).read_text(encoding="utf-8"))
+        st = target.stat()
+    except (OSError, json.JSONDecodeError):
+        return None
+    if data.get("url") != url or data.get("size") != total or data.get("validator") != validator:
+        return None
+    if st.st_nlink > 1:
+        return None  # the name points at a stored blob, not at our partial file
+    parts = data.get("parts") or []
+    if not parts or any(len(p) != 3 or p[2] < 0 or p[0] + p[2] > p[1] + 1 for p in parts):
+        return None
+    return [list(map(int, p)) for p in parts]
+
+
+def _write_sidecar(target: Path, url: str, total: int, validator: str | None, parts: list[list[int]]):
+    path = sidecar_path(target)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(
+        json.dumps({"url": url, "size": total, "validator": validator, "parts": parts}),
+        encoding="utf-8",
+    )
+    os.replace(tmp_path, path)
+
+
+def _open_probe(http: requests.Session, url: str, timeout: float) -> requests.Response:
+    # A one-byte range tells us the size and whether ranges work, in one round trip.
+    return http.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout)
+
+
+def _total_from(response: requests.Response) -> int | None:
+    content_range = response.headers.get("content-range", "")
+    if response.status_code == 206 and "/" in content_range:
+        tail = content_range.rsplit("/", 1)[1]
+        return int(tail) if tail.isdigit() else None
+    length = response.headers.get("content-length")
+    return int(length) if response.status_code == 200 and length and length.isdigit() else None
+
+
+def download(
+    url: str,
+    target: Path,
+    *,
+    connections: int | None = None,
+    progress_cb=lambda _p: None,
+    check_cancel=lambda: False,
+    validate_headers=None,
+    on_open=None,
+    on_digest=None,
+    timeout: float = 30,
+) -> Path:
+    """Download ``url`` into ``target``, over parallel Range requests when the server allows it.
+
+    Progress of a ranged download is checkpointed to ``<target>.parts.json``; a later call for
+    the same URL (same size and ETag/Last-Modified) continues from there, after a cancel
+    (DownloadCancelled, partial file kept) or a crash. ``on_open(total)`` runs once the
+    size is known, right before the first byte is written. With ``connections=1`` the
+    file is written strictly in order, so it can be read while it grows.
+
+    ``on_digest(sha256)`` receives the hash of the finished file when it was written in
+    order (one stream or one range), computed as the bytes arrive; a download split into
+    parallel ranges is not hashed here.
+    """
+    target = Path(target)
+    connections = connections or configured_connections()
+    http = session()
+    opened = False
+
+    def _open(total: int | None):
+        nonlocal opened
+        if on_open is not None and not opened:
+            opened = True
+            on_open(total)
+
+    probe = _open_probe(http, url, timeout)
+    with probe:
+        probe.raise_for_status()
+        if validate_headers is not None:
+            validate_headers(probe.headers)
+        total = _total_from(probe)
+        validator = probe.headers.get("etag") or probe.headers.get("last-modified")
+        if probe.status_code != 206 or not total:
+            if probe.status_code == 200:
+                # No Range support: this response already carries the whole body.
+                _open(total)
+                _restart(target)
+                _stream_whole(probe, target, total, progress_cb=progress_cb, check_cancel=check_cancel, on_digest=on_digest)
+                return target
+            total = None
+
+    if total:
+        try:
+            _download_ranges(
+                url, target, total, validator, connections, http, _open, progress_cb, check_cancel, timeout, on_digest
+            )
+            return target
+        except RangeNotHonoured:
+            pass  # the resource changed or a proxy dropped Range: start over in one stream
+
+    with http.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        total = _total_from(response)
+        _open(total)
+        _restart(target)
+        _stream_whole(response, target, total, progress_cb=progress_cb, check_cancel=check_cancel, on_digest=on_digest)
+    return target
+
+
+def _restart(target: Path):
+    target.unlink(missing_ok=True)
+    sidecar_path(target).unlink(missing_ok=True)
+
+
+def _download_ranges(
+    url, target, total, validator, connections, http, on_open, progress_cb, check_cancel, timeout, on_digest=None
+):
+    parts = _load_sidecar(target, url, total, validator)
+    if parts is None:
+        target.unlink(missing_ok=True)
+        parts = _split(total, connections) if connections > 1 else [[0, total - 1, 0]]
+    on_open(total)
+    hasher = None
+    if on_digest is not None and len(parts) == 1:
+        # One range is written front to back: hash it on the way in, after the resumed prefix.
+        hasher = hashlib.sha256()
+        if parts[0][2]:
+            with target.open("rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+
+    fd = os.open(target, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        if len(parts) > 1:
+            # Preallocate so out-of-order parts land in place without growing the file piecemeal.
+            try:
+                os.posix_fallocate(fd, 0, total)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, total)
+        else:
+            os.ftruncate(fd, parts[0][2])  # sequential: the file is exactly the bytes we have
+        progress = _Progress(total, parts, progress_cb, lambda: _write_sidecar(target, url, total, validator, parts))
+        _write_sidecar(target, url, total, validator, parts)
+        cancelled = threading.Event()
+        write_lock = threading.Lock()
+        pending = [part for part in parts if part[0] + part[2] <= part[1]]
+        with ThreadPoolExecutor(max_workers=min(connections, len(pending) or 1), thread_name_prefix="range") as pool:
+            remaining = {
+                pool.submit(_fetch_part, http, url, fd, part, progress, cancelled, write_lock, validator, timeout, hasher)
+                for part in pending
+            }
+            while remaining:
+                done, remaining = wait(remaining, timeout=CANCEL_POLL_SEC, return_when=FIRST_EXCEPTION)
+                failed = next((f.exception() for f in done if f.exception() is not None), None)
+                if failed is None and not (remaining and check_cancel()):
+                    continue
+                cancelled.set()
+                wait(remaining)
+                progress.checkpoint()
+                if isinstance(failed, RangeNotHonoured):
+                    os.close(fd)
+                    fd = None
+                    _restart(target)
+                if failed is not None:
+                    raise failed
+                raise DownloadCancelled("download cancelled")
+        progress.checkpoint()
+    finally:
+        if fd is not None:
+            os.close(fd)
+    sidecar_path(target).unlink(missing_ok=True)
+    if hasher is not None:
+        on_digest(hasher.hexdigest())
+
+
+def _fetch_part(
+    http, url, fd, part, progress: _Progress, cancelled: threading.Event, write_lock, validator, timeout, hasher=None
+):
+    start, end, _done = part
+    for attempt in range(PART_RETRIES):
+        offset = start + part[2]
+        headers = {"Range": f"bytes={offset}-{end}"}
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code != 206:
+                    raise RangeNotHonoured(f"server answered {response.status_code} to a range request")
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if cancelled.is_set():
+                        return
+                    if not chunk:
+                        continue
+                    chunk = chunk[: end + 1 - offset]
+                    _pwrite(fd, chunk, offset, write_lock)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    offset += len(chunk)
+                    progress.add(part, len(chunk))
+                    if offset > end:
+                        return
+            raise requests.ConnectionError(f"connection closed at byte {offset} of part {start}-{end}")
+        except requests.RequestException:
+            if attempt == PART_RETRIES - 1 or cancelled.is_set():
+                raise
+            time.sleep(0.5 * (attempt + 1))
+
+
+def _stream_whole(response: requests.Response, target: Path, total: int | None, *, progress_cb, check_cancel, on_digest=None):
+    hasher = hashlib.sha256() if on_digest is not None else None
+    downloaded = 0
+    last_report = 0.0
+    last_check = 0.0
+    with target.open("wb") as out:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if not chunk:
+                continue
+            now = time.monotonic()
+            if now - last_check >= CANCEL_POLL_SEC:
+                last_check = now
+                if check_cancel():
+                    raise DownloadCancelled("download cancelled")
+            out.write(chunk)
+            out.flush()
+            if hasher is not None:
+                hasher.update(chunk)
+            downloaded += len(chunk)
+            if total and now - last_report >= PROGRESS_INTERVAL_SEC:
+                last_report = now
+                progress_cb(int(downloaded * 100 / total))
+    if total:
+        progress_cb(int(downloaded * 100 / total))
+    if hasher is not None:
+        on_digest(hasher.hexdigest())
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import queue
+import time
+from pathlib import Path
+from threading import Lock, Thread
+
+SAMPLE_COUNT = 8
+SAMPLE_SIZE = 64 * 1024
+FULL_HASH_ENV = "CLIMBTAG_FULL_HASH"
+
+
+def full_hash_enabled() -> bool:
+    return os.environ.get(FULL_HASH_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def quick_fingerprint(path: Path, size: int | None = None) -> str:
+    """Hash of the file size and SAMPLE_COUNT evenly spaced blocks (reads at most 512 KiB)."""
+    if size is None:
+        size = path.stat().st_size
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with path.open("rb") as fh:
+        if size <= SAMPLE_COUNT * SAMPLE_SIZE:
+            h.update(fh.read())
+        else:
+            for i in range(SAMPLE_COUNT):
+                fh.seek((size - SAMPLE_SIZE) * i // (SAMPLE_COUNT - 1))
+                h.update(fh.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+class ContentIndex:
+    """Persistent JSON index of source fingerprints and the outputs derived from them.
+
+    ``files`` maps a path to its (size, mtime_ns) stat key, quick fingerprint and, once
+    computed, full sha256, so an unchanged file costs one stat. ``outputs`` maps a
+    fingerprint to a derived file (e.g. the converted MP4). The file may be shared by
+    several processes: it is re-read when its mtime changes and merged before each write.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = Lock()
+        self._data: dict = {"files": {}, "outputs": {}}
+        self._loaded_mtime: int | None = None
+
+    def _reload(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        self._data = {"files": dict(data.get("files") or {}), "outputs": dict(data.get("outputs") or {})}
+        self._loaded_mtime = mtime
+
+    def _save(self, files: dict | None = None, outputs: dict | None = None, drop_outputs: tuple = ()):
+        self._reload()
+        self._data["files"].update(files or {})
+        self._data["outputs"].update(outputs or {})
+        for key in drop_outputs:
+            self._data["outputs"].pop(key, None)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self._data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._loaded_mtime = self.path.stat().st_mtime_ns
+
+    def _entry(self, path: Path) -> tuple[str, dict]:
+        key = str(Path(path).resolve())
+        st = Path(path).stat()
+        stat_key = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            self._reload()
+            entry = self._data["files"].get(key)
+            if entry is not None and entry.get("stat") == stat_key:
+                return key, dict(entry)
+        entry = {"stat": stat_key, "fingerprint": quick_fingerprint(Path(path), st.st_size)}
+        with self._lock:
+            self._save(files={key: entry})
+        return key, dict(entry)
+
+    def fingerprint(self, path: Path) -> str:
+        return self._entry(path)[1]["fingerprint"]
+
+    def cached_sha256(self, path: Path) -> str | None:
+        """The full hash if an earlier run already computed it for this exact file, without reading it."""
+        return self._entry(path)[1].get("sha256")
+
+    def sha256(self, path: Path) -> str:
+        key, entry = self._entry(path)
+        if entry.get("sha256"):
+            return entry["sha256"]
+        entry["sha256"] = sha256_file(Path(path))
+        with self._lock:
+            current = self._data["files"].get(key)
+            # Skip the write if the file changed while it was being hashed.
+            if current is None or current.get("stat") == entry["stat"]:
+                self._save(files={key: entry})
+        return entry["sha256"]
+
+    def record_sha256(self, path: Path, digest: str):
+        """Store a sha256 computed elsewhere (e.g. while the bytes were streamed in)."""
+        key, entry = self._entry(path)
+        entry["sha256"] = digest
+        with self._lock:
+            self._save(files={key: entry})
+
+    def hash_in_background(self, path: Path):
+        _hash_queue.put((self, Path(path)))
+        _ensure_hasher()
+
+    def lookup_output(self, fingerprint: str) -> dict | None:
+        with self._lock:
+            self._reload()
+            item = self._data["outputs"].get(fingerprint)
+        return dict(item) if item else None
+
+    def record_output(self, fingerprint: str, file_path: Path, **extra):
+        item = {"file": Path(file_path).name, "size": Path(file_path).stat().st_size, "created_at": time.time(), **extra}
+        with self._lock:
+            self._save(outputs={fingerprint: item})
+
+    def drop_output(self, fingerprint: str):
+        with self._lock:
+            self._save(drop_outputs=(fingerprint,))
+
+
+_indexes: dict[str, ContentIndex] = {}
+_indexes_lock = Lock()
+_hash_queue: queue.Queue = queue.Queue()
+_hasher: Thread | None = None
+
+
+def get_index(path: Path) -> ContentIndex:
+    key = str(Path(path).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = ContentIndex(Path(path))
+        return index
+
+
+def _ensure_hasher():
+    global _hasher
+    with _indexes_lock:
+        if _hasher is None or not _hasher.is_alive():
+            _hasher = Thread(target=_hash_loop, name="full-hash", daemon=True)
+            _hasher.start()
+
+
+def _hash_loop():
+    # One file at a time, so background hashing never competes with itself for disk.
+    while True:
+        index, path = _hash_queue.get()
+        try:
+            index.sha256(path)
+        except OSError:
+            pass
+        finally:
+            _hash_queue.task_done()
@@ -0,0 +1,190 @@
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Thread
+
+from app import media_info
+
+MARKER_SUFFIX = ".growing"
+STALL_TIMEOUT_SEC = 300.0
+POLL_SEC = 0.25
+CHUNK_SIZE = 1024 * 1024
+
+
+class TransferAborted(RuntimeError):
+    pass
+
+
+def marker_path(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + MARKER_SUFFIX)
+
+
+def is_growing(path: Path) -> bool:
+    try:
+        marker_mtime = marker_path(path).stat().st_mtime
+    except OSError:
+        return False
+    try:
+        data_mtime = Path(path).stat().st_mtime
+    except OSError:
+        data_mtime = 0.0
+    # A marker left behind by a crashed transfer must not keep readers waiting forever.
+    return time.time() - max(marker_mtime, data_mtime) < STALL_TIMEOUT_SEC
+
+
+def expected_size(path: Path) -> int | None:
+    try:
+        data = json.loads(marker_path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    value = data.get("expected_size")
+    return int(value) if value else None
+
+
+def begin(path: Path, expected: int | None = None):
+    """Mark ``path`` as still arriving; readers follow it until the marker disappears."""
+    marker = marker_path(path)
+    tmp_path = marker.with_name(f".{marker.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({"expected_size": expected, "started_at": time.time()}), encoding="utf-8")
+    os.replace(tmp_path, marker)
+
+
+def finish(path: Path, *, failed: bool = False):
+    """End of stream. A failed transfer removes the file first, so readers see it as aborted."""
+    if failed:
+        Path(path).unlink(missing_ok=True)
+    marker_path(path).unlink(missing_ok=True)
+
+
+@contextmanager
+def arriving(path: Path, expected: int | None = None):
+    begin(path, expected)
+    try:
+        yield
+    except BaseException:
+        finish(path, failed=True)
+        raise
+    finish(path)
+
+
+def wait_complete(path: Path, *, check_cancel, poll_sec: float = POLL_SEC):
+    while is_growing(path):
+        if check_cancel():
+            raise InterruptedError("cancelled while waiting for the transfer")
+        time.sleep(poll_sec)
+    if not Path(path).exists():
+        raise TransferAborted(f"transfer of {Path(path).name} was aborted")
+
+
+def tail_chunks(path: Path, *, check_cancel, poll_sec: float = POLL_SEC, progress_cb=None):
+    """Yield the bytes of ``path`` as they arrive; EOF only counts once the transfer marker is gone."""
+    path = Path(path)
+    total = expected_size(path)
+    read = 0
+    with path.open("rb") as fh:
+        while True:
+            if check_cancel():
+                raise InterruptedError("cancelled while following the transfer")
+            chunk = fh.read(CHUNK_SIZE)
+            if chunk:
+                read += len(chunk)
+                if progress_cb is not None and total:
+                    progress_cb(min(99, int(read * 100 / total)))
+                yield chunk
+                continue
+            if is_growing(path):
+                time.sleep(poll_sec)
+                continue
+            # The marker may have been removed right after the last write: drain once more.
+            chunk = fh.read()
+            if chunk:
+                yield chunk
+            if not path.exists():
+                raise TransferAborted(f"transfer of {path.name} was aborted")
+            return
+
+
+def wait_for_header(path: Path, *, check_cancel, poll_sec: float = 1.0) -> dict | None:
+    """Probe the partial file until its video stream is readable.
+
+    Returns None when the transfer finished first (e.g. an MP4 with the index at the
+    end, which cannot be read before the last bytes arrive).
+    """
+    while is_growing(path):
+        if check_cancel():
+            raise InterruptedError("cancelled while waiting for the video header")
+        try:
+            info = media_info.probe(path, cache=False)
+        except RuntimeError:
+            info = None
+        video = (info or {}).get("video") or {}
+        if video.get("width") and video.get("height"):
+            return info
+        time.sleep(poll_sec)
+    return None
+
+
+def follow_frames(path: Path, interval_sec: int, info: dict, *, check_cancel, progress_cb):
+    """Yield (time_ms, BGR frame) every ``interval_sec`` from a file that is still being written.
+
+    A feeder thread pipes the file into ffmpeg as it grows, so the decoder never sees a
+    premature EOF; ffmpeg samples with the fps filter and writes raw frames to stdout.
+    """
+    import numpy as np
+
+    width, height = info["video"]["width"], info["video"]["height"]
+    frame_bytes = width * height * 3
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-v", "error", "-noautorotate",
+            "-i", "pipe:0",
+            "-map", "0:v:0",
+            "-vf", f"setpts=PTS-STARTPTS,fps=1/{interval_sec}",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    feed_error: list[BaseException] = []
+    stopped = False
+
+    def _feed():
+        try:
+            for chunk in tail_chunks(path, check_cancel=lambda: stopped or check_cancel(), progress_cb=progress_cb):
+                proc.stdin.write(chunk)
+        except (BrokenPipeError, InterruptedError):
+            pass
+        except BaseException as exc:
+            feed_error.append(exc)
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = Thread(target=_feed, name="follow-feed", daemon=True)
+    feeder.start()
+    try:
+        index = 0
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield index * interval_sec * 1000, np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+            index += 1
+        proc.wait()
+        feeder.join()
+        if feed_error:
+            raise feed_error[0]
+    finally:
+        stopped = True
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        feeder.join(timeout=5)
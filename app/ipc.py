@@ -0,0 +1,101 @@
+import time
+from threading import RLock
+
+from app import tracing
+
+FLUSH_INTERVAL_SEC = 0.5
+
+
+class SharedProgress:
+    """Progress percent and frame counter living in shared memory (mp.Value), read by the listener.
+
+    ``convert`` is the playback conversion percent while it runs beside analysis, -1 otherwise.
+    """
+
+    def __init__(self, ctx):
+        self.progress = ctx.Value("i", 0, lock=False)
+        self.frames = ctx.Value("q", 0, lock=False)
+        self.convert = ctx.Value("i", -1, lock=False)
+
+    def read(self) -> tuple[int, int]:
+        return int(self.progress.value), int(self.frames.value)
+
+    def read_convert(self) -> int | None:
+        value = int(self.convert.value)
+        return value if value >= 0 else None
+
+
+class WorkerChannel:
+    """Worker-process end of the pipeline IPC.
+
+    Progress ticks and frame counts only touch shared memory. Patches and events are
+    merged and shipped as one "batch" message at most every ``interval`` seconds;
+    phase transitions and errors are flushed immediately. Safe to use from the
+    conversion and analysis threads at the same time.
+    """
+
+    def __init__(self, queue, shared: SharedProgress, *, interval: float = FLUSH_INTERVAL_SEC):
+        self._queue = queue
+        self._shared = shared
+        self._interval = interval
+        self._pending: dict = {}
+        self._events: list[dict] = []
+        self._last_flush = time.monotonic()
+        self._phase: str | None = None
+        self._lock = RLock()
+
+    def progress(self, value: int):
+        self._shared.progress.value = int(value)
+        self._maybe_flush()
+
+    def frame(self, count: int):
+        self._shared.frames.value = int(count)
+        self._maybe_flush()
+
+    def convert_progress(self, value: int | None):
+        self._shared.convert.value = -1 if value is None else int(value)
+        self._maybe_flush()
+
+    def patch(self, data: dict):
+        with self._lock:
+            if "progress" in data:
+                self._shared.progress.value = int(data["progress"])
+            self._pending.update(data)
+            phase = data.get("phase")
+            if phase is not None and phase != self._phase:
+                self._phase = phase
+                self.flush()
+            else:
+                self._maybe_flush()
+
+    def event(self, message: str, *, event_type: str = "process", level: str = "info", details: dict | None = None):
+        payload = {"message": message, "event_type": event_type, "level": level}
+        if details:
+            payload["details"] = details
+        with self._lock:
+            self._events.append(payload)
+            if level == "error":
+                self.flush()
+            else:
+                self._maybe_flush()
+
+    def send(self, message: dict):
+        """Deliver a control message (metrics, final) after everything pending."""
+        with self._lock:
+            self.flush()
+            self._queue.put(message)
+
+    def _maybe_flush(self):
+        if (self._pending or self._events) and time.monotonic() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending and not self._events:
+                return
+            message = {"type": "batch", "patch": self._pending, "events": self._events}
+            with tracing.span("ipc batch", cat="ipc", keys=",".join(sorted(self._pending)), events=len(self._events)):
+                self._queue.put(message)
+            self._pending = {}
+            self._events = []
@@ -0,0 +1,253 @@
+import copy
+import heapq
+import itertools
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+
+from app.processing import CancelledError
+
+CPU_BUDGET_ENV = "CLIMBTAG_CPU_BUDGET"
+# Rough CPU share per job kind: downloads are I/O bound, ffmpeg and YOLO/OCR saturate cores.
+DEFAULT_COSTS = {"download": 1, "convert": 2, "analyse": 2}
+PUBLISH_INTERVAL_SEC = 0.5
+KEEP_FINISHED = 50
+
+
+def default_budget() -> int:
+    raw = os.environ.get(CPU_BUDGET_ENV, "").strip()
+    if raw:
+        try:
+            return max(1, int(raw))
+        except ValueError:
+            pass
+    return max(1, os.cpu_count() or 1)
+
+
+@dataclass
+class Job:
+    kind: str
+    params: dict
+    priority: int = 0
+    cost: int = 1
+    depends_on: str | None = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"
+    progress: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: dict = field(default_factory=dict)
+    error: str | None = None
+    cancel_event: Event = field(default_factory=Event, repr=False)
+
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": dict(self.params),
+            "priority": self.priority,
+            "cost": self.cost,
+            "depends_on": self.depends_on,
+            "status": self.status,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": copy.deepcopy(self.result),
+            "error": self.error,
+        }
+
+
+class JobScheduler:
+    """Priority queue of download/convert/analyse jobs run in parallel within a CPU budget.
+
+    Higher ``priority`` runs first; lower-priority jobs backfill whatever budget is left.
+    A job with ``depends_on`` waits until that job is done and fails if it did not succeed.
+    """
+
+    def __init__(self, runners: dict, *, budget: int | None = None, publish=None, event_cb=None, on_finish=None):
+        self.runners = runners
+        self.budget = budget or default_budget()
+        self._publish_cb = publish
+        self._event_cb = event_cb
+        self._on_finish = on_finish
+        self._lock = Lock()
+        self._jobs: dict[str, Job] = {}
+        self._queue: list[tuple[int, int, str]] = []
+        self._order = itertools.count()
+        self._in_use = 0
+        self._last_publish = 0.0
+        self._reserved: dict[str, int] = {}
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def submit(
+        self,
+        kind: str,
+        params: dict | None = None,
+        *,
+        priority: int = 0,
+        cost: int | None = None,
+        depends_on: str | None = None,
+    ) -> Job:
+        if kind not in self.runners:
+            raise ValueError(f"unknown job kind: {kind}")
+        job_cost = DEFAULT_COSTS.get(kind, 1) if cost is None else int(cost)
+        job = Job(
+            kind=kind,
+            params=dict(params or {}),
+            priority=int(priority),
+            # A job larger than the whole budget would never start; let it run alone instead.
+            cost=max(1, min(job_cost, self.budget)),
+            depends_on=depends_on,
+        )
+        with self._lock:
+            if depends_on is not None and depends_on not in self._jobs:
+                raise ValueError(f"unknown dependency: {depends_on}")
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (-job.priority, next(self._order), job.id))
+        self._event(f"Job queued: {kind}", job)
+        self._schedule()
+        self.publish(force=True)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[dict]:
+        # Snapshot under the lock: job threads update results through update_result.
+        with self._lock:
+            return [job.to_dict() for job in sorted(self._jobs.values(), key=lambda j: j.created_at)]
+
+    def reserve(self, name: str, cost: int):
+        """Charge work running outside the queue (the UI pipeline) against the budget."""
+        with self._lock:
+            if name not in self._reserved:
+                self._reserved[name] = max(1, min(int(cost), self.budget))
+                self._in_use += self._reserved[name]
+
+    def release(self, name: str):
+        with self._lock:
+            self._in_use -= self._reserved.pop(name, 0)
+        self._schedule()
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in {"queued", "running"}:
+                return False
+            job.cancel_event.set()
+            if job.status == "queued":
+                self._finish_locked(job, "cancelled")
+        self._event(f"Job cancel requested: {job.kind}", job, level="warning")
+        self._schedule()
+        self.publish(force=True)
+        return True
+
+    def progress(self, job: Job, value: int):
+        job.progress = max(0, min(100, int(value)))
+        self.publish()
+
+    def update_result(self, job: Job, patch: dict):
+        with self._lock:
+            job.result.update(patch)
+        self.publish()
+
+    def publish(self, *, force: bool = False):
+        if self._publish_cb is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_publish < PUBLISH_INTERVAL_SEC:
+            return
+        self._last_publish = now
+        self._publish_cb(self.list())
+
+    def _event(self, message: str, job: Job, *, level: str = "info"):
+        if self._event_cb is not None:
+            self._event_cb(message, level=level, details={"job": job.id, "kind": job.kind})
+
+    def _finish_locked(self, job: Job, status: str, error: str | None = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        # Keep finished jobs a live job still depends on: its input is their result.
+        needed = {j.depends_on for j in self._jobs.values() if j.status in {"queued", "running"}}
+        finished = [
+            j for j in self._jobs.values() if j.status in {"done", "error", "cancelled"} and j.id not in needed
+        ]
+        for stale in sorted(finished, key=lambda j: j.finished_at or 0)[:-KEEP_FINISHED]:
+            self._jobs.pop(stale.id, None)
+
+    def _schedule(self):
+        to_start = []
+        with self._lock:
+            deferred = []
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                job = self._jobs.get(entry[2])
+                if job is None or job.status != "queued":
+                    continue
+                dependency = self._jobs.get(job.depends_on) if job.depends_on else None
+                if dependency is not None and dependency.status in {"error", "cancelled"}:
+                    self._finish_locked(job, "error", f"dependency {dependency.id} {dependency.status}")
+                    continue
+                if dependency is not None and dependency.status != "done":
+                    deferred.append(entry)
+                    continue
+                if self._in_use + job.cost > self.budget:
+                    deferred.append(entry)
+                    continue
+                self._in_use += job.cost
+                job.status = "running"
+                job.started_at = time.time()
+                to_start.append(job)
+            for entry in deferred:
+                heapq.heappush(self._queue, entry)
+
+        for job in to_start:
+            self._event(f"Job started: {job.kind}", job)
+            Thread(target=self._run, args=(job,), name=f"job-{job.id}", daemon=True).start()
+        if to_start:
+            self.publish(force=True)
+
+    def dependency_result(self, job: Job) -> dict:
+        if not job.depends_on:
+            return {}
+        with self._lock:
+            dependency = self._jobs.get(job.depends_on)
+            return copy.deepcopy(dependency.result) if dependency is not None else {}
+
+    def _run(self, job: Job):
+        status, error = "done", None
+        try:
+            result = self.runners[job.kind](job, self)
+            if result:
+                with self._lock:
+                    job.result.update(result)
+            if job.cancelled():
+                status = "cancelled"
+        except CancelledError:
+            status = "cancelled"
+        except Exception as exc:
+            status, error = "error", str(exc)
+
+        with self._lock:
+            self._in_use -= job.cost
+            if status == "done":
+                job.progress = 100
+            self._finish_locked(job, status, error)
+        level = "error" if status == "error" else ("warning" if status == "cancelled" else "info")
+        self._event(f"Job {status}: {job.kind}" + (f": {error}" if error else ""), job, level=level)
+        self._schedule()
+        self.publish(force=True)
+        if self._on_finish is not None:
+            self._on_finish(job)
@@ -7,30 +7,47 @@ import time
 import multiprocessing as mp
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from threading import Lock, Thread
+from threading import Event, Lock, Thread
 from urllib.parse import unquote, urlparse
 
-import requests
 import subprocess
 from fastapi import FastAPI, File, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from app import downloader, growing, media_info, metrics, multipart_stream, request_log, storage, tracing, trim
+from app.blob_store import BlobStore
+from app.broadcast import StateBroadcaster, parse_cursor
+from app.ipc import FLUSH_INTERVAL_SEC as IPC_FLUSH_INTERVAL_SEC, SharedProgress, WorkerChannel
+from app.jobs import DEFAULT_COSTS as DEFAULT_JOB_COSTS, Job, JobScheduler
 from app.processing import (
     CancelledError,
     ProcessingError,
+    SAMPLING_MODES,
     ensure_playable_input,
+    opencv_can_decode,
+    probe_video_file,
+    queue_full_hash,
+    run_ffmpeg_conversion,
     run_protocol_analysis,
+    select_analysis_input,
     validate_video_file,
 )
 from app.state import (
     append_event,
+    append_events,
+    claim_job,
+    clear_events as clear_event_log,
+    get_events,
     get_state_version,
+    job_running_elsewhere,
     load_state,
+    make_event,
+    merge_state,
+    release_job,
     save_state,
     update_state,
-    wait_for_state_change,
 )
 
 try:
@@ -43,22 +60,33 @@ app = FastAPI()
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "input" / "videos"
 CONVERTED_DIR = BASE_DIR / "outputs" / "converted"
+PROXY_DIR = BASE_DIR / "outputs" / "proxy"
 PROTOCOL_DIR = BASE_DIR / "input" / "protocols"
 MODEL_PATH = BASE_DIR / "models" / "yolov8n.pt"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 CONVERTED_DIR.mkdir(parents=True, exist_ok=True)
 PROTOCOL_DIR.mkdir(parents=True, exist_ok=True)
 
+_blob_store = BlobStore(UPLOAD_DIR)
+_storage = storage.StorageManager(
+    {"videos": UPLOAD_DIR, "converted": CONVERTED_DIR, "proxy": PROXY_DIR},
+    BASE_DIR / "outputs" / "cache" / "access.json",
+    blob_store=_blob_store,
+)
+
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 MAX_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024
+UPLOAD_REPORT_BYTES = 20 * 1024 * 1024
 ACTIVE_PHASES = {"uploading", "downloading", "converting", "processing"}
 DEFAULT_SETTINGS = {
     "frame_interval_sec": 3,
     "conf_limit": 3,
     "session_timeout_sec": 240,
     "phantom_timeout_sec": 60,
+    "analysis_proxy": False,
+    "sampling": "exact",
 }
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -85,20 +113,37 @@ _process_queue: mp.Queue | None = None
 _process_cancel: mp.Event | None = None
 _process_listener: Thread | None = None
 
+RECONCILE_POLL_SEC = 2.0
+# State fields _reconcile_uncached checks; the cached result is valid while they are unchanged.
+RECONCILE_FIELDS = ("video", "converted", "protocol_csv", "phase", "processing")
+_reconcile_lock = Lock()
+_reconcile_key: tuple | None = None
+_fs_generation = 0
+# Whether another API worker holds the job lease, refreshed by the fs-watch poller.
+_lease_elsewhere = False
+_fs_watcher: Thread | None = None
+
 
 def _set_worker(thread: Thread):
     global _worker_thread
     with _worker_lock:
         _worker_thread = thread
+    # The UI pipeline shares the CPU budget with queued jobs.
+    _scheduler.reserve("transfer", DEFAULT_JOB_COSTS["download"])
 
 
 def _clear_worker():
     global _worker_thread
     with _worker_lock:
         _worker_thread = None
+    _scheduler.release("transfer")
+    # A streamed download shares the lease with the pipeline it started.
+    if not _process_active():
+        release_job()
+    _schedule_storage_sweep()
 
 
-def _worker_active() -> bool:
+def _local_worker_active() -> bool:
     with _worker_lock:
         thread_active = _worker_thread is not None and _worker_thread.is_alive()
     with _process_lock:
@@ -106,6 +151,10 @@ def _worker_active() -> bool:
     return thread_active or process_active
 
 
+def _worker_active() -> bool:
+    return _local_worker_active() or job_running_elsewhere()
+
+
 def _set_process_worker(
     process: mp.Process,
     queue: mp.Queue,
@@ -118,6 +167,7 @@ def _set_process_worker(
         _process_queue = queue
         _process_cancel = cancel_event
         _process_listener = listener
+    _scheduler.reserve("pipeline", DEFAULT_JOB_COSTS["analyse"])
 
 
 def _clear_process_worker():
@@ -127,6 +177,12 @@ def _clear_process_worker():
         _process_queue = None
         _process_cancel = None
         _process_listener = None
+    _scheduler.release("pipeline")
+    with _worker_lock:
+        transfer_active = _worker_thread is not None and _worker_thread.is_alive()
+    if not transfer_active:
+        release_job()
+    _schedule_storage_sweep()
 
 
 def _process_active() -> bool:
@@ -138,6 +194,43 @@ def _cancel_requested() -> bool:
     return bool(load_state().get("cancel_requested"))
 
 
+def _storage_protected() -> set[str]:
+    """File names the state or a queued/running job (or its dependency) still points at."""
+    state = load_state()
+    names = {state.get("video"), state.get("converted")}
+    jobs = {job["id"]: job for job in (state.get("jobs") or {}).values()}
+    jobs.update({job["id"]: job for job in _scheduler.list()})
+    for job in jobs.values():
+        if job.get("status") not in {"queued", "running"}:
+            continue
+        dependency = jobs.get(job.get("depends_on")) or {}
+        for source in (job.get("params") or {}, job.get("result") or {}, dependency.get("result") or {}):
+            names.update((source.get("video"), source.get("converted")))
+            if source.get("path"):
+                names.add(Path(source["path"]).name)
+    names.discard(None)
+    names.discard("")
+    return names
+
+
+def _sweep_storage() -> list[dict]:
+    evicted = _storage.sweep(_storage_protected())
+    if evicted:
+        freed = sum(item["bytes"] for item in evicted)
+        append_event(
+            f"Storage over budget: evicted {len(evicted)} file(s), {freed // (1024 * 1024)} MB",
+            event_type="process",
+            level="warning",
+            details={"files": [name for item in evicted for name in item["files"]]},
+        )
+    return evicted
+
+
+def _schedule_storage_sweep(*_args):
+    if _storage.budget:
+        Thread(target=_sweep_storage, daemon=True).start()
+
+
 def _safe_name(raw_name: str | None, fallback: str) -> str:
     cleaned = Path(unquote(raw_name or "")).name.strip()
     return cleaned or fallback
@@ -185,12 +278,65 @@ def _reset_state(*, clear_events: bool = False):
         "timestamps": [],
         "settings": dict(DEFAULT_SETTINGS),
     })
-    if clear_events:
-        state["events"] = []
     save_state(state)
+    if clear_events:
+        clear_event_log()
+
+
+def _runtime_dirs_signature() -> tuple:
+    signature = []
+    for directory in (UPLOAD_DIR, CONVERTED_DIR, PROTOCOL_DIR):
+        try:
+            signature.append(directory.stat().st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _watch_runtime_dirs():
+    # Creating, deleting or renaming an entry bumps the directory mtime, which is
+    # all the reconcile step cares about; polling keeps stats and the lease query
+    # off the request path.
+    global _fs_generation, _lease_elsewhere
+    signature = _runtime_dirs_signature()
+    while True:
+        time.sleep(RECONCILE_POLL_SEC)
+        _lease_elsewhere = job_running_elsewhere()
+        current = _runtime_dirs_signature()
+        if current != signature:
+            signature = current
+            _fs_generation += 1
+
+
+def _ensure_fs_watcher():
+    global _fs_watcher, _lease_elsewhere
+    with _reconcile_lock:
+        if _fs_watcher is None:
+            _lease_elsewhere = job_running_elsewhere()
+            _fs_watcher = Thread(target=_watch_runtime_dirs, name="fs-watch", daemon=True)
+            _fs_watcher.start()
 
 
 def _reconcile_runtime_state() -> dict:
+    global _reconcile_key
+    _ensure_fs_watcher()
+    worker_active = _local_worker_active() or _lease_elsewhere
+    state = load_state()
+    # Only what the reconcile step looks at: progress ticks and events leave the key alone.
+    key = (_reconcile_fields(state), _fs_generation, worker_active)
+    if key == _reconcile_key:
+        return state
+
+    state = _reconcile_uncached(worker_active)
+    _reconcile_key = (_reconcile_fields(state), key[1], worker_active)
+    return state
+
+
+def _reconcile_fields(state: dict) -> tuple:
+    return tuple(state.get(field) for field in RECONCILE_FIELDS)
+
+
+def _reconcile_uncached(worker_active: bool) -> dict:
     state = load_state()
     changed = False
 
@@ -200,7 +346,6 @@ def _reconcile_runtime_state() -> dict:
         changed = True
 
     processing = bool(state.get("processing"))
-    worker_active = _worker_active()
     active_phase = phase in ACTIVE_PHASES
 
     # Clear restored file pointers if files no longer exist after restart.
@@ -229,7 +374,8 @@ def _reconcile_runtime_state() -> dict:
             state["protocol_csv"] = None
             changed = True
 
-    if (active_phase or processing) and not worker_active:
+    # The polled lease may lag a job another worker just started: confirm before resetting.
+    if (active_phase or processing) and not worker_active and not job_running_elsewhere():
         state["processing"] = False
         state["cancel_requested"] = False
         state["phase"] = "idle"
@@ -255,53 +401,79 @@ def _processing_worker_process(
     settings: dict,
     queue: mp.Queue,
     cancel_event: mp.Event,
+    shared: SharedProgress,
+    trace: bool = False,
 ):
-    def send_patch(patch: dict):
-        queue.put({"type": "patch", "data": patch})
+    if trace:
+        tracing.start(f"pipeline {Path(source_path_str).name}")
 
-    def send_event(message: str, *, event_type: str = "process", level: str = "info", details: dict | None = None):
-        payload = {"type": "event", "message": message, "event_type": event_type, "level": level}
-        if details:
-            payload["details"] = details
-        queue.put(payload)
+    channel = WorkerChannel(queue, shared)
+    send_patch = channel.patch
+    send_event = channel.event
 
+    pipeline_started = time.perf_counter()
+    result = "error"
     try:
         source_path = Path(source_path_str)
         protocol_path = Path(protocol_path_str)
         model_path = Path(model_path_str)
 
-        analysis_path, was_converted = ensure_playable_input(
-            source_path,
-            CONVERTED_DIR,
-            check_cancel=cancel_event.is_set,
-            progress_cb=lambda p: send_patch({"phase": "converting", "progress": p}),
-            event_cb=lambda msg: send_event(msg),
-        )
-
-        if cancel_event.is_set():
-            raise CancelledError("cancelled after conversion")
+        def _analyse(video_path: Path) -> dict:
+            with metrics.stage("analysis"):
+                return run_protocol_analysis(
+                    video_path,
+                    protocol_path,
+                    model_path,
+                    settings=settings,
+                    partial_cb=lambda patch: send_patch(patch),
+                    check_cancel=cancel_event.is_set,
+                    progress_cb=channel.progress,
+                    frame_cb=channel.frame,
+                    event_cb=lambda msg: send_event(msg),
+                )
 
-        converted_bytes = analysis_path.stat().st_size if was_converted else None
-        send_patch({
-            "phase": "converted",
-            "progress": 100,
-            "phase_started_at": time.time(),
-            "converted": analysis_path.name if was_converted else None,
-            "converted_bytes": converted_bytes,
-        })
+        if growing.is_growing(source_path) or opencv_can_decode(source_path):
+            analysis, analysis_path, was_converted = _analyse_during_conversion(
+                source_path, settings, channel, cancel_event, _analyse
+            )
+            converted_bytes = analysis_path.stat().st_size if was_converted else None
+        else:
+            with tracing.span("conversion", cat="convert"):
+                analysis_path, was_converted = ensure_playable_input(
+                    source_path,
+                    CONVERTED_DIR,
+                    check_cancel=cancel_event.is_set,
+                    progress_cb=channel.progress,
+                    event_cb=lambda msg: send_event(msg),
+                )
 
-        send_patch({"phase": "processing", "progress": 0, "phase_started_at": time.time()})
+            if cancel_event.is_set():
+                raise CancelledError("cancelled after conversion")
+
+            converted_bytes = analysis_path.stat().st_size if was_converted else None
+            send_patch({
+                "phase": "converted",
+                "progress": 100,
+                "phase_started_at": time.time(),
+                "converted": analysis_path.name if was_converted else None,
+                "converted_bytes": converted_bytes,
+            })
+
+            with tracing.span("analysis proxy", cat="convert"):
+                analysis_input = select_analysis_input(
+                    source_path,
+                    analysis_path,
+                    PROXY_DIR,
+                    settings,
+                    check_cancel=cancel_event.is_set,
+                    progress_cb=channel.progress,
+                    event_cb=lambda msg: send_event(msg),
+                )
+            if cancel_event.is_set():
+                raise CancelledError("cancelled after proxy")
 
-        analysis = run_protocol_analysis(
-            analysis_path,
-            protocol_path,
-            model_path,
-            settings=settings,
-            partial_cb=lambda patch: send_patch(patch),
-            check_cancel=cancel_event.is_set,
-            progress_cb=lambda p: send_patch({"progress": p}),
-            event_cb=lambda msg: send_event(msg),
-        )
+            send_patch({"phase": "processing", "progress": 0, "phase_started_at": time.time()})
+            analysis = _analyse(analysis_input)
 
         if cancel_event.is_set():
             raise CancelledError("cancelled before finishing")
@@ -312,11 +484,14 @@ def _processing_worker_process(
             "phase_started_at": time.time(),
             "processing": False,
             "cancel_requested": False,
+            "converted": analysis_path.name if was_converted else None,
             "converted_bytes": converted_bytes,
             **analysis,
         })
         send_event("Pipeline done", event_type="process")
+        result = "done"
     except CancelledError:
+        result = "cancelled"
         send_patch({
             "phase": "idle",
             "progress": 0,
@@ -350,35 +525,170 @@ def _processing_worker_process(
         })
         send_event(f"Pipeline failed: {exc}", event_type="process", level="error")
     finally:
-        queue.put({"type": "final"})
+        metrics.observe_stage("pipeline", time.perf_counter() - pipeline_started)
+        metrics.inc("climbtag_jobs_total", result=result)
+        channel.send({"type": "metrics", "data": metrics.snapshot()})
+        if trace:
+            trace_path = LOG_DIR / f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{Path(source_path_str).stem}.json"
+            try:
+                tracing.stop(trace_path)
+                send_event("Pipeline trace written", event_type="process", details={"file": trace_path.name})
+            except OSError as exc:
+                send_event(f"Pipeline trace failed: {exc}", event_type="process", level="warning")
+        channel.send({"type": "final"})
 
 
-def _start_process_listener(queue: mp.Queue, process: mp.Process) -> Thread:
-    def _listener():
-        while True:
-            try:
-                message = queue.get(timeout=0.5)
-            except Exception:
-                if not process.is_alive():
-                    break
-                continue
-
-            if not isinstance(message, dict):
-                continue
-
-            msg_type = message.get("type")
-            if msg_type == "patch":
-                update_state(message.get("data", {}))
-            elif msg_type == "event":
-                append_event(
-                    message.get("message", ""),
-                    event_type=message.get("event_type", "process"),
-                    level=message.get("level", "info"),
-                    details=message.get("details"),
+def _analyse_during_conversion(source_path: Path, settings: dict, channel: WorkerChannel, cancel_event, analyse):
+    """Convert for playback in a thread while the source itself is analysed.
+
+    Used when OpenCV decodes the source directly or the source is still arriving:
+    the analysis no longer waits for the transcode (or the transfer), and the
+    conversion percent is reported separately through the shared ``convert`` value.
+    A failed conversion does not discard the analysis; the source is kept for playback.
+    Returns (analysis, playable path, was_converted).
+    """
+    stop = Event()
+    outcome: dict = {}
+
+    def _is_stopped() -> bool:
+        return cancel_event.is_set() or stop.is_set()
+
+    def _convert():
+        try:
+            growing.wait_complete(source_path, check_cancel=_is_stopped)
+            with tracing.span("conversion", cat="convert"):
+                outcome["result"] = ensure_playable_input(
+                    source_path,
+                    CONVERTED_DIR,
+                    check_cancel=_is_stopped,
+                    progress_cb=channel.convert_progress,
+                    event_cb=lambda msg: channel.event(msg),
                 )
-            elif msg_type == "final":
+        except BaseException as exc:  # re-raised in the worker after join
+            outcome["error"] = exc
+
+    channel.convert_progress(0)
+    channel.patch({"phase": "processing", "progress": 0, "phase_started_at": time.time()})
+    channel.event("Analysing the source while converting it for playback")
+    converter = Thread(target=_convert, name="convert", daemon=True)
+    converter.start()
+    try:
+        if growing.is_growing(source_path):
+            analysis_input = source_path  # a proxy needs the whole file
+        else:
+            with tracing.span("analysis proxy", cat="convert"):
+                analysis_input = select_analysis_input(
+                    source_path,
+                    source_path,
+                    PROXY_DIR,
+                    settings,
+                    check_cancel=cancel_event.is_set,
+                    progress_cb=lambda _p: None,
+                    event_cb=lambda msg: channel.event(msg),
+                )
+        if cancel_event.is_set():
+            raise CancelledError("cancelled after proxy")
+        analysis = analyse(analysis_input)
+        if cancel_event.is_set():
+            raise CancelledError("cancelled before finishing")
+        if converter.is_alive():
+            channel.event("Analysis done, waiting for playback conversion")
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        converter.join()
+        channel.convert_progress(None)
+
+    error = outcome.get("error")
+    if isinstance(error, (CancelledError, InterruptedError)) or cancel_event.is_set():
+        raise CancelledError("cancelled during conversion")
+    if error is not None:
+        # The analysis is complete and valid on its own: keep it, play the source as is.
+        channel.event(f"Playback conversion failed, analysis results kept: {error}", level="warning")
+        return analysis, source_path, False
+    analysis_path, was_converted = outcome["result"]
+    return analysis, analysis_path, was_converted
+
+
+def _pump_worker_queue(
+    queue: mp.Queue,
+    process: mp.Process,
+    shared: SharedProgress,
+    cancel_event: mp.Event,
+    *,
+    apply_patch=update_state,
+    apply_events=append_events,
+    should_cancel=_cancel_requested,
+):
+    """Forward worker-process messages to the given sinks until the worker finishes."""
+    last_progress, last_frames = shared.read()
+    last_convert = shared.read_convert()
+    last_poll = 0.0
+    while True:
+        try:
+            message = queue.get(timeout=IPC_FLUSH_INTERVAL_SEC)
+        except Exception:
+            message = None
+            if not process.is_alive():
                 break
 
+        now = time.monotonic()
+        if now - last_poll >= IPC_FLUSH_INTERVAL_SEC:
+            last_poll = now
+            # Cancellation may have been requested through another API worker.
+            if not cancel_event.is_set() and should_cancel():
+                cancel_event.set()
+            progress, frames = shared.read()
+            if (progress, frames) != (last_progress, last_frames):
+                last_progress, last_frames = progress, frames
+                apply_patch({"progress": progress, "analysis_frames": frames})
+            convert = shared.read_convert()
+            if convert != last_convert:
+                last_convert = convert
+                apply_patch({"convert_progress": convert})
+
+        if not isinstance(message, dict):
+            continue
+
+        msg_type = message.get("type")
+        if msg_type == "batch":
+            patch = message.get("patch") or {}
+            if patch:
+                if "progress" in patch:
+                    last_progress = int(patch["progress"])
+                apply_patch(patch)
+            events = message.get("events") or []
+            if events:
+                apply_events([
+                    make_event(
+                        item.get("message", ""),
+                        event_type=item.get("event_type", "process"),
+                        level=item.get("level", "info"),
+                        details=item.get("details"),
+                    )
+                    for item in events
+                ])
+        elif msg_type == "metrics":
+            data = message.get("data") or {}
+            metrics.merge(data)
+            append_event(
+                "Pipeline metrics",
+                event_type="metrics",
+                details=metrics.summarize(data),
+            )
+        elif msg_type == "final":
+            break
+
+
+def _start_process_listener(
+    queue: mp.Queue,
+    process: mp.Process,
+    shared: SharedProgress,
+    cancel_event: mp.Event,
+) -> Thread:
+    def _listener():
+        _pump_worker_queue(queue, process, shared, cancel_event)
         _clear_process_worker()
 
     listener = Thread(target=_listener, daemon=True)
@@ -386,25 +696,77 @@ def _start_process_listener(queue: mp.Queue, process: mp.Process) -> Thread:
     return listener
 
 
-def _download_with_ytdlp(url: str, *, start_time: int | None = None, end_time: int | None = None) -> Path:
+def _state_progress(value: int):
+    update_state({"progress": value})
+
+
+def _latched_cancel(check_cancel, interval_sec: float = downloader.CANCEL_POLL_SEC):
+    """``check_cancel`` polled at most every ``interval_sec``; once it fires, the answer sticks."""
+    cancelled = Event()
+    last_poll = 0.0
+    lock = Lock()
+
+    def _check() -> bool:
+        nonlocal last_poll
+        if cancelled.is_set():
+            return True
+        now = time.monotonic()
+        with lock:
+            if now - last_poll < interval_sec:
+                return False
+            last_poll = now
+        if check_cancel():
+            cancelled.set()
+        return cancelled.is_set()
+
+    return _check
+
+
+def _download_with_ytdlp(
+    url: str,
+    *,
+    start_time: int | None = None,
+    end_time: int | None = None,
+    progress_cb=_state_progress,
+    check_cancel=_cancel_requested,
+    on_start=None,
+    trim_mode: str = "copy",
+) -> Path:
     if yt_dlp is None:
         raise RuntimeError("yt-dlp is not installed")
 
     append_event("Downloader selected: yt-dlp", event_type="process", details={"url": url})
 
     output_template = str(UPLOAD_DIR / "%(id)s.%(ext)s")
+    followed: list[Path] = []
+    # Fragment threads call the hook concurrently and often: cancel and progress are rate-limited.
+    cancelled = _latched_cancel(check_cancel)
+    hook_lock = Lock()
+    last_report = [0.0, -1]
 
     def hook(data: dict):
-        if _cancel_requested():
+        if cancelled():
             raise CancelledError("download cancelled")
 
         if data.get("status") != "downloading":
             return
 
-        total = data.get("total_bytes") or data.get("total_bytes_estimate") or 0
-        downloaded = data.get("downloaded_bytes") or 0
-        if total:
-            update_state({"progress": int((downloaded * 100) / total)})
+        with hook_lock:
+            if on_start is not None and not followed and data.get("filename"):
+                path = Path(data["filename"]).resolve()
+                if path.parent == UPLOAD_DIR.resolve() and path.exists():
+                    followed.append(path)
+                    growing.begin(path, data.get("total_bytes") or None)
+                    on_start(path)
+
+            total = data.get("total_bytes") or data.get("total_bytes_estimate") or 0
+            downloaded = data.get("downloaded_bytes") or 0
+            now = time.monotonic()
+            if total and now - last_report[0] >= downloader.PROGRESS_INTERVAL_SEC:
+                percent = min(100, int((downloaded * 100) / total))
+                if percent != last_report[1]:
+                    last_report[:] = [now, percent]
+                    progress_cb(percent)
 
     opts = {
         "format": "best[ext=mp4][height<=720]/best[ext=mp4]/best",
@@ -415,25 +777,29 @@ def _download_with_ytdlp(url: str, *, start_time: int | None = None, end_time: i
         "no_warnings": True,
         "overwrites": True,
         "restrictfilenames": True,
+        # Streaming analysis follows the final file, so write it in place instead of a .part file.
+        "nopart": on_start is not None,
+        # HLS/DASH fragments are fetched in parallel and still appended in order.
+        "concurrent_fragment_downloads": downloader.configured_connections(),
+        "http_chunk_size": 10 * 1024 * 1024,
     }
 
     if start_time is not None and end_time is not None and end_time > start_time:
-        opts["external_downloader"] = "ffmpeg"
-        opts["external_downloader_args"] = {
-            "ffmpeg_i": [
-                "-ss", str(start_time),
-                "-to", str(end_time),
-            ]
-        }
-        opts["download_sections"] = [{
-            "start_time": start_time,
-            "end_time": end_time,
-        }]
-        opts["force_keyframes_at_cuts"] = True
-
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        file_path = Path(ydl.prepare_filename(info)).resolve()
+        # Only the fragments covering the section are fetched; "copy" keeps the keyframe-aligned
+        # cut, the other trim modes re-encode so the section starts exactly at start_time.
+        opts["download_ranges"] = yt_dlp.utils.download_range_func(None, [(start_time, end_time)])
+        opts["force_keyframes_at_cuts"] = trim_mode != "copy"
+
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            file_path = Path(ydl.prepare_filename(info)).resolve()
+    except BaseException:
+        for path in followed:
+            growing.finish(path, failed=True)
+        raise
+    for path in followed:
+        growing.finish(path)
 
     if file_path.parent != UPLOAD_DIR.resolve() or not file_path.exists():
         raise RuntimeError("yt-dlp did not produce a local file")
@@ -442,7 +808,14 @@ def _download_with_ytdlp(url: str, *, start_time: int | None = None, end_time: i
     return file_path
 
 
-def _download_direct(url: str) -> Path:
+def _download_direct(
+    url: str,
+    *,
+    progress_cb=_state_progress,
+    check_cancel=_cancel_requested,
+    on_start=None,
+    on_digest=None,
+) -> Path:
     parsed = urlparse(url)
     fallback_name = f"download-{int(time.time())}.mp4"
     local_name = _safe_name(parsed.path, fallback_name)
@@ -455,34 +828,54 @@ def _download_direct(url: str) -> Path:
 
     append_event("Downloader selected: direct HTTP", event_type="process", details={"file": local_name})
 
-    with requests.get(url, stream=True, timeout=30) as response:
-        response.raise_for_status()
-        content_type = (response.headers.get("content-type") or "").lower()
+    def validate(headers):
+        content_type = (headers.get("content-type") or "").lower()
         if content_type.startswith("text/") or "html" in content_type:
             raise RuntimeError(f"downloaded content is not video (content-type: {content_type})")
-        total = int(response.headers.get("content-length", 0))
-        downloaded = 0
-
-        with file_path.open("wb") as out:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if not chunk:
-                    continue
-                if _cancel_requested():
-                    _safe_unlink(file_path)
-                    raise CancelledError("download cancelled")
-
-                out.write(chunk)
-                downloaded += len(chunk)
-                if total > 0:
-                    update_state({"progress": int((downloaded * 100) / total)})
+
+    # A followed download must grow front to back, so it uses one connection and the final name;
+    # otherwise parts land out of order in a .part file that a cancelled run can resume.
+    target = file_path if on_start is not None else file_path.with_name(file_path.name + ".part")
+    opened: list[Path] = []
+
+    def on_open(total: int | None):
+        if on_start is not None:
+            opened.append(target)
+            growing.begin(target, total)
+            on_start(target)
+
+    try:
+        downloader.download(
+            url,
+            target,
+            connections=1 if on_start is not None else None,
+            progress_cb=progress_cb,
+            check_cancel=check_cancel,
+            validate_headers=validate,
+            on_open=on_open,
+            on_digest=on_digest,
+        )
+    except downloader.DownloadCancelled:
+        for path in opened:
+            growing.finish(path, failed=True)
+        raise CancelledError("download cancelled")
+    except BaseException:
+        for path in opened:
+            growing.finish(path, failed=True)
+        raise
+    for path in opened:
+        growing.finish(path)
+    if target != file_path:
+        target.replace(file_path)
 
     if not file_path.exists() or file_path.stat().st_size == 0:
         raise RuntimeError("downloaded file is empty")
     try:
         with file_path.open("rb") as fh:
             head = fh.read(512).lstrip().lower()
-            if head.startswith(b"<!doctype") or head.startswith(b"<html"):
-                raise RuntimeError("downloaded content is HTML, not video")
+        if head.startswith(b"<!doctype") or head.startswith(b"<html"):
+            _safe_unlink(file_path)
+            raise RuntimeError("downloaded content is HTML, not video")
     except OSError:
         pass
 
@@ -496,13 +889,54 @@ def _trim_video(
     start_time: int,
     end_time: int,
     check_cancel,
+    mode: str = "copy",
 ) -> Path:
+    """Cut [start_time, end_time) out of a download.
+
+    "copy" stream-copies from the keyframe before start_time, "smart" re-encodes only
+    the partial GOPs at both ends; both fall back to a full re-encode if they fail.
+    """
     if end_time <= start_time:
         raise RuntimeError("invalid trim range")
 
     output_dir.mkdir(parents=True, exist_ok=True)
     target_path = (output_dir / f"{source_path.stem}_trim_{start_time}_{end_time}.mp4").resolve()
 
+    if mode in ("copy", "smart"):
+        try:
+            keyframes = media_info.keyframes(source_path)
+            info = media_info.probe(source_path)
+        except RuntimeError as exc:
+            keyframes, info = [], {}
+            append_event(f"Keyframe index unavailable, trimming by re-encode: {exc}", event_type="process", level="warning")
+        try:
+            if keyframes and mode == "smart":
+                if trim.trim_smart(
+                    source_path,
+                    target_path,
+                    start_time,
+                    end_time,
+                    keyframes,
+                    info,
+                    check_cancel=check_cancel,
+                    work_dir=output_dir / f".{target_path.stem}.parts",
+                ):
+                    append_event("Trim: smart cut, only boundary GOPs re-encoded", event_type="process")
+                    return target_path
+                append_event("Smart cut not possible, trying keyframe copy", event_type="process", level="warning")
+            if keyframes and trim.trim_copy(source_path, target_path, start_time, end_time, keyframes, check_cancel=check_cancel):
+                append_event(
+                    "Trim: stream copy from keyframe",
+                    event_type="process",
+                    details={"start": trim.copy_start(keyframes, start_time)},
+                )
+                return target_path
+        except InterruptedError as exc:
+            target_path.unlink(missing_ok=True)
+            raise CancelledError(str(exc)) from exc
+        if keyframes:
+            append_event("Stream-copy trim failed, re-encoding", event_type="process", level="warning")
+
     cmd = [
         "ffmpeg",
         "-y",
@@ -550,40 +984,15 @@ def _trim_video(
 def _remux_to_mp4(source_path: Path, output_dir: Path, *, check_cancel) -> Path:
     output_dir.mkdir(parents=True, exist_ok=True)
     target_path = (output_dir / f"{source_path.stem}_remux.mp4").resolve()
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        str(source_path),
-        "-c",
+    if not run_ffmpeg_conversion(
+        source_path,
+        target_path,
         "copy",
-        "-movflags",
-        "+faststart",
-        str(target_path),
-    ]
-
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-
-    try:
-        if proc.stderr is not None:
-            for _ in proc.stderr:
-                if check_cancel():
-                    proc.kill()
-                    raise CancelledError("remux cancelled")
-    finally:
-        proc.wait()
-
-    if proc.returncode != 0 or not target_path.exists():
+        duration=0,
+        check_cancel=check_cancel,
+        progress_cb=lambda _p: None,
+    ):
         raise RuntimeError("remux failed")
-
     return target_path
 
 
@@ -591,13 +1000,13 @@ def _remux_to_mp4(source_path: Path, output_dir: Path, *, check_cancel) -> Path:
 async def log_requests(request: Request, call_next):
     path = request.url.path
     skip_prefixes = ("/static",)
-    should_log = path not in {"/state", "/health"} and not path.startswith(skip_prefixes)
+    should_log = path not in {"/state", "/health", "/metrics", "/events"} and not path.startswith(skip_prefixes)
+    sampled = should_log and request_log.should_log(path)
 
     started_at = time.perf_counter()
-    if should_log:
-        append_event(
+    if sampled:
+        request_log.submit(
             f"{request.method} {path} started",
-            event_type="request",
             details={"query": str(request.url.query)}
         )
 
@@ -606,20 +1015,15 @@ async def log_requests(request: Request, call_next):
     except Exception as exc:
         _server_logger.exception("%s %s failed", request.method, path)
         if should_log:
-            append_event(
-                f"{request.method} {path} failed: {exc}",
-                event_type="request",
-                level="error",
-            )
+            request_log.submit(f"{request.method} {path} failed: {exc}", level="error")
         raise
 
-    if should_log:
+    if sampled:
         elapsed_ms = int((time.perf_counter() - started_at) * 1000)
-        _server_logger.info("%s %s -> %s in %dms", request.method, path, response.status_code, elapsed_ms)
-        append_event(
+        request_log.submit(
             f"{request.method} {path} -> {response.status_code}",
-            event_type="request",
-            details={"elapsed_ms": elapsed_ms}
+            details={"elapsed_ms": elapsed_ms},
+            server_line=f"{request.method} {path} -> {response.status_code} in {elapsed_ms}ms",
         )
 
     return response
@@ -635,11 +1039,49 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/storage")
+async def get_storage():
+    return await asyncio.to_thread(_storage.usage)
+
+
+@app.post("/storage/sweep")
+async def sweep_storage():
+    if not _storage.budget:
+        return JSONResponse({"error": f"no storage budget configured ({storage.BUDGET_ENV})"}, status_code=409)
+    evicted = await asyncio.to_thread(_sweep_storage)
+    return {"evicted": evicted, **(await asyncio.to_thread(_storage.usage))}
+
+
+@app.get("/traces")
+async def list_traces():
+    files = sorted(LOG_DIR.glob("trace-*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return {"traces": [{"file": p.name, "bytes": p.stat().st_size} for p in files]}
+
+
+@app.get("/traces/{filename}")
+async def get_trace(filename: str):
+    file_path = (LOG_DIR / filename).resolve()
+    if (
+        file_path.parent != LOG_DIR.resolve()
+        or not file_path.name.startswith("trace-")
+        or file_path.suffix != ".json"
+        or not file_path.exists()
+    ):
+        raise HTTPException(status_code=404, detail="trace not found")
+    return FileResponse(path=file_path, media_type="application/json", filename=file_path.name)
+
+
 @app.get("/video/{filename}")
 async def get_video(filename: str):
     file_path = (UPLOAD_DIR / filename).resolve()
     if file_path.parent != UPLOAD_DIR.resolve() or not file_path.exists():
         raise HTTPException(status_code=404, detail="video not found")
+    _storage.touch(file_path)
     return FileResponse(path=file_path)
 
 
@@ -648,6 +1090,7 @@ async def get_converted_video(filename: str):
     file_path = (CONVERTED_DIR / filename).resolve()
     if file_path.parent != CONVERTED_DIR.resolve() or not file_path.exists():
         raise HTTPException(status_code=404, detail="converted video not found")
+    _storage.touch(file_path)
     return FileResponse(path=file_path)
 
 
@@ -667,26 +1110,18 @@ async def get_state_probe():
     }
 
 
+_broadcaster = StateBroadcaster(reconcile=_reconcile_runtime_state)
+
+
 @app.get("/state/stream")
-async def state_stream(request: Request):
-    async def _events():
-        state = _reconcile_runtime_state()
-        last_version = get_state_version()
-        yield f"event: state\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
-
-        while True:
-            if await request.is_disconnected():
-                break
-            next_version = await asyncio.to_thread(wait_for_state_change, last_version, 20.0)
-            if next_version <= last_version:
-                yield "event: ping\ndata: {}\n\n"
-                continue
-            state = _reconcile_runtime_state()
-            last_version = get_state_version()
-            yield f"event: state\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+async def state_stream(request: Request, last_event_id: str | None = None, after: int | None = None):
+    # EventSource sends Last-Event-ID on its own reconnects; the UI recreates the
+    # source manually and passes the cursor as a query parameter instead.
+    resume_version = parse_cursor(request.headers.get("last-event-id") or last_event_id)
+    subscriber, initial = _broadcaster.subscribe(resume_version, after or 0)
 
     return StreamingResponse(
-        _events(),
+        _broadcaster.stream(subscriber, initial),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -696,6 +1131,11 @@ async def state_stream(request: Request):
     )
 
 
+@app.get("/events")
+async def list_events(after: int = 0, limit: int | None = None):
+    return get_events(after, limit)
+
+
 @app.post("/state")
 async def patch_state(payload: dict):
     allowed = {"results_text", "ui", "playback"}
@@ -732,65 +1172,129 @@ async def reset_state(payload: dict | None = None):
     return {"status": "ok"}
 
 
-@app.post("/upload")
-async def upload_video(file: UploadFile = File(...)):
-    file_name = _safe_name(file.filename, "upload.bin")
-    file_path = UPLOAD_DIR / file_name
+def _start_upload_stream(writer, file_name: str, raw_settings: str | None, expected: int | None) -> Path | None:
+    """Expose the upload being written and launch the pipeline on it, if a protocol is ready."""
+    protocol_path = _stream_protocol()
+    if protocol_path is None:
+        append_event("Streaming analysis skipped: upload a protocol CSV first", event_type="process", level="warning")
+        return None
+    if _worker_active() or not claim_job("process"):
+        append_event("Streaming analysis skipped: another process is running", event_type="process", level="warning")
+        return None
+    try:
+        stream_settings = _parse_settings({"settings": json.loads(raw_settings or "{}")})
+    except (json.JSONDecodeError, AttributeError):
+        stream_settings = _parse_settings(None)
+    streamed = _blob_store.expose(writer, file_name)
+    growing.begin(streamed, expected)
+    _stream_starter(protocol_path, stream_settings)(streamed)
+    return streamed
 
-    update_state({
-        "phase": "uploading",
-        "progress": 0,
-        "phase_started_at": time.time(),
-        "processing": True,
-        "cancel_requested": False,
-    })
-    append_event("Upload started", event_type="process", details={"file": file_name})
 
-    total_read = 0
+@app.post("/upload")
+async def upload_video(request: Request, analyse: bool = False, size: int | None = None):
+    """Multipart upload with a ``file`` part, read from the socket as it arrives (not spooled first).
+
+    With ``analyse=1`` the pipeline starts on the growing file; its ``settings`` field must
+    precede the file part. ``size`` is the file's byte count (the request Content-Length
+    also counts the multipart envelope).
+    """
+    expected = size if size and size > 0 else None
+    fields: dict[str, str] = {}
+    writer = None
+    file_name = None
+    receiving = False
+    streamed: Path | None = None
+    next_report = UPLOAD_REPORT_BYTES
+
+    def _drop_stream():
+        if streamed is not None:
+            growing.finish(streamed, failed=True)
+
+    def _fail(message: str):
+        if writer is not None:
+            writer.discard()
+        _drop_stream()
+        update_state({"phase": "error", "processing": False, "progress": 0, "phase_started_at": time.time()})
+        append_event(message, event_type="process", level="error")
+
     try:
-        with file_path.open("wb") as out:
-            while chunk := await file.read(1024 * 1024):
-                total_read += len(chunk)
-                if total_read > MAX_UPLOAD_BYTES:
-                    out.close()
-                    _safe_unlink(file_path)
-                    update_state({
-                        "phase": "error",
-                        "processing": False,
-                        "progress": 0,
-                        "phase_started_at": time.time(),
-                    })
-                    append_event(
-                        "Upload rejected: file exceeds 2GB",
-                        event_type="process",
-                        level="error",
-                    )
+        form = multipart_stream.iter_form(request.stream(), request.headers.get("content-type", ""))
+        async for kind, name, data in form:
+            if kind == "field":
+                fields[name] = data
+            elif kind == "file" and name == "file" and writer is None:
+                # Dot-names would collide with the object store (.objects) inside UPLOAD_DIR.
+                file_name = _safe_name(data, "upload.bin").lstrip(".") or "upload.bin"
+                update_state({
+                    "phase": "uploading",
+                    "progress": 0,
+                    "phase_started_at": time.time(),
+                    "processing": True,
+                    "cancel_requested": False,
+                })
+                append_event("Upload started", event_type="process", details={"file": file_name})
+                writer = _blob_store.writer()
+                receiving = True
+                if analyse:
+                    streamed = _start_upload_stream(writer, file_name, fields.get("settings"), expected)
+            elif kind == "data" and receiving:
+                if writer.size + len(data) > MAX_UPLOAD_BYTES:
+                    _fail("Upload rejected: file exceeds 2GB")
                     return JSONResponse({"error": "file too large"}, status_code=413)
-
-                out.write(chunk)
-                if total_read % (20 * 1024 * 1024) == 0:
-                    append_event(
-                        f"Upload progress: {total_read // (1024 * 1024)} MB",
-                        event_type="process"
-                    )
+                writer.write(data)
+                if writer.size >= next_report:
+                    next_report += UPLOAD_REPORT_BYTES
+                    append_event(f"Upload progress: {writer.size // (1024 * 1024)} MB", event_type="process")
+                    if streamed is not None and expected:
+                        update_state({"transfer_progress": min(99, writer.size * 100 // expected)})
+            elif kind == "file_end" and receiving:
+                receiving = False
+                writer.close()
+        if writer is None:
+            return JSONResponse({"error": "no file in upload"}, status_code=400)
+        if receiving:
+            raise multipart_stream.MultipartError("upload body ended inside the file part")
     except Exception as exc:
-        update_state({"phase": "error", "processing": False, "progress": 0, "phase_started_at": time.time()})
-        append_event(f"Upload failed: {exc}", event_type="process", level="error")
+        if writer is None:
+            return JSONResponse({"error": f"invalid upload: {exc}"}, status_code=400)
+        _fail(f"Upload failed: {exc}")
         return JSONResponse({"error": "upload failed"}, status_code=500)
 
-    try:
-        validate_video_file(file_path)
-    except ProcessingError as exc:
-        _safe_unlink(file_path)
-        patch = {"phase": "error", "processing": False, "progress": 0, "phase_started_at": time.time()}
-        if load_state().get("video") == file_name:
-            patch["video"] = None
-            patch["converted"] = None
-            patch["video_bytes"] = None
-            patch["converted_bytes"] = None
-        update_state(patch)
-        append_event(f"Upload failed: {exc}", event_type="process", level="error")
-        return JSONResponse({"error": "uploaded file is not a valid video"}, status_code=400)
+    digest = writer.hexdigest()
+    known = _blob_store.lookup(digest)
+    probe = (known or {}).get("probe")
+    if not probe or "raw" not in probe:
+        try:
+            probe = await asyncio.to_thread(probe_video_file, writer.path)
+        except ProcessingError as exc:
+            writer.discard()
+            _drop_stream()
+            patch = {"phase": "error", "processing": False, "progress": 0, "phase_started_at": time.time()}
+            if load_state().get("video") == file_name:
+                patch["video"] = None
+                patch["converted"] = None
+                patch["video_bytes"] = None
+                patch["converted_bytes"] = None
+            update_state(patch)
+            append_event(f"Upload failed: {str(exc).replace(writer.path.name, file_name)}", event_type="process", level="error")
+            return JSONResponse({"error": "uploaded file is not a valid video"}, status_code=400)
+        except Exception:
+            writer.discard()
+            _drop_stream()
+            raise
+
+    file_path, deduplicated = _blob_store.commit(writer, file_name, probe=probe)
+    media_info.prime(file_path, probe)
+    if streamed is not None:
+        growing.finish(streamed)
+        update_state({"video": file_name, "video_bytes": writer.size, "transfer_progress": None})
+        append_event(
+            "Upload complete",
+            event_type="process",
+            details={"file": file_name, "sha256": digest, "deduplicated": deduplicated},
+        )
+        return {"status": "ok", "filename": file_name, "sha256": digest, "deduplicated": deduplicated, "streaming": True}
 
     update_state({
         "video": file_name,
@@ -801,15 +1305,19 @@ async def upload_video(file: UploadFile = File(...)):
         "phase_started_at": time.time(),
         "processing": False,
         "cancel_requested": False,
-        "video_bytes": file_path.stat().st_size,
+        "video_bytes": writer.size,
         "converted_bytes": None,
         "bboxes": [],
         "timestamps": [],
         "results_text": "",
     })
-    append_event("Upload complete", event_type="process", details={"file": file_name})
+    append_event(
+        "Upload complete",
+        event_type="process",
+        details={"file": file_name, "sha256": digest, "deduplicated": deduplicated},
+    )
 
-    return {"status": "ok", "filename": file_name}
+    return {"status": "ok", "filename": file_name, "sha256": digest, "deduplicated": deduplicated}
 
 
 @app.post("/protocol/upload")
@@ -866,7 +1374,108 @@ async def clear_protocol():
     return {"status": "ok"}
 
 
-def _download_worker(url: str, *, start_time: int | None = None, end_time: int | None = None):
+def _fetch_video(
+    url: str,
+    *,
+    start_time: int | None = None,
+    end_time: int | None = None,
+    progress_cb=_state_progress,
+    check_cancel=_cancel_requested,
+    on_start=None,
+    trim_mode: str = "copy",
+) -> Path:
+    use_ytdlp = yt_dlp is not None
+    started: list[Path] = []
+    # sha256 of a direct download, computed while it streamed in, so the blob store need not re-read it.
+    digests: list[str] = []
+    if on_start is not None and start_time is not None and end_time is not None and not use_ytdlp:
+        on_start = None  # the file is trimmed after the download: analyse the trimmed copy instead
+
+    def _start_once(path: Path):
+        if not started:
+            started.append(path)
+            on_start(path)
+
+    follow = _start_once if on_start is not None else None
+    try:
+        if use_ytdlp:
+            file_path = _download_with_ytdlp(
+                url,
+                start_time=start_time,
+                end_time=end_time,
+                progress_cb=progress_cb,
+                check_cancel=check_cancel,
+                on_start=follow,
+                trim_mode=trim_mode,
+            )
+        else:
+            file_path = _download_direct(
+                url, progress_cb=progress_cb, check_cancel=check_cancel, on_start=follow, on_digest=digests.append
+            )
+    except CancelledError:
+        raise
+    except Exception as primary_error:
+        if use_ytdlp:
+            append_event(
+                f"yt-dlp failed, fallback to direct download: {primary_error}",
+                event_type="process",
+                level="warning",
+            )
+            file_path = _download_direct(
+                url,
+                progress_cb=progress_cb,
+                check_cancel=check_cancel,
+                on_start=follow if not started else None,
+                on_digest=digests.append,
+            )
+        else:
+            raise
+
+    if start_time is not None and end_time is not None and not use_ytdlp:
+        append_event(
+            "Trimming downloaded file with ffmpeg",
+            event_type="process",
+            details={"start": start_time, "end": end_time},
+        )
+        file_path = _trim_video(
+            file_path,
+            CONVERTED_DIR,
+            start_time=start_time,
+            end_time=end_time,
+            check_cancel=check_cancel,
+            mode=trim_mode,
+        )
+    try:
+        validate_video_file(file_path)
+    except ProcessingError:
+        if use_ytdlp:
+            raise
+        append_event(
+            "Direct download invalid, attempting ffmpeg remux",
+            event_type="process",
+            level="warning",
+        )
+        remuxed = _remux_to_mp4(file_path, CONVERTED_DIR, check_cancel=check_cancel)
+        validate_video_file(remuxed)
+        file_path = remuxed
+    if file_path.parent == UPLOAD_DIR.resolve():
+        digest, deduplicated = _blob_store.adopt(
+            file_path, probe=media_info.probe(file_path), digest=digests[-1] if digests else None
+        )
+        if deduplicated:
+            append_event("Downloaded video already stored, linked to existing copy", event_type="process", details={"sha256": digest})
+    return file_path
+
+
+def _download_worker(
+    url: str,
+    *,
+    start_time: int | None = None,
+    end_time: int | None = None,
+    trim_mode: str = "copy",
+    stream_settings: dict | None = None,
+):
+    streamed: list[Path] = []
     try:
         update_state({
             "phase": "downloading",
@@ -876,54 +1485,32 @@ def _download_worker(url: str, *, start_time: int | None = None, end_time: int |
             "cancel_requested": False,
         })
         append_event("Download started", event_type="process", details={"url": url})
-
-        host = (urlparse(url).hostname or "").lower()
-        use_ytdlp = yt_dlp is not None
-
-        try:
-            if use_ytdlp:
-                file_path = _download_with_ytdlp(url, start_time=start_time, end_time=end_time)
+        start_pipeline = None
+        if stream_settings is not None:
+            protocol_path = _stream_protocol()
+            if protocol_path is None:
+                append_event("Streaming analysis skipped: upload a protocol CSV first", event_type="process", level="warning")
             else:
-                file_path = _download_direct(url)
-        except Exception as primary_error:
-            if use_ytdlp:
-                append_event(
-                    f"yt-dlp failed, fallback to direct download: {primary_error}",
-                    event_type="process",
-                    level="warning",
-                )
-                file_path = _download_direct(url)
-            else:
-                raise
+                start_pipeline = _stream_starter(protocol_path, stream_settings)
+
+        def _follow(path: Path):
+            streamed.append(path)
+            start_pipeline(path)
+
+        file_path = _fetch_video(
+            url,
+            start_time=start_time,
+            end_time=end_time,
+            # While the pipeline owns "progress", the transfer reports its own percent.
+            progress_cb=lambda value: update_state({"transfer_progress" if streamed else "progress": value}),
+            on_start=_follow if start_pipeline is not None else None,
+            trim_mode=trim_mode,
+        )
 
-        if start_time is not None and end_time is not None and not use_ytdlp:
-            append_event(
-                "Trimming downloaded file with ffmpeg",
-                event_type="process",
-                details={"start": start_time, "end": end_time},
-            )
-            trimmed = _trim_video(
-                file_path,
-                CONVERTED_DIR,
-                start_time=start_time,
-                end_time=end_time,
-                check_cancel=_cancel_requested,
-            )
-            file_path = trimmed
-        try:
-            validate_video_file(file_path)
-        except ProcessingError as exc:
-            if not use_ytdlp:
-                append_event(
-                    "Direct download invalid, attempting ffmpeg remux",
-                    event_type="process",
-                    level="warning",
-                )
-                remuxed = _remux_to_mp4(file_path, CONVERTED_DIR, check_cancel=_cancel_requested)
-                validate_video_file(remuxed)
-                file_path = remuxed
-            else:
-                raise exc
+        if streamed:
+            update_state({"video": file_path.name, "video_bytes": file_path.stat().st_size, "transfer_progress": None})
+            append_event("Download complete", event_type="process", details={"file": file_path.name})
+            return
 
         update_state({
             "video": file_path.name,
@@ -943,10 +1530,16 @@ def _download_worker(url: str, *, start_time: int | None = None, end_time: int |
         append_event("Download complete", event_type="process", details={"file": file_path.name})
 
     except CancelledError:
-        update_state({"phase": "idle", "progress": 0, "phase_started_at": None, "processing": False, "cancel_requested": False})
+        if streamed:
+            update_state({"transfer_progress": None})  # the pipeline reports its own cancellation
+        else:
+            update_state({"phase": "idle", "progress": 0, "phase_started_at": None, "processing": False, "cancel_requested": False})
         append_event("Download cancelled", event_type="process", level="warning")
     except Exception as exc:
-        update_state({"phase": "error", "processing": False, "phase_started_at": time.time()})
+        if streamed:
+            update_state({"transfer_progress": None})
+        else:
+            update_state({"phase": "error", "processing": False, "phase_started_at": time.time()})
         append_event(f"Download failed: {exc}", event_type="process", level="error")
     finally:
         _clear_worker()
@@ -975,8 +1568,16 @@ async def download_video(payload: dict):
     end_time = _parse_int("end_time")
     if start_time is not None and end_time is not None and end_time <= start_time:
         return JSONResponse({"error": "end_time must be greater than start_time"}, status_code=400)
+    trim_mode = str(payload.get("trim_mode") or "copy")
+    if trim_mode not in trim.TRIM_MODES:
+        return JSONResponse({"error": f"trim_mode must be one of {', '.join(trim.TRIM_MODES)}"}, status_code=400)
+    if not claim_job("download"):
+        return JSONResponse({"error": "another process is running"}, status_code=409)
 
-    worker = Thread(target=_download_worker, args=(url,), kwargs={"start_time": start_time, "end_time": end_time}, daemon=True)
+    kwargs = {"start_time": start_time, "end_time": end_time, "trim_mode": trim_mode}
+    if payload.get("analyse"):
+        kwargs["stream_settings"] = _parse_settings(payload)
+    worker = Thread(target=_download_worker, args=(url,), kwargs=kwargs, daemon=True)
     _set_worker(worker)
     worker.start()
     return {"status": "accepted"}
@@ -1092,6 +1693,8 @@ def _parse_settings(payload: dict | None) -> dict:
         "conf_limit": _int("conf_limit", DEFAULT_SETTINGS["conf_limit"], 1, 10),
         "session_timeout_sec": _int("session_timeout_sec", DEFAULT_SETTINGS["session_timeout_sec"], 10, 3600),
         "phantom_timeout_sec": _int("phantom_timeout_sec", DEFAULT_SETTINGS["phantom_timeout_sec"], 5, 3600),
+        "analysis_proxy": bool(raw.get("analysis_proxy", DEFAULT_SETTINGS["analysis_proxy"])),
+        "sampling": raw.get("sampling") if raw.get("sampling") in SAMPLING_MODES else DEFAULT_SETTINGS["sampling"],
     }
 
 
@@ -1117,7 +1720,7 @@ async def start_processing(payload: dict | None = None):
         append_event("Pipeline failed: selected video not found", event_type="process", level="error")
         return JSONResponse({"error": "selected video not found"}, status_code=400)
     try:
-        validate_video_file(source_path)
+        await asyncio.to_thread(validate_video_file, source_path)
     except ProcessingError as exc:
         update_state({"phase": "error", "processing": False, "progress": 0, "phase_started_at": time.time(), "video": None, "converted": None})
         append_event(f"Pipeline failed: {exc}", event_type="process", level="error")
@@ -1128,7 +1731,14 @@ async def start_processing(payload: dict | None = None):
     protocol_path = (PROTOCOL_DIR / protocol_name).resolve()
     if protocol_path.parent != PROTOCOL_DIR.resolve() or not protocol_path.exists():
         return JSONResponse({"error": "protocol csv not found"}, status_code=400)
+    if not claim_job("process"):
+        return JSONResponse({"error": "another process is running"}, status_code=409)
+
+    _launch_pipeline(source_path, protocol_path, settings, trace=bool((payload or {}).get("trace")) or tracing.env_enabled())
+    return {"status": "accepted"}
+
 
+def _launch_pipeline(source_path: Path, protocol_path: Path, settings: dict, *, trace: bool = False):
     update_state({
         "phase": "converting",
         "progress": 0,
@@ -1138,22 +1748,46 @@ async def start_processing(payload: dict | None = None):
         "bboxes": [],
         "timestamps": [],
         "results_text": "",
+        "analysis_frames": 0,
+        "convert_progress": None,
         "settings": settings,
     })
-    append_event("Pipeline started", event_type="process", details={"video": source_name})
+    append_event("Pipeline started", event_type="process", details={"video": source_path.name})
+    queue_full_hash(source_path, CONVERTED_DIR)
 
     ctx = mp.get_context("spawn")
     queue = ctx.Queue()
     cancel_event = ctx.Event()
+    shared = SharedProgress(ctx)
     process = ctx.Process(
         target=_processing_worker_process,
-        args=(str(source_path), str(protocol_path), str(MODEL_PATH), settings, queue, cancel_event),
+        args=(str(source_path), str(protocol_path), str(MODEL_PATH), settings, queue, cancel_event, shared, trace),
         daemon=True,
     )
     process.start()
-    listener = _start_process_listener(queue, process)
+    listener = _start_process_listener(queue, process, shared, cancel_event)
     _set_process_worker(process, queue, cancel_event, listener)
-    return {"status": "accepted"}
+
+
+def _stream_protocol() -> Path | None:
+    """Protocol for an analysis that starts while the video is still arriving, if one is uploaded."""
+    protocol_name = load_state().get("protocol_csv")
+    if not protocol_name:
+        return None
+    protocol_path = (PROTOCOL_DIR / protocol_name).resolve()
+    if protocol_path.parent != PROTOCOL_DIR.resolve() or not protocol_path.exists():
+        return None
+    return protocol_path
+
+
+def _stream_starter(protocol_path: Path, settings: dict):
+    """on_start callback for transfers: launch the pipeline on the growing file."""
+    def _start(file_path: Path):
+        update_state({"video": file_path.name, "converted": None, "video_bytes": None, "converted_bytes": None})
+        _launch_pipeline(file_path, protocol_path, settings, trace=tracing.env_enabled())
+        append_event("Streaming analysis started", event_type="process", details={"file": file_path.name})
+
+    return _start
 
 
 @app.post("/process/cancel")
@@ -1187,3 +1821,221 @@ async def cancel_processing():
         })
         append_event("Process force-terminated after repeated cancel", event_type="process", level="warning")
     return {"status": "accepted"}
+
+
+def _job_source(job: Job, scheduler: JobScheduler) -> Path:
+    upstream = scheduler.dependency_result(job)
+    if not job.params.get("video") and upstream.get("path"):
+        return Path(upstream["path"])
+    name = job.params.get("video") or upstream.get("video")
+    if not name:
+        raise ProcessingError("job has no source video")
+    source_path = (UPLOAD_DIR / str(name)).resolve()
+    if source_path.parent != UPLOAD_DIR.resolve() or not source_path.exists():
+        raise FileNotFoundError(f"source video not found: {name}")
+    return source_path
+
+
+def _job_event(job: Job):
+    def _emit(message: str, *, level: str = "info"):
+        append_event(message, event_type="process", level=level, details={"job": job.id})
+
+    return _emit
+
+
+def _run_download_job(job: Job, scheduler: JobScheduler) -> dict:
+    params = job.params
+    file_path = _fetch_video(
+        str(params["url"]),
+        start_time=params.get("start_time"),
+        end_time=params.get("end_time"),
+        progress_cb=lambda p: scheduler.progress(job, p),
+        check_cancel=job.cancelled,
+        trim_mode=str(params.get("trim_mode") or "copy"),
+    )
+    return {"video": file_path.name, "path": str(file_path), "video_bytes": file_path.stat().st_size}
+
+
+def _run_convert_job(job: Job, scheduler: JobScheduler) -> dict:
+    source_path = _job_source(job, scheduler)
+    emit = _job_event(job)
+    queue_full_hash(source_path, CONVERTED_DIR)
+    analysis_path, was_converted = ensure_playable_input(
+        source_path,
+        CONVERTED_DIR,
+        check_cancel=job.cancelled,
+        progress_cb=lambda p: scheduler.progress(job, p),
+        event_cb=emit,
+    )
+    return {
+        "video": source_path.name,
+        "path": str(source_path),
+        "converted": analysis_path.name if was_converted else None,
+        "converted_bytes": analysis_path.stat().st_size if was_converted else None,
+    }
+
+
+def _run_analyse_job(job: Job, scheduler: JobScheduler) -> dict:
+    source_path = _job_source(job, scheduler)
+    protocol_name = job.params.get("protocol_csv") or load_state().get("protocol_csv")
+    if not protocol_name:
+        raise ProcessingError("upload CSV protocol before processing")
+    protocol_path = (PROTOCOL_DIR / str(protocol_name)).resolve()
+    if protocol_path.parent != PROTOCOL_DIR.resolve() or not protocol_path.exists():
+        raise ProcessingError("protocol CSV not found on disk")
+    settings = _parse_settings({"settings": job.params.get("settings")})
+    scheduler.update_result(job, {"video": source_path.name, "path": str(source_path), "settings": settings})
+    queue_full_hash(source_path, CONVERTED_DIR)
+
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    cancel_event = ctx.Event()
+    shared = SharedProgress(ctx)
+    trace = bool(job.params.get("trace")) or tracing.env_enabled()
+    process = ctx.Process(
+        target=_processing_worker_process,
+        args=(str(source_path), str(protocol_path), str(MODEL_PATH), settings, queue, cancel_event, shared, trace),
+        daemon=True,
+    )
+    process.start()
+
+    errors: list[str] = []
+
+    def _apply_patch(patch: dict):
+        patch = {k: v for k, v in patch.items() if k not in {"processing", "cancel_requested", "phase_started_at"}}
+        if "progress" in patch:
+            scheduler.progress(job, patch.pop("progress"))
+        if patch:
+            scheduler.update_result(job, patch)
+
+    def _apply_events(entries: list[dict]):
+        for entry in entries:
+            entry["details"] = {**(entry.get("details") or {}), "job": job.id}
+            if entry.get("level") == "error":
+                errors.append(entry.get("message", ""))
+        append_events(entries)
+
+    try:
+        _pump_worker_queue(
+            queue,
+            process,
+            shared,
+            cancel_event,
+            apply_patch=_apply_patch,
+            apply_events=_apply_events,
+            should_cancel=job.cancelled,
+        )
+    finally:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+    phase = job.result.get("phase")
+    if job.cancelled() or phase == "idle":
+        raise CancelledError("analysis cancelled")
+    if phase != "done":
+        raise ProcessingError(errors[-1] if errors else "analysis failed")
+    return {}
+
+
+_published_jobs_lock = Lock()
+_published_jobs: set[str] = set()
+
+
+def _publish_jobs(jobs: list[dict]):
+    # Merged by id: other API workers publish their own jobs into the same state["jobs"].
+    global _published_jobs
+    current = {job["id"]: job for job in jobs}
+    with _published_jobs_lock:
+        dropped = {job_id: None for job_id in _published_jobs - current.keys()}
+        _published_jobs = set(current)
+        merge_state("jobs", {**current, **dropped})
+
+
+_scheduler = JobScheduler(
+    {
+        "download": _run_download_job,
+        "convert": _run_convert_job,
+        "analyse": _run_analyse_job,
+    },
+    publish=_publish_jobs,
+    event_cb=lambda message, **kwargs: append_event(message, event_type="process", **kwargs),
+    on_finish=_schedule_storage_sweep,
+)
+
+
+def _parse_job_spec(spec, index: int) -> dict:
+    """Validate one entry of a POST /jobs batch; raises ValueError/TypeError before anything is queued."""
+    if not isinstance(spec, dict):
+        raise ValueError("job spec must be an object")
+    kind = str(spec.get("kind", "")).strip()
+    if kind not in _scheduler.runners:
+        raise ValueError(f"unknown job kind: {kind}")
+    params = {k: v for k, v in spec.items() if k not in {"kind", "priority", "cost", "depends_on"}}
+    if kind == "download" and not str(params.get("url", "")).strip():
+        raise ValueError("download job needs url")
+    if params.get("trim_mode") not in (None, *trim.TRIM_MODES):
+        raise ValueError(f"trim_mode must be one of {', '.join(trim.TRIM_MODES)}")
+    for name in ("start_time", "end_time"):
+        if params.get(name) not in (None, ""):
+            params[name] = max(0, int(params[name]))
+        else:
+            params.pop(name, None)
+    depends_on = spec.get("depends_on")
+    # Inside a batch, a dependency can point at an earlier entry by index.
+    if isinstance(depends_on, int) and not isinstance(depends_on, bool):
+        if not 0 <= depends_on < index:
+            raise ValueError(f"depends_on index out of range: {depends_on}")
+    elif depends_on is not None and _scheduler.get(str(depends_on)) is None:
+        raise ValueError(f"unknown dependency: {depends_on}")
+    cost = spec.get("cost")
+    return {
+        "kind": kind,
+        "params": params,
+        "priority": int(spec.get("priority", 0) or 0),
+        "cost": None if cost is None else int(cost),
+        "depends_on": depends_on,
+    }
+
+
+@app.post("/jobs")
+async def create_jobs(payload: dict):
+    specs = payload.get("jobs") if isinstance(payload.get("jobs"), list) else [payload]
+    # The whole batch is checked first: a bad entry must not leave earlier ones queued or running.
+    try:
+        parsed = [_parse_job_spec(spec, index) for index, spec in enumerate(specs)]
+    except (TypeError, ValueError) as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+    created: list[Job] = []
+    for item in parsed:
+        depends_on = item.pop("depends_on")
+        if isinstance(depends_on, int) and not isinstance(depends_on, bool):
+            depends_on = created[depends_on].id
+        created.append(_scheduler.submit(item.pop("kind"), depends_on=depends_on, **item))
+    return {"jobs": [job.to_dict() for job in created], "budget": _scheduler.budget}
+
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": _scheduler.list(), "budget": _scheduler.budget, "in_use": _scheduler.in_use}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = _scheduler.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # A job queued through another API worker is only known from the shared state.
+    published = (load_state().get("jobs") or {}).get(job_id)
+    if published is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return published
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if _scheduler.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not _scheduler.cancel(job_id):
+        return JSONResponse({"error": "job already finished"}, status_code=409)
+    return {"status": "accepted"}
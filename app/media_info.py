@@ -0,0 +1,228 @@
+import copy
+import json
+import os
+import statistics
+import subprocess
+from pathlib import Path
+from threading import Lock
+
+from app import metrics, tracing
+
+CACHE_PATH_ENV = "CLIMBTAG_MEDIA_CACHE"
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / "outputs" / "cache" / "media_info.json"
+MAX_ENTRIES = 2000
+
+_lock = Lock()
+_cache: dict[str, dict] = {}
+_loaded_mtime: int | None = None
+
+
+def _cache_path() -> Path:
+    return Path(os.environ.get(CACHE_PATH_ENV) or DEFAULT_CACHE_PATH)
+
+
+def _reload():
+    global _cache, _loaded_mtime
+    path = _cache_path()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return
+    _cache = data if isinstance(data, dict) else {}
+    _loaded_mtime = mtime
+
+
+def _save(key: str, entry: dict):
+    global _loaded_mtime
+    _reload()
+    _cache[key] = entry
+    if len(_cache) > MAX_ENTRIES:
+        for stale in sorted(_cache, key=lambda k: _cache[k].get("stat", [0, 0])[1])[: len(_cache) - MAX_ENTRIES]:
+            del _cache[stale]
+    path = _cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(_cache, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+        _loaded_mtime = path.stat().st_mtime_ns
+    except OSError:
+        pass  # read-only deployment: keep the in-memory cache
+
+
+def _stat_key(path: Path) -> tuple[str, list[int]]:
+    st = path.stat()
+    return str(path.resolve()), [st.st_size, st.st_mtime_ns]
+
+
+def _run(cmd: list[str]) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", check=False)
+    except FileNotFoundError as exc:
+        raise RuntimeError("ffprobe is not installed") from exc
+
+
+def _parse_rate(raw: str | None) -> float | None:
+    try:
+        num, _, den = (raw or "").partition("/")
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(value, 3) if value > 0 else None
+
+
+def _summarize(raw: dict) -> dict:
+    streams = raw.get("streams") or []
+    fmt = raw.get("format") or {}
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    try:
+        duration = float(fmt.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        "duration": duration,
+        "format_name": fmt.get("format_name"),
+        "bit_rate": int(fmt["bit_rate"]) if str(fmt.get("bit_rate", "")).isdigit() else None,
+        "video": None if video is None else {
+            "codec": (video.get("codec_name") or "").lower(),
+            "pix_fmt": video.get("pix_fmt"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+            "has_b_frames": video.get("has_b_frames"),
+            "profile": video.get("profile"),
+            "level": video.get("level"),
+            "refs": video.get("refs"),
+        },
+        "audio": None if audio is None else {
+            "codec": (audio.get("codec_name") or "").lower(),
+            "channels": audio.get("channels"),
+            "sample_rate": audio.get("sample_rate"),
+        },
+        "raw": {"format": fmt, "streams": streams},
+    }
+
+
+def probe(video_path: Path, *, cache: bool = True) -> dict:
+    """Duration, container and stream info from one ffprobe call, cached by path, size and mtime.
+
+    ``cache=False`` is for files that are still being written. Callers get their own copy
+    and may change it without touching the cache.
+    """
+    video_path = Path(video_path)
+    key, stat = _stat_key(video_path)
+    with _lock:
+        _reload()
+        entry = _cache.get(key)
+        if cache and entry is not None and entry.get("stat") == stat:
+            metrics.inc("climbtag_media_probe_total", result="hit")
+            return copy.deepcopy(entry["info"])
+
+    metrics.inc("climbtag_media_probe_total", result="miss")
+    with tracing.span("ffprobe", cat="probe", file=video_path.name):
+        proc = _run([
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            str(video_path),
+        ])
+    if proc.returncode != 0:
+        stderr = (proc.stderr or "").strip()
+        raise RuntimeError(f"ffprobe failed: {stderr}" if stderr else "ffprobe failed")
+    try:
+        info = _summarize(json.loads(proc.stdout or "{}"))
+    except json.JSONDecodeError as exc:
+        raise RuntimeError("cannot parse ffprobe output") from exc
+
+    if cache:
+        with _lock:
+            _save(key, {"stat": stat, "info": copy.deepcopy(info)})
+    return info
+
+
+def prime(video_path: Path, info: dict):
+    """Seed the cache for a path whose metadata is already known (e.g. a deduplicated upload)."""
+    key, stat = _stat_key(Path(video_path))
+    with _lock:
+        _save(key, {"stat": stat, "info": copy.deepcopy(info)})
+
+
+def _start_offset(info: dict) -> float:
+    try:
+        return float(((info.get("raw") or {}).get("format") or {}).get("start_time") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _from_start(times: list[float], offset: float) -> list[float]:
+    return [max(0.0, round(t - offset, 6)) for t in times] if offset else list(times)
+
+
+def keyframes(video_path: Path) -> list[float]:
+    """Keyframe timestamps (seconds) of the first video stream; computed on first use, then cached.
+
+    Packet pts are on the container clock; they are returned relative to ``format.start_time``,
+    the origin ffmpeg ``-ss`` and OpenCV seeks use. Reads packet flags only, so no frame is
+    decoded, but the whole file is demuxed.
+    """
+    video_path = Path(video_path)
+    info = probe(video_path)
+    offset = _start_offset(info)
+    key, stat = _stat_key(video_path)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.get("stat") == stat and "keyframes" in entry:
+            return _from_start(entry["keyframes"], offset)
+
+    with tracing.span("ffprobe keyframes", cat="probe", file=video_path.name):
+        proc = _run([
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            str(video_path),
+        ])
+    if proc.returncode != 0:
+        raise RuntimeError("ffprobe failed to list keyframes")
+
+    times = []
+    for line in (proc.stdout or "").splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts))
+            except ValueError:
+                continue
+    times.sort()
+
+    gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+    with _lock:
+        _reload()
+        entry = _cache.get(key) or {"stat": stat, "info": info}
+        entry["keyframes"] = times
+        entry["info"] = {**entry["info"], "gop_sec": round(statistics.median(gaps), 3) if gaps else None}
+        _save(key, entry)
+    return _from_start(times, offset)
+
+
+def duration(video_path: Path) -> float:
+    value = probe(video_path).get("duration")
+    if value is None:
+        raise RuntimeError("cannot parse video duration")
+    return value
@@ -0,0 +1,174 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+from app import tracing
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+STAGE_METRIC = "climbtag_stage_seconds"
+
+_HELP = {
+    STAGE_METRIC: "Time spent per pipeline stage",
+    "climbtag_frames_total": "Frames decoded and analysed",
+    "climbtag_analysis_fps": "Analysed frames per second over the last progress window",
+    "climbtag_jobs_total": "Finished pipeline jobs by result",
+    "climbtag_keyframe_samples_total": "Keyframe-pass samples taken on a keyframe or at the exact time",
+    "climbtag_keyframes_decoded_total": "Frames decoded by keyframe-only passes",
+}
+
+_lock = Lock()
+_counters: dict[tuple[str, tuple], float] = {}
+_gauges: dict[tuple[str, tuple], float] = {}
+# (name, labels) -> [bucket counts..., +Inf count, sum]
+_histograms: dict[tuple[str, tuple], list[float]] = {}
+
+
+def _key(name: str, labels: dict) -> tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    idx = bisect_left(STAGE_BUCKETS, value)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0.0] * (len(STAGE_BUCKETS) + 2)
+        hist[idx] += 1
+        hist[-1] += value
+
+
+def observe_stage(stage_name: str, seconds: float):
+    observe(STAGE_METRIC, seconds, stage=stage_name)
+    tracing.record(stage_name, seconds, cat="stage")
+
+
+@contextmanager
+def stage(stage_name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage_name, time.perf_counter() - started)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def snapshot() -> dict:
+    """Picklable/JSON-friendly copy of all metrics, used to ship worker metrics to the API process."""
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "gauges": [[name, list(labels), value] for (name, labels), value in _gauges.items()],
+            "histograms": [[name, list(labels), list(hist)] for (name, labels), hist in _histograms.items()],
+        }
+
+
+def merge(data: dict):
+    with _lock:
+        for name, labels, value in data.get("counters", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            _counters[key] = _counters.get(key, 0) + value
+        for name, labels, value in data.get("gauges", []):
+            _gauges[(name, tuple(tuple(pair) for pair in labels))] = value
+        for name, labels, hist in data.get("histograms", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = _histograms.get(key)
+            if current is None or len(current) != len(hist):
+                _histograms[key] = list(hist)
+                continue
+            for i, value in enumerate(hist):
+                current[i] += value
+
+
+def summarize(data: dict) -> dict:
+    stages = {}
+    for name, labels, hist in data.get("histograms", []):
+        if name != STAGE_METRIC:
+            continue
+        stage_name = dict(tuple(pair) for pair in labels).get("stage", "")
+        count = int(sum(hist[:-1]))
+        total = hist[-1]
+        stages[stage_name] = {
+            "count": count,
+            "total_sec": round(total, 3),
+            "avg_ms": round((total / count) * 1000, 2) if count else 0,
+        }
+    frames = sum(value for name, _labels, value in data.get("counters", []) if name == "climbtag_frames_total")
+    summary = {"stages": stages, "frames": int(frames)}
+    analysis_sec = stages.get("analysis", {}).get("total_sec", 0)
+    if frames and analysis_sec:
+        summary["fps"] = round(frames / analysis_sec, 3)
+    return summary
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, list(hist)) for key, hist in _histograms.items())
+
+    lines = []
+    seen = set()
+
+    def header(name: str, kind: str):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _HELP:
+            lines.append(f"# HELP {name} {_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), value in gauges:
+        header(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), hist in histograms:
+        header(name, "histogram")
+        cumulative = 0.0
+        for bound, count in zip(STAGE_BUCKETS, hist):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', repr(bound)),))} {_format_value(cumulative)}")
+        cumulative += hist[len(STAGE_BUCKETS)]
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {_format_value(cumulative)}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist[-1])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+
+    return "\n".join(lines) + "\n"
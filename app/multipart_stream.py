@@ -0,0 +1,84 @@
+from collections import deque
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_FIELD_BYTES = 1024 * 1024
+
+
+class MultipartError(ValueError):
+    pass
+
+
+async def iter_form(chunks, content_type: str):
+    """Parse a multipart/form-data body while it arrives from the ``chunks`` async iterator.
+
+    Yields ``("field", name, text)`` for plain fields, then for each file part
+    ``("file", name, filename)``, ``("data", name, bytes)`` per received piece and
+    ``("file_end", name, None)``. Nothing is spooled: file bytes are handed out as read.
+    """
+    mime, options = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or not options.get(b"boundary"):
+        raise MultipartError("expected multipart/form-data")
+
+    events: deque = deque()
+    part: dict = {}
+    header = [b"", b""]
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, name="", filename=None, value=bytearray())
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header[0] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header[0].strip().lower()] = header[1].strip()
+        header[0] = header[1] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if filename is not None:
+            part["filename"] = filename.decode("utf-8", "replace")
+            events.append(("file", part["name"], part["filename"]))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part["filename"] is not None:
+            events.append(("data", part["name"], data[start:end]))
+            return
+        part["value"] += data[start:end]
+        if len(part["value"]) > MAX_FIELD_BYTES:
+            raise MultipartError(f"form field too large: {part['name']}")
+
+    def on_part_end():
+        if part["filename"] is not None:
+            events.append(("file_end", part["name"], None))
+        else:
+            events.append(("field", part["name"], bytes(part["value"]).decode("utf-8", "replace")))
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        callbacks={
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    async for chunk in chunks:
+        parser.write(chunk)
+        while events:
+            yield events.popleft()
+    parser.finalize()
+    while events:
+        yield events.popleft()
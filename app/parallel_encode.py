@@ -0,0 +1,145 @@
+import bisect
+import os
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from threading import Thread
+
+from app import metrics
+
+SEGMENTS_ENV = "CLIMBTAG_ENCODE_SEGMENTS"
+MIN_SEGMENT_SEC = 60.0
+MAX_SEGMENTS = 16
+POLL_SEC = 0.25
+
+_TIME_RE = re.compile(r"time=(\d+):(\d\d):(\d\d(?:\.\d+)?)")
+
+
+def configured_segments() -> int:
+    """Segment count from CLIMBTAG_ENCODE_SEGMENTS: a number, "auto" (half the cores) or 0/unset (off)."""
+    raw = os.environ.get(SEGMENTS_ENV, "").strip().lower()
+    if raw == "auto":
+        return min(MAX_SEGMENTS, max(1, (os.cpu_count() or 1) // 2))
+    try:
+        return max(0, min(MAX_SEGMENTS, int(raw or 0)))
+    except ValueError:
+        return 0
+
+
+def plan_segments(keyframes: list[float], duration: float, count: int) -> list[tuple[float, float]]:
+    """Split [0, duration) at the keyframes nearest to even cut points; segments shorter than MIN_SEGMENT_SEC are merged."""
+    count = min(count, int(duration // MIN_SEGMENT_SEC))
+    if count < 2 or not keyframes:
+        return [(0.0, duration)]
+    cuts = []
+    for i in range(1, count):
+        ideal = duration * i / count
+        pos = bisect.bisect_left(keyframes, ideal)
+        nearest = min(keyframes[max(0, pos - 1):pos + 1], key=lambda t: abs(t - ideal))
+        previous = cuts[-1] if cuts else 0.0
+        if nearest - previous >= MIN_SEGMENT_SEC and duration - nearest >= MIN_SEGMENT_SEC:
+            cuts.append(nearest)
+    bounds = [0.0, *cuts, duration]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _drain(proc: subprocess.Popen, progress: list[float], index: int):
+    assert proc.stderr is not None
+    for line in proc.stderr:
+        match = _TIME_RE.search(line)
+        if match:
+            hh, mm, ss = match.groups()
+            progress[index] = int(hh) * 3600 + int(mm) * 60 + float(ss)
+
+
+def encode_segmented(
+    source_path: Path,
+    target_path: Path,
+    segments: list[tuple[float, float]],
+    *,
+    duration: float,
+    has_audio: bool,
+    check_cancel,
+    progress_cb,
+    work_dir: Path,
+) -> bool:
+    """Encode video segments and the audio track in parallel ffmpeg processes, then join them with the concat demuxer.
+
+    Cuts sit on source keyframes, so each segment starts cleanly and the join is a stream copy.
+    Returns False if any child failed; raises InterruptedError after killing every child on cancel.
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // len(segments))
+    jobs: list[tuple[list[str], float]] = []
+    segment_paths = []
+    for i, (start, end) in enumerate(segments):
+        segment_path = work_dir / f"seg{i:03d}.mp4"
+        segment_paths.append(segment_path)
+        jobs.append(([
+            "ffmpeg", "-y",
+            "-ss", f"{start:.6f}",
+            "-i", str(source_path),
+            "-t", f"{end - start:.6f}",
+            "-map", "0:v:0", "-an", "-sn", "-dn",
+            "-c:v", "libx264", "-preset", "veryfast", "-threads", str(threads),
+            str(segment_path),
+        ], end - start))
+    audio_path = work_dir / "audio.m4a"
+    if has_audio:
+        # Audio is cheap; one job for the whole track avoids gaps at segment joins.
+        jobs.append((["ffmpeg", "-y", "-i", str(source_path), "-map", "0:a:0", "-vn", "-c:a", "aac", str(audio_path)], 0.0))
+
+    procs: list[subprocess.Popen] = []
+    progress = [0.0] * len(jobs)
+    started = time.perf_counter()
+    try:
+        for cmd, _length in jobs:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+            procs.append(proc)
+            Thread(target=_drain, args=(proc, progress, len(procs) - 1), daemon=True).start()
+
+        while any(proc.poll() is None for proc in procs):
+            if check_cancel():
+                raise InterruptedError("cancelled during conversion")
+            if duration > 0:
+                encoded = sum(min(progress[i], length) for i, (_cmd, length) in enumerate(jobs) if length)
+                progress_cb(min(98, int(encoded / duration * 100)))
+            time.sleep(POLL_SEC)
+    except BaseException:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        for proc in procs:
+            proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    finally:
+        metrics.observe_stage("ffmpeg_segments", time.perf_counter() - started)
+
+    if any(proc.returncode != 0 for proc in procs):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return False
+
+    list_path = work_dir / "segments.txt"
+    list_path.write_text("".join(f"file '{p.name}'\n" for p in segment_paths), encoding="utf-8")
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_path)]
+    if has_audio:
+        cmd += ["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a:0"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", str(target_path)]
+    with metrics.stage("ffmpeg_concat"):
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if proc.returncode != 0:
+        target_path.unlink(missing_ok=True)
+        return False
+    progress_cb(99)
+    return True
@@ -1,11 +1,16 @@
-import hashlib
-import json
+import bisect
+import math
+import os
+import queue
 import re
 import subprocess
 import time
 from pathlib import Path
+from threading import Thread
 
+from app import growing, media_info, metrics, parallel_encode, tracing
 from app.detector import DetectorUnavailableError, PersonNumberDetector
+from app.fingerprint import full_hash_enabled, get_index
 from app.matcher import ProtocolMatcher
 
 
@@ -17,60 +22,26 @@ class ProcessingError(RuntimeError):
     pass
 
 
-def _sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-
 def _ffprobe_duration(video_path: Path) -> float:
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration",
-        "-of",
-        "default=noprint_wrappers=1:nokey=1",
-        str(video_path),
-    ]
-    proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", check=False)
-    if proc.returncode != 0:
-        stderr = (proc.stderr or "").strip()
-        if stderr:
-            raise RuntimeError(f"ffprobe failed: {stderr}")
-        raise RuntimeError("ffprobe failed")
-
-    try:
-        return float((proc.stdout or "0").strip())
-    except ValueError as exc:
-        raise RuntimeError("cannot parse video duration") from exc
+    return media_info.duration(video_path)
 
 
-def validate_video_file(video_path: Path):
+def probe_video_file(video_path: Path) -> dict:
     try:
-        _ffprobe_duration(video_path)
-    except RuntimeError as exc:
+        info = media_info.probe(video_path)
+        if info.get("duration") is None:
+            raise RuntimeError("cannot parse video duration")
+    except (RuntimeError, OSError) as exc:
         raise ProcessingError(f"invalid video file: {video_path.name}: {exc}") from exc
+    return info
+
+
+def validate_video_file(video_path: Path) -> float:
+    return probe_video_file(video_path)["duration"]
 
 
 def _ffprobe_stream_info(video_path: Path) -> dict:
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-print_format",
-        "json",
-        "-show_format",
-        "-show_streams",
-        str(video_path),
-    ]
-    proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", check=False)
-    if proc.returncode != 0:
-        raise RuntimeError("ffprobe failed for stream info")
-    return json.loads(proc.stdout or "{}")
+    return media_info.probe(video_path)["raw"]
 
 
 def is_browser_playable(video_path: Path) -> bool:
@@ -110,48 +81,74 @@ def _ffmpeg_time_to_seconds(raw: str) -> float:
     return int(hh) * 3600 + int(mm) * 60 + float(ss)
 
 
-def convert_for_web(
+CONVERSION_INDEX_NAME = ".index.json"
+PROXY_HEIGHT_ENV = "CLIMBTAG_PROXY_HEIGHT"
+PROXY_FPS = 5
+PROXY_MAX_DRIFT_SEC = 1.0
+
+
+def proxy_height() -> int:
+    try:
+        return max(144, int(os.environ.get(PROXY_HEIGHT_ENV) or 720))
+    except ValueError:
+        return 720
+
+
+# Codecs an MP4 can carry that browsers decode; anything else needs a re-encode.
+MP4_VIDEO_CODECS = {"h264", "hevc", "vp9", "av1"}
+MP4_AUDIO_CODECS = {"aac", "mp3"}
+# 10-bit / 4:2:2 H.264 is valid MP4 but most browsers refuse to decode it.
+BROWSER_PIX_FMTS = {"yuv420p", "yuvj420p"}
+
+
+def plan_conversion(info: dict) -> str:
+    """Pick the cheapest way to make a file playable: "copy", "copy_video" or "transcode"."""
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), None)
+    audio = next((s for s in info.get("streams", []) if s.get("codec_type") == "audio"), None)
+    if video is None:
+        return "transcode"
+    vcodec = (video.get("codec_name") or "").lower()
+    pix_fmt = (video.get("pix_fmt") or "").lower()
+    if vcodec not in MP4_VIDEO_CODECS or (pix_fmt and pix_fmt not in BROWSER_PIX_FMTS):
+        return "transcode"
+    if audio is None or (audio.get("codec_name") or "").lower() in MP4_AUDIO_CODECS:
+        return "copy"
+    return "copy_video"
+
+
+def _conversion_args(mode: str) -> list[str]:
+    if mode == "proxy":
+        # Fixed fps with a keyframe every second: any 1 s-grid sample decodes a single frame.
+        return [
+            "-map", "0:v:0", "-an", "-dn", "-sn",
+            "-vf", f"scale=-2:'min(ih,{proxy_height()})',fps={PROXY_FPS}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "fastdecode",
+            "-g", str(PROXY_FPS), "-keyint_min", str(PROXY_FPS), "-sc_threshold", "0", "-bf", "0", "-crf", "26",
+        ]
+    if mode == "copy":
+        return ["-map", "0:v:0", "-map", "0:a:0?", "-dn", "-sn", "-c", "copy"]
+    if mode == "copy_video":
+        return ["-map", "0:v:0", "-map", "0:a:0?", "-dn", "-sn", "-c:v", "copy", "-c:a", "aac"]
+    return ["-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac"]
+
+
+def run_ffmpeg_conversion(
     source_path: Path,
-    converted_dir: Path,
+    target_path: Path,
+    mode: str,
     *,
+    duration: float,
     check_cancel,
     progress_cb,
-    event_cb,
-) -> Path:
-    converted_dir.mkdir(parents=True, exist_ok=True)
-
-    if check_cancel():
-        raise CancelledError("cancelled before conversion")
-
-    source_hash = _sha256_file(source_path)[:12]
-    target_path = converted_dir / f"{source_path.stem}-{source_hash}.mp4"
-
-    if target_path.exists():
-        try:
-            _ffprobe_duration(target_path)
-            event_cb(f"Conversion cache hit: {target_path.name}")
-            progress_cb(100)
-            return target_path
-        except RuntimeError:
-            target_path.unlink(missing_ok=True)
-            event_cb(f"Conversion cache invalidated: {target_path.name}")
-
-    duration = _ffprobe_duration(source_path)
-    event_cb(f"Converting with ffmpeg -> {target_path.name}")
-
+) -> bool:
     cmd = [
         "ffmpeg",
         "-y",
         "-i",
         str(source_path),
-        "-c:v",
-        "libx264",
-        "-preset",
-        "veryfast",
+        *_conversion_args(mode),
         "-movflags",
         "+faststart",
-        "-c:a",
-        "aac",
         str(target_path),
     ]
 
@@ -165,6 +162,7 @@ def convert_for_web(
     )
 
     time_re = re.compile(r"time=(\d\d:\d\d:\d\d(?:\.\d+)?)")
+    started = time.perf_counter()
 
     try:
         assert proc.stderr is not None
@@ -182,23 +180,210 @@ def convert_for_web(
             progress_cb(progress)
     finally:
         proc.wait()
+        stage = {"transcode": "ffmpeg_convert", "proxy": "ffmpeg_proxy"}.get(mode, "ffmpeg_remux")
+        metrics.observe_stage(stage, time.perf_counter() - started)
 
     if proc.returncode != 0:
-        if target_path.exists():
-            target_path.unlink(missing_ok=True)
-        raise RuntimeError("ffmpeg conversion failed")
-
+        target_path.unlink(missing_ok=True)
+        return False
     try:
         _ffprobe_duration(target_path)
     except RuntimeError:
         target_path.unlink(missing_ok=True)
-        raise RuntimeError("ffmpeg produced invalid output")
+        return False
+    return True
+
 
+def _encode(source_path: Path, target_path: Path, mode: str, *, duration: float, check_cancel, progress_cb, event_cb) -> bool:
+    segment_count = parallel_encode.configured_segments() if mode == "transcode" else 0
+    if segment_count >= 2:
+        try:
+            segments = parallel_encode.plan_segments(media_info.keyframes(source_path), duration, segment_count)
+        except RuntimeError:
+            segments = []
+        if len(segments) >= 2:
+            event_cb(f"Encoding {len(segments)} segments in parallel")
+            try:
+                ok = parallel_encode.encode_segmented(
+                    source_path,
+                    target_path,
+                    segments,
+                    duration=duration,
+                    has_audio=media_info.probe(source_path).get("audio") is not None,
+                    check_cancel=check_cancel,
+                    progress_cb=progress_cb,
+                    work_dir=target_path.with_name(f".{target_path.stem}.segments"),
+                )
+            except InterruptedError as exc:
+                raise CancelledError(str(exc)) from exc
+            if ok:
+                try:
+                    _ffprobe_duration(target_path)
+                    return True
+                except RuntimeError:
+                    target_path.unlink(missing_ok=True)
+            event_cb("Segmented encode failed, encoding in one pass")
+    return run_ffmpeg_conversion(source_path, target_path, mode, duration=duration, check_cancel=check_cancel, progress_cb=progress_cb)
+
+
+def _cached_output(index, key: str, target_path: Path, *, progress_cb, event_cb) -> Path | None:
+    cached = index.lookup_output(key)
+    if cached is not None:
+        cached_path = target_path.parent / cached["file"]
+        try:
+            if cached_path.stat().st_size == cached.get("size"):
+                event_cb(f"Conversion cache hit: {cached_path.name}")
+                progress_cb(100)
+                return cached_path
+        except OSError:
+            pass
+        index.drop_output(key)
+        event_cb(f"Conversion cache invalidated: {cached_path.name}")
+    elif target_path.exists():
+        # Output from a run whose index update was lost (e.g. killed worker): verify once and adopt.
+        try:
+            _ffprobe_duration(target_path)
+            index.record_output(key, target_path)
+            event_cb(f"Conversion cache hit: {target_path.name}")
+            progress_cb(100)
+            return target_path
+        except RuntimeError:
+            target_path.unlink(missing_ok=True)
+            event_cb(f"Conversion cache invalidated: {target_path.name}")
+    return None
+
+
+def queue_full_hash(source_path: Path, converted_dir: Path):
+    """Start the optional full SHA-256 of a source (CLIMBTAG_FULL_HASH) in this process.
+
+    Call it from the API process: a spawned pipeline worker exits right after its job and
+    its daemon hashing thread would die with it.
+    """
+    if full_hash_enabled() and not growing.is_growing(source_path):
+        get_index(converted_dir / CONVERSION_INDEX_NAME).hash_in_background(source_path)
+
+
+def convert_for_web(
+    source_path: Path,
+    converted_dir: Path,
+    *,
+    check_cancel,
+    progress_cb,
+    event_cb,
+) -> Path:
+    converted_dir.mkdir(parents=True, exist_ok=True)
+
+    if check_cancel():
+        raise CancelledError("cancelled before conversion")
+
+    index = get_index(converted_dir / CONVERSION_INDEX_NAME)
+    fingerprint = index.fingerprint(source_path)
+    target_path = converted_dir / f"{source_path.stem}-{fingerprint[:12]}.mp4"
+
+    cached = _cached_output(index, fingerprint, target_path, progress_cb=progress_cb, event_cb=event_cb)
+    if cached is not None:
+        return cached
+
+    duration = _ffprobe_duration(source_path)
+    try:
+        mode = plan_conversion(_ffprobe_stream_info(source_path))
+    except (RuntimeError, ValueError):
+        mode = "transcode"
+
+    labels = {
+        "copy": "Remuxing (stream copy)",
+        "copy_video": "Copying video, transcoding audio",
+        "transcode": "Converting with ffmpeg",
+    }
+    event_cb(f"{labels[mode]} -> {target_path.name}")
+    ok = _encode(source_path, target_path, mode, duration=duration, check_cancel=check_cancel, progress_cb=progress_cb, event_cb=event_cb)
+    if not ok and mode != "transcode":
+        # Odd timestamps or codec parameters can make a copy fail; a re-encode still works.
+        event_cb(f"Stream copy failed, falling back to full re-encode -> {target_path.name}")
+        mode = "transcode"
+        ok = _encode(source_path, target_path, mode, duration=duration, check_cancel=check_cancel, progress_cb=progress_cb, event_cb=event_cb)
+    if not ok:
+        raise RuntimeError("ffmpeg conversion failed")
+
+    index.record_output(fingerprint, target_path, mode=mode)
+    metrics.inc("climbtag_conversions_total", mode=mode)
     progress_cb(100)
     event_cb("Conversion complete")
     return target_path
 
 
+def ensure_analysis_proxy(
+    source_path: Path,
+    proxy_dir: Path,
+    *,
+    check_cancel,
+    progress_cb,
+    event_cb,
+) -> Path:
+    """Downscaled, fixed-fps, short-GOP copy of the source used only for analysis.
+
+    Generated once per source fingerprint and proxy format. The proxy keeps the
+    source timeline (same start, same duration), so analysis timestamps need no mapping.
+    """
+    proxy_dir.mkdir(parents=True, exist_ok=True)
+    if check_cancel():
+        raise CancelledError("cancelled before proxy")
+
+    index = get_index(proxy_dir / CONVERSION_INDEX_NAME)
+    fingerprint = index.fingerprint(source_path)
+    height = proxy_height()
+    key = f"{fingerprint}:{height}p{PROXY_FPS}"
+    target_path = proxy_dir / f"{source_path.stem}-{fingerprint[:12]}-{height}p.mp4"
+    cached = _cached_output(index, key, target_path, progress_cb=progress_cb, event_cb=event_cb)
+    if cached is not None:
+        return cached
+
+    duration = _ffprobe_duration(source_path)
+    event_cb(f"Building analysis proxy ({height}p, {PROXY_FPS} fps) -> {target_path.name}")
+    if not run_ffmpeg_conversion(
+        source_path,
+        target_path,
+        "proxy",
+        duration=duration,
+        check_cancel=check_cancel,
+        progress_cb=progress_cb,
+    ):
+        raise RuntimeError("ffmpeg proxy generation failed")
+    if abs(_ffprobe_duration(target_path) - duration) > PROXY_MAX_DRIFT_SEC:
+        target_path.unlink(missing_ok=True)
+        raise RuntimeError("analysis proxy timeline does not match the source")
+
+    index.record_output(key, target_path, mode="proxy")
+    progress_cb(100)
+    event_cb("Analysis proxy ready")
+    return target_path
+
+
+def select_analysis_input(
+    source_path: Path,
+    playable_path: Path,
+    proxy_dir: Path,
+    settings: dict | None,
+    *,
+    check_cancel,
+    progress_cb,
+    event_cb,
+) -> Path:
+    if not (settings or {}).get("analysis_proxy"):
+        return playable_path
+    try:
+        return ensure_analysis_proxy(
+            source_path,
+            proxy_dir,
+            check_cancel=check_cancel,
+            progress_cb=progress_cb,
+            event_cb=event_cb,
+        )
+    except RuntimeError as exc:
+        event_cb(f"Analysis proxy unavailable, analysing full video: {exc}")
+        return playable_path
+
+
 def ensure_playable_input(
     source_path: Path,
     converted_dir: Path,
@@ -222,6 +407,21 @@ def ensure_playable_input(
     return converted, True
 
 
+def opencv_can_decode(video_path: Path) -> bool:
+    """True when OpenCV opens the file and decodes its first frame, so analysis need not wait for conversion."""
+    try:
+        import cv2
+    except Exception:
+        return False
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        return bool(cap.isOpened() and cap.read()[0])
+    except Exception:
+        return False
+    finally:
+        cap.release()
+
+
 def _format_time(seconds: float) -> str:
     s = max(0, int(seconds))
     h = s // 3600
@@ -242,6 +442,229 @@ def _build_timestamps(results: list[dict]) -> list[dict]:
     return [{"time": r["time"], "label": r["label"]} for r in results]
 
 
+def _seek_frames(cap, cv2, frame_interval: int, total_steps: int):
+    """Frame source for complete files: seek to every ``frame_interval`` seconds."""
+    try:
+        for step in range(total_steps):
+            frame_ms = step * frame_interval * 1000
+            with metrics.stage("decode"):
+                cap.set(cv2.CAP_PROP_POS_MSEC, frame_ms)
+                ok, frame = cap.read()
+            if not ok:
+                return
+            yield frame_ms, frame
+    finally:
+        cap.release()
+
+
+SAMPLING_MODES = ("exact", "keyframes", "auto")
+# A sample snaps to a keyframe at most this share of the interval away, so it stays in its own slot.
+KEYFRAME_TOLERANCE_RATIO = 0.5
+
+
+def plan_keyframe_samples(keyframes: list[float], frame_interval: int, total_steps: int) -> list[tuple[float, bool]]:
+    """Sample times (seconds) for a keyframe pass, with whether each one is a keyframe.
+
+    Each step's target snaps to the nearest keyframe within the tolerance; targets
+    with no keyframe close enough keep their exact time. Two targets snapping to the
+    same keyframe produce one sample.
+    """
+    tolerance = frame_interval * KEYFRAME_TOLERANCE_RATIO
+    samples: list[tuple[float, bool]] = []
+    for step in range(total_steps):
+        target = float(step * frame_interval)
+        pos = bisect.bisect_left(keyframes, target)
+        near = keyframes[max(0, pos - 1):pos + 1]
+        nearest = min(near, key=lambda t: abs(t - target)) if near else None
+        if nearest is not None and abs(nearest - target) <= tolerance:
+            sample = (nearest, True)
+        else:
+            sample = (target, False)
+        if not samples or sample[0] > samples[-1][0]:
+            samples.append(sample)
+    return samples
+
+
+SHOWINFO_PTS = re.compile(r"\bpts_time:\s*(-?[0-9.]+)")
+
+
+def _decode_keyframes(video_path: Path, info: dict):
+    """Yield (seconds, BGR frame) for every keyframe of ``video_path``, decoding nothing else.
+
+    ``-skip_frame nokey`` makes the decoder drop all other packets, so each keyframe is
+    one decoded frame with no catch-up from the previous one. showinfo prints each frame's
+    pts on stderr; ffmpeg already shifts it by the start time, like ``media_info.keyframes``.
+    """
+    import numpy as np
+
+    width, height = info["video"]["width"], info["video"]["height"]
+    frame_bytes = width * height * 3
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-hide_banner", "-nostats", "-noautorotate",
+            "-skip_frame", "nokey",
+            "-i", str(video_path),
+            "-map", "0:v:0",
+            "-vsync", "0",
+            "-vf", "showinfo",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "pipe:1",
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    times: queue.Queue = queue.Queue()
+
+    def _read_pts():
+        # showinfo logs a frame before it is written to stdout, so its time is queued first.
+        for raw in proc.stderr:
+            line = raw.decode("utf-8", "replace")
+            match = SHOWINFO_PTS.search(line) if "showinfo" in line else None
+            if match:
+                times.put(float(match.group(1)))
+        times.put(None)
+
+    reader = Thread(target=_read_pts, name="keyframe-pts", daemon=True)
+    reader.start()
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            time_sec = times.get()
+            if time_sec is None:
+                break
+            metrics.inc("climbtag_keyframes_decoded_total")
+            yield time_sec, np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        reader.join(timeout=5)
+
+
+def _keyframe_frames(cap, cv2, video_path: Path, info: dict, samples: list[tuple[float, bool]]):
+    """Frame source for a keyframe pass.
+
+    Samples on a keyframe come from one keyframe-only decode of the file; samples with no
+    keyframe close enough are seeked exactly through ``cap``.
+    """
+    keyframes = _decode_keyframes(video_path, info)
+    try:
+        for time_sec, on_keyframe in samples:
+            with metrics.stage("decode"):
+                if on_keyframe:
+                    # Keyframes between the sampled ones are decoded by the pass and dropped here.
+                    for decoded_sec, frame in keyframes:
+                        if decoded_sec >= time_sec - 0.001:
+                            break
+                    else:
+                        return
+                    frame_ms = round(decoded_sec * 1000)
+                else:
+                    frame_ms = round(time_sec * 1000)
+                    cap.set(cv2.CAP_PROP_POS_MSEC, frame_ms)
+                    ok, frame = cap.read()
+                    if not ok:
+                        return
+            metrics.inc("climbtag_keyframe_samples_total", result="snapped" if on_keyframe else "exact")
+            yield frame_ms, frame
+    finally:
+        keyframes.close()
+        cap.release()
+
+
+def _use_keyframes(video_path: Path, mode: str, frame_interval: int, event_cb) -> list[float] | None:
+    if mode not in ("keyframes", "auto"):
+        return None
+    try:
+        keyframes = media_info.keyframes(video_path)
+        gop_sec = media_info.probe(video_path).get("gop_sec")
+    except RuntimeError as exc:
+        event_cb(f"Keyframe sampling unavailable, decoding exact timestamps: {exc}")
+        return None
+    if not keyframes:
+        return None
+    # "auto" only pays off when several keyframes fall inside one sampling interval.
+    if mode == "auto" and not (gop_sec and gop_sec * 2 <= frame_interval):
+        return None
+    return keyframes
+
+
+def _timed_frames(frames):
+    # Attributes the wait for each frame to the decode stage, like the seek source does.
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(frames)
+            except StopIteration:
+                return
+            metrics.observe_stage("decode", time.perf_counter() - started)
+            yield item
+    finally:
+        frames.close()
+
+
+def _open_frame_source(
+    cv2,
+    video_path: Path,
+    frame_interval: int,
+    *,
+    sampling: str = "exact",
+    check_cancel,
+    progress_cb,
+    event_cb,
+):
+    """Pick the frame iterator for ``video_path`` and a step -> percent function.
+
+    A file that is still arriving is followed through ffmpeg; percent then tracks the
+    bytes read against the expected size (None while unknown). Containers that cannot
+    be read before the transfer ends (MP4 with the index at the end) wait for it.
+    """
+    if growing.is_growing(video_path):
+        try:
+            info = growing.wait_for_header(video_path, check_cancel=check_cancel)
+        except InterruptedError as exc:
+            raise CancelledError(str(exc)) from exc
+        if info is not None:
+            event_cb("Source is still arriving: following it as it grows")
+            received = {"percent": None}
+
+            def _bytes_progress(value: int):
+                received["percent"] = value
+
+            frames = growing.follow_frames(
+                video_path,
+                frame_interval,
+                info,
+                check_cancel=check_cancel,
+                progress_cb=_bytes_progress,
+            )
+            return _timed_frames(frames), lambda _step: received["percent"]
+        if not video_path.exists():
+            raise ProcessingError(f"transfer of {video_path.name} was aborted")
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise ProcessingError(f"cannot open video: {video_path.name}")
+    try:
+        total_steps = max(1, int(_ffprobe_duration(video_path) / frame_interval))
+        keyframes = _use_keyframes(video_path, sampling, frame_interval, event_cb)
+        info = media_info.probe(video_path) if keyframes is not None else None
+    except BaseException:
+        cap.release()
+        raise
+    if keyframes is not None:
+        samples = plan_keyframe_samples(keyframes, frame_interval, total_steps)
+        snapped = sum(1 for _t, on_keyframe in samples if on_keyframe)
+        event_cb(f"Keyframe sampling: {snapped} of {len(samples)} samples on keyframes")
+        return _keyframe_frames(cap, cv2, video_path, info, samples), lambda step: int(((step + 1) / len(samples)) * 100)
+    return _seek_frames(cap, cv2, frame_interval, total_steps), lambda step: int(((step + 1) / total_steps) * 100)
+
+
 def run_protocol_analysis(
     video_path: Path,
     protocol_csv: Path,
@@ -249,6 +672,7 @@ def run_protocol_analysis(
     *,
     settings: dict | None = None,
     partial_cb=None,
+    frame_cb=None,
     check_cancel,
     progress_cb,
     event_cb,
@@ -267,20 +691,22 @@ def run_protocol_analysis(
     except DetectorUnavailableError as exc:
         raise ProcessingError(str(exc)) from exc
 
-    cap = cv2.VideoCapture(str(video_path))
-    if not cap.isOpened():
-        raise ProcessingError(f"cannot open video: {video_path.name}")
-
-    duration = _ffprobe_duration(video_path)
     settings = settings or {}
     frame_interval = max(1, int(settings.get("frame_interval_sec", 3)))
     conf_limit = max(1, int(settings.get("conf_limit", 3)))
     session_timeout_sec = max(0, int(settings.get("session_timeout_sec", 240)))
     phantom_timeout_sec = max(0, int(settings.get("phantom_timeout_sec", 60)))
 
-    total_steps = max(1, int(duration / frame_interval))
+    frames, step_progress = _open_frame_source(
+        cv2,
+        video_path,
+        frame_interval,
+        sampling=str(settings.get("sampling") or "exact"),
+        check_cancel=check_cancel,
+        progress_cb=progress_cb,
+        event_cb=event_cb,
+    )
     step = 0
-    frame_ms = 0
 
     # temporal smoothing / confirmation buffer
     candidates: dict[str, dict] = {}
@@ -308,16 +734,19 @@ def run_protocol_analysis(
         last_emit_time = now
 
     emit_partial(force=True)
+    fps_window_started = time.perf_counter()
+    fps_window_frames = 0
 
     try:
-        while cap.isOpened() and step < total_steps:
+        frame_started = time.perf_counter()
+        for frame_ms, frame in frames:
             if check_cancel():
                 raise CancelledError("cancelled during analysis")
 
-            cap.set(cv2.CAP_PROP_POS_MSEC, frame_ms)
-            ok, frame = cap.read()
-            if not ok:
-                break
+            metrics.inc("climbtag_frames_total")
+            fps_window_frames += 1
+            if frame_cb is not None:
+                frame_cb(step + 1)
 
             matched, bboxes = detector.detect(frame, matcher)
             latest_bboxes = bboxes
@@ -325,6 +754,7 @@ def run_protocol_analysis(
             time_str = _format_time(frame_ms / 1000)
             time_sec = round(frame_ms / 1000, 2)
 
+            confirm_started = time.perf_counter()
             # drop stale candidates (phantom protection)
             if phantom_timeout_sec > 0 and candidates:
                 stale = [
@@ -365,19 +795,30 @@ def run_protocol_analysis(
                     last_confirmed_time[num] = time_sec
                     del candidates[num]
                     dirty = True
+            metrics.observe_stage("confirm", time.perf_counter() - confirm_started)
 
-            progress = int(((step + 1) / total_steps) * 100)
-            progress_cb(progress)
+            progress = step_progress(step)
+            if progress is not None:
+                progress_cb(progress)
             emit_partial(force=False)
 
             if step % 20 == 0:
-                event_cb(f"Analysis progress: {progress}%")
-
+                event_cb(f"Analysis progress: {progress}%" if progress is not None else f"Analysis progress: {step + 1} frames")
+                window_sec = time.perf_counter() - fps_window_started
+                if window_sec > 0:
+                    metrics.set_gauge("climbtag_analysis_fps", round(fps_window_frames / window_sec, 3))
+                fps_window_started = time.perf_counter()
+                fps_window_frames = 0
+
+            tracing.record("frame", time.perf_counter() - frame_started, cat="frame", step=step, ms=frame_ms)
             step += 1
-            frame_ms += frame_interval * 1000
-
+            frame_started = time.perf_counter()
+    except InterruptedError as exc:
+        raise CancelledError(str(exc)) from exc
+    except growing.TransferAborted as exc:
+        raise ProcessingError(str(exc)) from exc
     finally:
-        cap.release()
+        frames.close()
 
     results.sort(key=lambda x: x.get("time", 0))
 
@@ -0,0 +1,89 @@
+import logging
+import queue
+import time
+from threading import Lock, Thread
+
+from app import metrics
+from app.state import append_events, make_event
+
+QUEUE_SIZE = 5000
+BATCH_SIZE = 200
+BATCH_WAIT_SEC = 0.2
+# Keep 1 in N requests for paths that fire constantly (video range requests, polling).
+SAMPLE_EVERY = {
+    "/video/": 50,
+    "/converted/": 50,
+    "/traces": 10,
+}
+
+_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+_writer: Thread | None = None
+_writer_lock = Lock()
+_sample_counters: dict[str, int] = {}
+
+
+def should_log(path: str) -> bool:
+    for prefix, every in SAMPLE_EVERY.items():
+        if path.startswith(prefix):
+            count = _sample_counters.get(prefix, 0)
+            _sample_counters[prefix] = count + 1
+            if count % every:
+                metrics.inc("climbtag_request_log_sampled_out_total")
+                return False
+            return True
+    return True
+
+
+def submit(message: str, *, level: str = "info", details: dict | None = None, server_line: str | None = None):
+    """Queue a request event; never blocks the caller. Drops (and counts) entries when the queue is full."""
+    _ensure_writer()
+    entry = make_event(message, event_type="request", level=level, details=details)
+    try:
+        _queue.put_nowait((entry, server_line))
+    except queue.Full:
+        metrics.inc("climbtag_request_log_dropped_total")
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = Thread(target=_write_loop, name="request-log", daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    server_logger = logging.getLogger("climbtag.server")
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT_SEC
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            append_events([entry for entry, _line in batch])
+            for _entry, line in batch:
+                if line:
+                    server_logger.info(line)
+        except Exception:
+            server_logger.exception("request log batch failed")
+        metrics.inc("climbtag_request_log_written_total", len(batch))
+
+
+def drain(timeout_sec: float = 2.0) -> bool:
+    """Wait until queued entries are handed to the writer (used by tests and shutdown)."""
+    deadline = time.monotonic() + timeout_sec
+    while not _queue.empty():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    time.sleep(BATCH_WAIT_SEC + 0.05)
+    return True
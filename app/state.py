@@ -1,24 +1,55 @@
+import atexit
 import json
 import logging
 import os
+import time
 import uuid
+from collections import deque
 from datetime import datetime, timezone
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from threading import Condition, RLock
+from threading import Condition, Event, Lock, RLock, Thread
+
+from app import metrics
+from app.state_backend import create_backend, merge_entries
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATE_FILE = BASE_DIR / "state.json"
 LOG_DIR = BASE_DIR / "logs"
 EVENTS_LOG_FILE = LOG_DIR / "state-events.log"
+EVENTS_JSONL_FILE = LOG_DIR / "events.jsonl"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
+FLUSH_INTERVAL_SEC = 1.0
+EVENT_BUFFER_SIZE = 300
+STATE_HISTORY_SIZE = 256
+BACKEND_POLL_SEC = 0.2
 
 _lock = RLock()
 _state_changed = Condition(_lock)
+# Copy-on-write snapshot: replaced wholesale on every commit, never mutated in place,
+# so readers can grab the reference without taking the lock.
 _runtime_state: dict | None = None
 _state_version = 0
 _process_boot_id = uuid.uuid4().hex
 
+_flush_lock = Lock()
+_flush_wakeup = Event()
+_flush_urgent = Event()
+_flush_thread: Thread | None = None
+_dirty = False
+_last_persisted: dict | None = None
+
+_events: deque = deque(maxlen=EVENT_BUFFER_SIZE)
+# (version, changed top-level keys) per commit, used to serve deltas to SSE clients.
+_history: deque = deque(maxlen=STATE_HISTORY_SIZE)
+_change_listeners: list = []
+
+# Optional shared backend (CLIMBTAG_STATE_BACKEND=sqlite) for running several API workers;
+# the in-memory snapshot above then acts as a local cache kept fresh by a poller thread.
+_backend = create_backend(BASE_DIR)
+_backend_poller: Thread | None = None
+_job_owned = False
+
 _event_logger = logging.getLogger("climbtag.events")
 if not _event_logger.handlers:
     _event_logger.setLevel(logging.INFO)
@@ -27,6 +58,46 @@ if not _event_logger.handlers:
     _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
     _event_logger.addHandler(_handler)
 
+_event_journal = logging.getLogger("climbtag.events.jsonl")
+if not _event_journal.handlers:
+    _event_journal.setLevel(logging.INFO)
+    _event_journal.propagate = False
+    _journal_handler = RotatingFileHandler(EVENTS_JSONL_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+    _journal_handler.setFormatter(logging.Formatter("%(message)s"))
+    _event_journal.addHandler(_journal_handler)
+
+
+def _last_journal_seq() -> int:
+    """Continue sequence ids across restarts so client cursors stay valid."""
+    for path in (EVENTS_JSONL_FILE, EVENTS_JSONL_FILE.with_name(EVENTS_JSONL_FILE.name + ".1")):
+        try:
+            with path.open("rb") as fh:
+                fh.seek(0, os.SEEK_END)
+                fh.seek(max(0, fh.tell() - 64 * 1024))
+                lines = fh.read().splitlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                seq = json.loads(line).get("seq")
+            except (ValueError, AttributeError):
+                continue
+            if isinstance(seq, int):
+                return seq
+    return 0
+
+
+def _initial_event_seq(backend, journal_seq: int) -> int:
+    # With a shared backend the database assigns seqs; start it after the journal so
+    # cursors handed out before switching backends stay valid.
+    if backend is None:
+        return journal_seq
+    backend.seed_event_seq(journal_seq)
+    return backend.head()[1]
+
+
+_event_seq = _initial_event_seq(_backend, _last_journal_seq())
+
 
 def _default_state():
     return {
@@ -47,12 +118,17 @@ def _default_state():
         "converted_bytes": None,
         "bboxes": [],
         "timestamps": [],
-        "events": [],
+        "analysis_frames": 0,
+        "convert_progress": None,
+        "transfer_progress": None,
+        "jobs": {},
         "settings": {
             "frame_interval_sec": 3,
             "conf_limit": 3,
             "session_timeout_sec": 360,
             "phantom_timeout_sec": 60,
+            "analysis_proxy": False,
+            "sampling": "exact",
         },
         "ui": {
             "sidebar_hidden": False,
@@ -94,17 +170,135 @@ def _persisted_state(state: dict) -> dict:
     }
 
 
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # A single-file bind mount (docker-compose mounts state.json) cannot be replaced.
+        tmp_path.unlink(missing_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+
+def flush_state(*, force: bool = False) -> bool:
+    """Write the persisted subset of the current snapshot if it changed since the last write."""
+    global _dirty, _last_persisted
+    with _flush_lock:
+        with _lock:
+            state = _runtime_state
+            was_dirty = _dirty
+            _dirty = False
+        if state is None or (not was_dirty and not force):
+            return False
+        persisted = _persisted_state(state)
+        if persisted == _last_persisted and not force:
+            return False
+        with metrics.stage("state_flush"):
+            _write_atomic(STATE_FILE, json.dumps(persisted, ensure_ascii=False))
+        _last_persisted = persisted
+        return True
+
+
+def _flush_loop():
+    last_flush = 0.0
+    while True:
+        _flush_wakeup.wait()
+        delay = FLUSH_INTERVAL_SEC - (time.monotonic() - last_flush)
+        if delay > 0:
+            _flush_urgent.wait(timeout=delay)
+        _flush_wakeup.clear()
+        _flush_urgent.clear()
+        try:
+            flush_state()
+        except OSError:
+            _event_logger.exception("state flush failed")
+        last_flush = time.monotonic()
+
+
+def _mark_dirty(*, immediate: bool):
+    global _dirty, _flush_thread
+    _dirty = True
+    if immediate:
+        _flush_urgent.set()
+    if _flush_thread is None:
+        _flush_thread = Thread(target=_flush_loop, name="state-flush", daemon=True)
+        _flush_thread.start()
+    _flush_wakeup.set()
+
+
+def add_change_listener(callback):
+    """Register a cheap, non-blocking callback invoked (under the state lock) on every commit or event."""
+    with _lock:
+        if callback not in _change_listeners:
+            _change_listeners.append(callback)
+
+
+def remove_change_listener(callback):
+    with _lock:
+        if callback in _change_listeners:
+            _change_listeners.remove(callback)
+
+
+def _notify_changed():
+    _state_changed.notify_all()
+    for callback in _change_listeners:
+        try:
+            callback()
+        except Exception:
+            _event_logger.exception("state change listener failed")
+
+
+def _commit(state: dict, patch: dict | None = None, merge: tuple[str, ...] = ()):
+    """Publish a new snapshot, bump the version and schedule a coalesced flush. Caller holds _lock."""
+    global _runtime_state, _state_version
+    previous = _runtime_state
+    if previous is None:
+        changes = dict(state)
+    else:
+        changes = {key: value for key, value in state.items() if key not in previous or previous[key] != value}
+        for key in previous.keys() - state.keys():
+            changes[key] = None
+    if _backend is not None:
+        # Explicitly patched keys are always written: the local cache may lag behind the shared row.
+        payload = {**(patch or {}), **changes}
+        payload.update({key: patch[key] for key in merge})
+        version, state, missed = _backend.commit(payload, _state_version, merge)
+        changes.update({key: state.get(key) for key in merge})
+        for entry in missed:
+            _history.append(entry)
+        _state_version = version
+        _ensure_backend_poller()
+    else:
+        _state_version += 1
+    _runtime_state = state
+    _history.append((_state_version, changes))
+    _notify_changed()
+    phase_changed = previous is None or previous.get("phase") != state.get("phase")
+    _mark_dirty(immediate=phase_changed)
+
+
 def load_state():
+    global _runtime_state, _state_version, _last_persisted
+    state = _runtime_state
+    if state is not None:
+        return dict(state)
+
     with _lock:
-        global _runtime_state
         if _runtime_state is not None:
             return dict(_runtime_state)
 
+        if _backend is not None:
+            shared = _backend.load()
+            if shared is not None:
+                _state_version, _runtime_state = shared
+                _ensure_backend_poller()
+                return dict(_runtime_state)
+
         default = _default_state()
 
         if not STATE_FILE.exists():
-            _runtime_state = dict(default)
-            save_state(_runtime_state)
+            _commit(dict(default))
             return dict(_runtime_state)
 
         try:
@@ -145,58 +339,78 @@ def load_state():
                 state[field] = loaded.get(field)
         if isinstance(loaded.get("timestamps"), list):
             state["timestamps"] = loaded["timestamps"]
-        _runtime_state = state
-
-        if _persisted_state(state) != loaded:
-            save_state(state)
+        _last_persisted = loaded
+        _commit(state)
 
         return dict(_runtime_state)
 
 
 def save_state(state: dict):
-    with _lock:
-        global _state_version
-        STATE_FILE.write_text(json.dumps(_persisted_state(state), indent=2, ensure_ascii=False), encoding="utf-8")
-        _state_version += 1
-        _state_changed.notify_all()
+    with _lock, metrics.stage("save_state"):
+        _commit(dict(state))
 
 
 def update_state(patch: dict):
-    with _lock:
+    with _lock, metrics.stage("update_state"):
         state = load_state()
         state.update(patch)
-        global _runtime_state
-        _runtime_state = dict(state)
-        save_state(state)
+        _commit(state, patch)
         return dict(_runtime_state)
 
 
-def append_event(
+def merge_state(key: str, entries: dict):
+    """Set entries of the dict at ``key`` one by one (None removes one), keeping the rest.
+
+    With a shared backend the merge happens in the database, so entries other workers
+    published in the meantime survive.
+    """
+    with _lock, metrics.stage("update_state"):
+        state = load_state()
+        state[key] = merge_entries(state.get(key), entries)
+        _commit(state, {key: entries}, merge=(key,))
+        return dict(_runtime_state)
+
+
+def make_event(
     message: str,
     *,
     event_type: str = "event",
     level: str = "info",
-    details: dict | None = None
-):
+    details: dict | None = None,
+    ts: str | None = None,
+) -> dict:
+    entry = {
+        "ts": ts or datetime.now(timezone.utc).isoformat(),
+        "type": event_type,
+        "level": level,
+        "message": message
+    }
+
+    if details:
+        entry["details"] = details
+    return entry
+
+
+def append_events(entries: list[dict]) -> list[dict]:
+    """Sequence and publish a batch of entries built by make_event under a single lock hold."""
+    global _event_seq
+    if not entries:
+        return entries
     with _lock:
-        state = load_state()
-        events = state.get("events", [])
-
-        entry = {
-            "ts": datetime.now(timezone.utc).isoformat(),
-            "type": event_type,
-            "level": level,
-            "message": message
-        }
-
-        if details:
-            entry["details"] = details
-
-        events.append(entry)
-        state["events"] = events[-300:]
-        global _runtime_state
-        _runtime_state = dict(state)
-        save_state(state)
+        if _backend is not None:
+            for entry in _backend.append_events(entries, _event_seq):
+                _events.append(entry)
+                _event_seq = entry["seq"]
+            _ensure_backend_poller()
+        else:
+            for entry in entries:
+                _event_seq += 1
+                entry["seq"] = _event_seq
+                _events.append(entry)
+        _notify_changed()
+
+    for entry in entries:
+        _event_journal.info(json.dumps(entry, ensure_ascii=False, default=str))
         log_level = entry["level"].upper()
         if log_level == "ERROR":
             _event_logger.error("[%s] %s", entry["type"], entry["message"])
@@ -204,12 +418,145 @@ def append_event(
             _event_logger.warning("[%s] %s", entry["type"], entry["message"])
         else:
             _event_logger.info("[%s] %s", entry["type"], entry["message"])
-        return entry
+    return entries
+
+
+def append_event(
+    message: str,
+    *,
+    event_type: str = "event",
+    level: str = "info",
+    details: dict | None = None
+):
+    entry = make_event(message, event_type=event_type, level=level, details=details)
+    append_events([entry])
+    return entry
+
+
+def get_events(after: int = 0, limit: int | None = None) -> dict:
+    with _lock:
+        buffered = list(_events)
+        last_seq = _event_seq
+    oldest_seq = buffered[0]["seq"] if buffered else last_seq + 1
+    events = [entry for entry in buffered if entry["seq"] > after]
+    if limit is not None and limit >= 0:
+        events = events[-limit:] if limit else []
+    return {
+        "events": events,
+        "last_seq": last_seq,
+        # The cursor fell out of the ring buffer; older entries are only in events.jsonl.
+        "truncated": after < oldest_seq - 1,
+    }
+
+
+def state_epoch() -> str:
+    """Namespace of state versions: per process in memory mode, shared with a backend."""
+    return "shared" if _backend is not None else _process_boot_id[:12]
+
+
+def get_event_seq() -> int:
+    return _event_seq
+
+
+def clear_events():
+    with _lock:
+        _events.clear()
+        _notify_changed()
+
+
+def _ensure_backend_poller():
+    global _backend_poller
+    if _backend is None or _backend_poller is not None:
+        return
+    _backend_poller = Thread(target=_poll_backend, name="state-backend-poll", daemon=True)
+    _backend_poller.start()
+
+
+def _poll_backend():
+    """Pull commits and events made by other worker processes into the local cache."""
+    global _runtime_state, _state_version, _event_seq
+    last_heartbeat = 0.0
+    while True:
+        time.sleep(BACKEND_POLL_SEC)
+        try:
+            version, seq = _backend.head()
+            if version > _state_version or seq > _event_seq:
+                with _lock:
+                    changed = False
+                    if version > _state_version:
+                        version, data, rows = _backend.changes_since(_state_version)
+                        if rows and rows[0][0] == _state_version + 1:
+                            _history.extend(rows)
+                        else:
+                            _history.append((version, dict(data)))
+                        _runtime_state = data
+                        _state_version = version
+                        changed = True
+                    if seq > _event_seq:
+                        for entry in _backend.events_since(_event_seq):
+                            _events.append(entry)
+                            _event_seq = entry["seq"]
+                        changed = True
+                    if changed:
+                        _notify_changed()
+            if _job_owned and time.monotonic() - last_heartbeat >= 2.0:
+                _backend.heartbeat(_process_boot_id)
+                last_heartbeat = time.monotonic()
+        except Exception:
+            _event_logger.exception("state backend poll failed")
+
+
+def claim_job(kind: str) -> bool:
+    """Take the cross-worker job lease. Always succeeds without a shared backend."""
+    global _job_owned
+    if _backend is None:
+        return True
+    if not _backend.claim_job(_process_boot_id, kind):
+        return False
+    _job_owned = True
+    _ensure_backend_poller()
+    return True
+
+
+def release_job():
+    global _job_owned
+    if _backend is None or not _job_owned:
+        return
+    _job_owned = False
+    _backend.release_job(_process_boot_id)
+
+
+def job_running_elsewhere() -> bool:
+    if _backend is None:
+        return False
+    owner = _backend.job_owner()
+    return owner is not None and owner["owner"] != _process_boot_id
 
 
 def get_state_version() -> int:
+    return _state_version
+
+
+def get_state_snapshot() -> tuple[int, dict]:
+    load_state()
     with _lock:
-        return _state_version
+        return _state_version, dict(_runtime_state)
+
+
+def get_state_delta(since_version: int) -> tuple[int, dict | None]:
+    """Merged top-level changes since ``since_version``, or None when the history no longer covers it."""
+    load_state()
+    with _lock:
+        version = _state_version
+        if since_version == version:
+            return version, {}
+        if since_version > version or not _history or _history[0][0] > since_version + 1:
+            return version, None
+        merged = {}
+        for entry_version, changes in _history:
+            if entry_version > since_version:
+                merged.update(changes)
+        return version, merged
 
 
 def wait_for_state_change(since_version: int, timeout_sec: float = 20.0) -> int:
@@ -218,3 +565,14 @@ def wait_for_state_change(since_version: int, timeout_sec: float = 20.0) -> int:
             return _state_version
         _state_changed.wait(timeout=timeout_sec)
         return _state_version
+
+
+def wait_for_change(since_version: int, since_event_seq: int, timeout_sec: float = 20.0) -> tuple[int, int]:
+    """Block until the state version or the event sequence moves past the given cursors."""
+    with _lock:
+        if _state_version <= since_version and _event_seq <= since_event_seq:
+            _state_changed.wait(timeout=timeout_sec)
+        return _state_version, _event_seq
+
+
+atexit.register(flush_state)
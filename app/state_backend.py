@@ -0,0 +1,239 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+BACKEND_ENV = "CLIMBTAG_STATE_BACKEND"
+DB_PATH_ENV = "CLIMBTAG_STATE_DB"
+JOB_LEASE_TTL_SEC = 10.0
+
+def merge_entries(current, entries: dict) -> dict:
+    """``current`` with each of ``entries`` set by key; a None value removes that key."""
+    merged = dict(current) if isinstance(current, dict) else {}
+    for name, value in entries.items():
+        if value is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = value
+    return merged
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    changes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    kind TEXT,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+class SQLiteStateBackend:
+    """Runtime state shared by several API worker processes through one SQLite file in WAL mode.
+
+    ``state`` holds the current snapshot and global version, ``changes`` is the notification
+    table (changed top-level keys per version) that other workers poll, ``events`` is the
+    shared event log and ``jobs`` is a heartbeat lease deciding which worker owns the
+    running download/analysis.
+    """
+
+    def __init__(self, path: Path, *, keep_changes: int = 1024, keep_events: int = 10000):
+        self.path = Path(path)
+        self.keep_changes = keep_changes
+        self.keep_events = keep_events
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def load(self) -> tuple[int, dict] | None:
+        row = self._conn().execute("SELECT version, data FROM state WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        return int(row[0]), json.loads(row[1])
+
+    def head(self) -> tuple[int, int]:
+        conn = self._conn()
+        row = conn.execute("SELECT version FROM state WHERE id = 1").fetchone()
+        # The AUTOINCREMENT counter, not MAX(seq): it survives pruning and seed_event_seq.
+        seq = conn.execute(
+            "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'events'), 0), "
+            "COALESCE((SELECT MAX(seq) FROM events), 0))"
+        ).fetchone()[0]
+        return (int(row[0]) if row else 0), int(seq)
+
+    def seed_event_seq(self, min_seq: int):
+        """Make the next event seq greater than ``min_seq`` (the last seq of the file journal)."""
+        def _apply(conn):
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('events', ?)", (min_seq,))
+            elif int(row[0]) < min_seq:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'events'", (min_seq,))
+
+        self._transaction(_apply)
+
+    def commit(
+        self, changes: dict, since_version: int, merge: tuple[str, ...] = ()
+    ) -> tuple[int, dict, list[tuple[int, dict]]]:
+        """Merge ``changes`` into the shared snapshot.
+
+        Keys in ``merge`` hold dicts that are updated entry by entry (see merge_entries),
+        so workers publishing different entries keep each other's. Returns the new version,
+        the merged snapshot and the change rows other workers committed after
+        ``since_version`` so the caller can keep its delta history complete.
+        """
+        def _apply(conn):
+            row = conn.execute("SELECT version, data FROM state WHERE id = 1").fetchone()
+            version, data = (int(row[0]), json.loads(row[1])) if row else (0, {})
+            missed = [
+                (int(v), json.loads(raw))
+                for v, raw in conn.execute(
+                    "SELECT version, changes FROM changes WHERE version > ? ORDER BY version", (since_version,)
+                )
+            ]
+            applied = {**changes, **{key: merge_entries(data.get(key), changes.get(key) or {}) for key in merge}}
+            data.update(applied)
+            version += 1
+            encoded = json.dumps(data, ensure_ascii=False, default=str)
+            conn.execute(
+                "INSERT INTO state (id, version, data) VALUES (1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET version = excluded.version, data = excluded.data",
+                (version, encoded),
+            )
+            conn.execute(
+                "INSERT INTO changes (version, changes) VALUES (?, ?)",
+                (version, json.dumps(applied, ensure_ascii=False, default=str)),
+            )
+            conn.execute("DELETE FROM changes WHERE version <= ?", (version - self.keep_changes,))
+            return version, data, missed
+
+        return self._transaction(_apply)
+
+    def changes_since(self, since_version: int) -> tuple[int, dict, list[tuple[int, dict]]]:
+        conn = self._conn()
+        row = conn.execute("SELECT version, data FROM state WHERE id = 1").fetchone()
+        if row is None:
+            return since_version, {}, []
+        rows = [
+            (int(v), json.loads(raw))
+            for v, raw in conn.execute(
+                "SELECT version, changes FROM changes WHERE version > ? AND version <= ? ORDER BY version",
+                (since_version, int(row[0])),
+            )
+        ]
+        return int(row[0]), json.loads(row[1]), rows
+
+    def append_events(self, entries: list[dict], since_seq: int) -> list[dict]:
+        """Insert entries (assigning their seq) and return every entry after ``since_seq``, in order."""
+        def _apply(conn):
+            for entry in entries:
+                entry.pop("seq", None)
+                cursor = conn.execute(
+                    "INSERT INTO events (entry) VALUES (?)",
+                    (json.dumps(entry, ensure_ascii=False, default=str),),
+                )
+                entry["seq"] = int(cursor.lastrowid)
+            own = {entry["seq"]: entry for entry in entries}
+            result = []
+            for seq, raw in conn.execute("SELECT seq, entry FROM events WHERE seq > ? ORDER BY seq", (since_seq,)):
+                if seq in own:
+                    result.append(own[seq])
+                else:
+                    item = json.loads(raw)
+                    item["seq"] = int(seq)
+                    result.append(item)
+            if entries:
+                conn.execute("DELETE FROM events WHERE seq <= ?", (entries[-1]["seq"] - self.keep_events,))
+            return result
+
+        return self._transaction(_apply)
+
+    def events_since(self, since_seq: int, limit: int = 1000) -> list[dict]:
+        result = []
+        for seq, raw in self._conn().execute(
+            "SELECT seq, entry FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (since_seq, limit)
+        ):
+            item = json.loads(raw)
+            item["seq"] = int(seq)
+            result.append(item)
+        return result
+
+    def claim_job(self, owner: str, kind: str, *, name: str = "pipeline") -> bool:
+        now = time.time()
+
+        def _apply(conn):
+            row = conn.execute("SELECT owner, heartbeat FROM jobs WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and now - float(row[1]) < JOB_LEASE_TTL_SEC:
+                return False
+            conn.execute(
+                "INSERT INTO jobs (name, owner, kind, pid, heartbeat) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, kind = excluded.kind, "
+                "pid = excluded.pid, heartbeat = excluded.heartbeat",
+                (name, owner, kind, os.getpid(), now),
+            )
+            return True
+
+        return self._transaction(_apply)
+
+    def heartbeat(self, owner: str, *, name: str = "pipeline"):
+        self._conn().execute(
+            "UPDATE jobs SET heartbeat = ? WHERE name = ? AND owner = ?", (time.time(), name, owner)
+        )
+
+    def release_job(self, owner: str, *, name: str = "pipeline"):
+        self._conn().execute("DELETE FROM jobs WHERE name = ? AND owner = ?", (name, owner))
+
+    def job_owner(self, *, name: str = "pipeline") -> dict | None:
+        row = self._conn().execute(
+            "SELECT owner, kind, pid, heartbeat FROM jobs WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None or time.time() - float(row[3]) >= JOB_LEASE_TTL_SEC:
+            return None
+        return {"owner": row[0], "kind": row[1], "pid": row[2], "heartbeat": row[3]}
+
+
+def create_backend(base_dir: Path) -> SQLiteStateBackend | None:
+    """Return the shared backend selected by CLIMBTAG_STATE_BACKEND, or None for in-process state."""
+    kind = os.environ.get(BACKEND_ENV, "memory").strip().lower()
+    if kind in {"", "memory"}:
+        return None
+    if kind != "sqlite":
+        raise RuntimeError(f"unknown {BACKEND_ENV}: {kind}")
+    path = Path(os.environ.get(DB_PATH_ENV) or base_dir / "state.db")
+    return SQLiteStateBackend(path)
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+from threading import Lock
+
+from app import growing, metrics
+from app.downloader import SIDECAR_SUFFIX
+
+BUDGET_ENV = "CLIMBTAG_STORAGE_BUDGET"
+# Files touched this recently may still be written or about to be picked up by a job.
+MIN_AGE_SEC = 600.0
+ACCESS_FLUSH_SEC = 30.0
+_BLOB_NAME = re.compile(r"^[0-9a-f]{64}$")
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(raw: str | None) -> int | None:
+    """``"50G"``, ``"512MB"``, ``"1073741824"`` -> bytes; empty or 0 means no budget."""
+    match = _SIZE.match(raw or "")
+    if match is None:
+        return None
+    value = int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+    return value or None
+
+
+def configured_budget() -> int | None:
+    return parse_size(os.environ.get(BUDGET_ENV))
+
+
+def _derived_from(name: str, protected: set[str]) -> bool:
+    # Converted, proxy, trim and remux outputs are named "<source stem>-..." / "<source stem>_...".
+    for other in protected:
+        stem = Path(other).stem
+        if name == other or name.startswith(f"{stem}-") or name.startswith(f"{stem}_"):
+            return True
+    return False
+
+
+class StorageManager:
+    """Byte budget over the video areas, evicting least-recently-used files.
+
+    Hardlinked names of one blob are a single unit: its bytes are freed only when every
+    name and the ``.objects`` blob go, so they are evicted together. Last use is the
+    newest of the recorded access time, mtime and ctime (linking a new name bumps ctime).
+    """
+
+    def __init__(self, areas: dict[str, Path], access_path: Path, *, blob_store=None, budget: int | None = None):
+        self.areas = {name: Path(root) for name, root in areas.items()}
+        self.access_path = Path(access_path)
+        self.blob_store = blob_store
+        self.budget = budget if budget is not None else configured_budget()
+        self.last_sweep: dict | None = None
+        self._lock = Lock()
+        self._sweep_lock = Lock()
+        self._access: dict[str, float] = {}
+        self._dirty = False
+        self._last_flush = 0.0
+
+    def _key(self, path: Path) -> str | None:
+        path = Path(path).resolve()
+        for area, root in self.areas.items():
+            if path.parent == root.resolve():
+                return f"{area}/{path.name}"
+        return None
+
+    def touch(self, path: Path):
+        """Record a read of ``path``; persisted at most every ACCESS_FLUSH_SEC."""
+        key = self._key(path)
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._access[key] = now
+            self._dirty = True
+            if now - self._last_flush >= ACCESS_FLUSH_SEC:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _read_access(self) -> dict[str, float]:
+        try:
+            return json.loads(self.access_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _flush_locked(self):
+        # Other API workers record into the same file: merge, newest wins.
+        merged = self._read_access()
+        for key, value in self._access.items():
+            merged[key] = max(value, merged.get(key, 0.0))
+        self.access_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.access_path.with_name(f".{self.access_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(merged), encoding="utf-8")
+        os.replace(tmp_path, self.access_path)
+        self._access = merged
+        self._dirty = False
+        self._last_flush = time.time()
+
+    def _candidates(self):
+        for area, root in self.areas.items():
+            if not root.is_dir():
+                continue
+            paths = [p for p in root.iterdir() if not p.name.startswith(".")]
+            if self.blob_store is not None and root == self.blob_store.root:
+                objects_dir = self.blob_store.objects_dir
+                if objects_dir.is_dir():
+                    paths += [p for p in objects_dir.iterdir() if _BLOB_NAME.match(p.name)]
+            for path in paths:
+                if path.name.endswith((growing.MARKER_SUFFIX, SIDECAR_SUFFIX)):
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                if path.is_file():
+                    yield area, path, st
+
+    def _units(self) -> list[dict]:
+        with self._lock:
+            access = {**self._read_access(), **self._access}
+        units: dict[tuple[int, int], dict] = {}
+        for area, path, st in self._candidates():
+            unit = units.setdefault(
+                (st.st_dev, st.st_ino),
+                {"paths": [], "size": st.st_size, "last_used": max(st.st_mtime, st.st_ctime)},
+            )
+            unit["paths"].append((area, path))
+            unit["last_used"] = max(unit["last_used"], access.get(f"{area}/{path.name}", 0.0))
+        return list(units.values())
+
+    def usage(self) -> dict:
+        areas = {name: {"files": 0, "bytes": 0} for name in self.areas}
+        used = 0
+        for unit in self._units():
+            used += unit["size"]
+            for area in {area for area, _ in unit["paths"]}:
+                areas[area]["files"] += 1
+                areas[area]["bytes"] += unit["size"]
+        return {"budget": self.budget, "used": used, "areas": areas, "last_sweep": self.last_sweep}
+
+    def sweep(self, protected: set[str], *, budget: int | None = None) -> list[dict]:
+        """Evict least-recently-used units until usage fits the budget.
+
+        ``protected`` are file names referenced by the state or a live job; they and every
+        file derived from them (converted copies, proxies, trims) are kept.
+        """
+        budget = budget if budget is not None else self.budget
+        if not budget:
+            return []
+        with self._sweep_lock:
+            self.flush()
+            units = self._units()
+            used = sum(unit["size"] for unit in units)
+            now = time.time()
+            evicted = []
+            for unit in sorted(units, key=lambda u: u["last_used"]):
+                if used <= budget:
+                    break
+                names = [path.name for _, path in unit["paths"]]
+                if now - unit["last_used"] < MIN_AGE_SEC or any(_derived_from(n, protected) for n in names):
+                    continue
+                if any(growing.is_growing(path) for _, path in unit["paths"]):
+                    continue
+                self._remove(unit)
+                used -= unit["size"]
+                evicted.append({"files": [f"{area}/{path.name}" for area, path in unit["paths"]], "bytes": unit["size"]})
+                metrics.inc("climbtag_storage_evicted_bytes_total", unit["size"])
+            self.last_sweep = {"at": now, "used": used, "budget": budget, "evicted": len(evicted)}
+            return evicted
+
+    def _remove(self, unit: dict):
+        store = self.blob_store
+        for _area, path in unit["paths"]:
+            if store is not None and path.parent == store.objects_dir:
+                store.drop(path.name)
+            elif store is not None and path.parent == store.root:
+                store.forget(path.name)
+            else:
+                path.unlink(missing_ok=True)
+            if path.suffix == ".part":
+                path.with_name(path.name + SIDECAR_SUFFIX).unlink(missing_ok=True)
+        with self._lock:
+            for area, path in unit["paths"]:
+                self._access.pop(f"{area}/{path.name}", None)
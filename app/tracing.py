@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_ENV = "CLIMBTAG_TRACE"
+
+
+class Tracer:
+    """Collects Chrome Trace Event Format records (loadable in chrome://tracing and Perfetto)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pid = os.getpid()
+        self.events: list[dict] = []
+        self._origin = time.perf_counter()
+        self._threads: dict[int, str] = {}
+
+    def _tid(self) -> int:
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def _us(self, perf_ts: float) -> float:
+        return round((perf_ts - self._origin) * 1_000_000, 3)
+
+    def complete(self, name: str, cat: str, started: float, duration: float, args: dict | None = None):
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": self._us(started),
+            "dur": round(duration * 1_000_000, 3),
+            "pid": self.pid,
+            "tid": self._tid(),
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def instant(self, name: str, cat: str, args: dict | None = None):
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "i",
+            "s": "t",
+            "ts": self._us(time.perf_counter()),
+            "pid": self.pid,
+            "tid": self._tid(),
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def write(self, path: Path) -> Path:
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.name}}]
+        metadata.extend(
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": thread_name}}
+            for tid, thread_name in self._threads.items()
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+        return path
+
+
+_active: Tracer | None = None
+
+
+def env_enabled() -> bool:
+    return os.environ.get(TRACE_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def start(name: str) -> Tracer:
+    global _active
+    _active = Tracer(name)
+    return _active
+
+
+def stop(path: Path) -> Path | None:
+    global _active
+    tracer, _active = _active, None
+    if tracer is None:
+        return None
+    return tracer.write(path)
+
+
+def active() -> bool:
+    return _active is not None
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", **args):
+    tracer = _active
+    if tracer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.complete(name, cat, started, time.perf_counter() - started, args or None)
+
+
+def record(name: str, duration: float, cat: str = "pipeline", **args):
+    """Record a span that has just ended and lasted ``duration`` seconds."""
+    tracer = _active
+    if tracer is None:
+        return
+    tracer.complete(name, cat, time.perf_counter() - duration, duration, args or None)
+
+
+def instant(name: str, cat: str = "pipeline", **args):
+    tracer = _active
+    if tracer is not None:
+        tracer.instant(name, cat, args or None)
@@ -0,0 +1,180 @@
+import bisect
+import shutil
+import subprocess
+from pathlib import Path
+
+from app import media_info, metrics
+
+TRIM_MODES = ("copy", "smart", "reencode")
+# Codecs the smart cut can re-encode boundary GOPs for and splice back in.
+SMART_CUT_CODECS = {"h264"}
+MAX_DURATION_DRIFT_SEC = 1.0
+# ffprobe profile names -> libx264 -profile:v, so the re-encoded edges carry the source's SPS profile.
+X264_PROFILES = {
+    "constrained baseline": "baseline",
+    "main": "main",
+    "high": "high",
+    "high 10": "high10",
+    "high 4:2:2": "high422",
+    "high 4:4:4 predictive": "high444",
+}
+
+
+def copy_start(keyframes: list[float], start: float) -> float:
+    """Last keyframe at or before ``start``: a stream copy has to begin there to keep every requested frame."""
+    pos = bisect.bisect_right(keyframes, start + 1e-3)
+    return keyframes[pos - 1] if pos else 0.0
+
+
+def smart_cut_plan(keyframes: list[float], start: float, end: float) -> list[tuple[str, float, float]]:
+    """Split [start, end) into re-encoded partial GOPs at the edges and a stream-copied middle.
+
+    Returns an empty plan when fewer than two keyframes fall inside the range (nothing to copy).
+    """
+    inside = [k for k in keyframes if start < k < end]
+    if len(inside) < 2:
+        return []
+    first, last = inside[0], inside[-1]
+    parts = [("encode", start, first), ("copy", first, last), ("encode", last, end)]
+    return [(mode, a, b) for mode, a, b in parts if b - a > 1e-3]
+
+
+def _sps_params(video: dict) -> tuple:
+    return (
+        str(video.get("profile") or "").lower(),
+        video.get("level"),
+        video.get("refs"),
+        video.get("width"),
+        video.get("height"),
+        video.get("pix_fmt"),
+    )
+
+
+def edge_codec(video: dict) -> list[str] | None:
+    """libx264 arguments reproducing the source's profile, level and reference count; None if they can't be."""
+    profile = X264_PROFILES.get(str(video.get("profile") or "").lower())
+    level = video.get("level")
+    if profile is None or not isinstance(level, int) or level < 10:
+        return None
+    args = ["-c:v", "libx264", "-preset", "veryfast", "-profile:v", profile, "-level:v", f"{level // 10}.{level % 10}"]
+    if video.get("refs"):
+        args += ["-refs", str(video["refs"])]
+    return args + ["-pix_fmt", video.get("pix_fmt") or "yuv420p"]
+
+
+def _run(cmd: list[str], check_cancel) -> bool:
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    try:
+        assert proc.stderr is not None
+        for _ in proc.stderr:
+            if check_cancel():
+                proc.kill()
+                raise InterruptedError("trim cancelled")
+    finally:
+        proc.wait()
+    return proc.returncode == 0
+
+
+def _output_ok(target_path: Path, expected_sec: float) -> bool:
+    try:
+        duration = media_info.probe(target_path).get("duration")
+    except (OSError, RuntimeError):
+        duration = None
+    if duration is not None and abs(duration - expected_sec) <= MAX_DURATION_DRIFT_SEC:
+        return True
+    target_path.unlink(missing_ok=True)
+    return False
+
+
+def _same_sps(part: Path, video: dict) -> bool:
+    try:
+        encoded = media_info.probe(part, cache=False).get("video") or {}
+    except (OSError, RuntimeError):
+        return False
+    return _sps_params(encoded) == _sps_params(video)
+
+
+def trim_copy(source_path: Path, target_path: Path, start: float, end: float, keyframes: list[float], *, check_cancel) -> bool:
+    """Cut without re-encoding; the result starts at the keyframe preceding ``start``."""
+    cut_start = copy_start(keyframes, start)
+    with metrics.stage("ffmpeg_trim_copy"):
+        ok = _run([
+            "ffmpeg", "-y",
+            "-ss", f"{cut_start:.6f}",
+            "-i", str(source_path),
+            "-t", f"{end - cut_start:.6f}",
+            "-map", "0:v:0", "-map", "0:a:0?", "-dn", "-sn",
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            str(target_path),
+        ], check_cancel)
+    return ok and _output_ok(target_path, end - cut_start)
+
+
+def trim_smart(
+    source_path: Path,
+    target_path: Path,
+    start: float,
+    end: float,
+    keyframes: list[float],
+    info: dict,
+    *,
+    check_cancel,
+    work_dir: Path,
+) -> bool:
+    """Frame-accurate cut that re-encodes only the partial GOPs at both ends.
+
+    Parts go through MPEG-TS so each keeps its own in-band SPS/PPS, then the joined
+    video is muxed with the audio of the whole range (re-encoded once, it is cheap).
+    The MP4 keeps one set of parameters for the whole track, so the edges are encoded
+    with the source's profile/level/refs and the cut is abandoned if their SPS still
+    differs from the copied middle.
+    """
+    video = info.get("video") or {}
+    plan = smart_cut_plan(keyframes, start, end)
+    encode = edge_codec(video)
+    if video.get("codec") not in SMART_CUT_CODECS or not plan or encode is None:
+        return False
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        parts = []
+        with metrics.stage("ffmpeg_trim_smart"):
+            for i, (mode, a, b) in enumerate(plan):
+                part = work_dir / f"part{i}.ts"
+                codec = ["-c:v", "copy"] if mode == "copy" else encode
+                ok = _run([
+                    "ffmpeg", "-y",
+                    "-ss", f"{a:.6f}",
+                    "-i", str(source_path),
+                    "-t", f"{b - a:.6f}",
+                    "-map", "0:v:0", "-an", "-dn", "-sn",
+                    *codec,
+                    "-bsf:v", "h264_mp4toannexb",
+                    "-f", "mpegts",
+                    str(part),
+                ], check_cancel)
+                if not ok:
+                    return False
+                if mode == "encode" and not _same_sps(part, video):
+                    return False
+                parts.append(part)
+
+            list_path = work_dir / "parts.txt"
+            list_path.write_text("".join(f"file '{p.name}'\n" for p in parts), encoding="utf-8")
+            cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_path)]
+            if info.get("audio") is not None:
+                cmd += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", str(source_path), "-map", "0:v:0", "-map", "1:a:0"]
+            cmd += ["-c:v", "copy", "-c:a", "aac", "-movflags", "+faststart", str(target_path)]
+            ok = _run(cmd, check_cancel)
+        return ok and _output_ok(target_path, end - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
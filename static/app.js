@@ -29,10 +29,14 @@ const trimToggle = document.getElementById("trimToggle");
 const trimFields = document.getElementById("trimFields");
 const trimStartInput = document.getElementById("trimStartInput");
 const trimEndInput = document.getElementById("trimEndInput");
+const trimModeInput = document.getElementById("trimModeInput");
 const frameIntervalInput = document.getElementById("frameIntervalInput");
 const confLimitInput = document.getElementById("confLimitInput");
 const sessionTimeoutInput = document.getElementById("sessionTimeoutInput");
 const phantomTimeoutInput = document.getElementById("phantomTimeoutInput");
+const analysisProxyInput = document.getElementById("analysisProxyInput");
+const samplingInput = document.getElementById("samplingInput");
+const streamAnalysisInput = document.getElementById("streamAnalysisInput");
 
 const statusMeta = document.getElementById("statusMeta");
 const spinnerWrap = document.getElementById("spinnerWrap");
@@ -78,10 +82,16 @@ let isStateLoading = false;
 let stateLoadFailures = 0;
 let stateEventSource = null;
 let sseRetryTimer = null;
+let eventLog = [];
+let lastEventSeq = 0;
+let stateVersion = null;
+// Versions are only comparable within one server epoch ("<epoch>:<version>" SSE ids).
+let stateEpoch = null;
 
 const ACTIVE_PHASES = new Set(["uploading", "downloading", "converting", "processing"]);
 const UI_CACHE_KEY = "video_app_v5_ui";
 const CSV_SIZE_CACHE_KEY = "video_app_v5_csv_sizes";
+const EVENT_LOG_LIMIT = 300;
 
 function normalizePhase(phase) {
     return String(phase || "idle").trim().toLowerCase();
@@ -243,7 +253,9 @@ function readSettingsFromUI() {
         frame_interval_sec: clampInt(frameIntervalInput.value, 3, 1, 30),
         conf_limit: clampInt(confLimitInput.value, 3, 1, 10),
         session_timeout_sec: clampInt(sessionTimeoutInput.value, 240, 10, 3600),
-        phantom_timeout_sec: clampInt(phantomTimeoutInput.value, 60, 5, 3600)
+        phantom_timeout_sec: clampInt(phantomTimeoutInput.value, 60, 5, 3600),
+        analysis_proxy: analysisProxyInput.checked,
+        sampling: samplingInput.value
     };
 }
 
@@ -260,6 +272,10 @@ function applySettingsFromState(state) {
     setValue(confLimitInput, settings.conf_limit ?? 3);
     setValue(sessionTimeoutInput, settings.session_timeout_sec ?? 240);
     setValue(phantomTimeoutInput, settings.phantom_timeout_sec ?? 60);
+    if (document.activeElement !== analysisProxyInput) {
+        analysisProxyInput.checked = Boolean(settings.analysis_proxy);
+    }
+    setValue(samplingInput, settings.sampling ?? "exact");
 }
 
 function getUIPrefs(state) {
@@ -440,6 +456,16 @@ function updateStatusMeta(state) {
         parts.push(`Операция: ${phase}`);
     }
 
+    const convertProgress = state.convert_progress;
+    if (ACTIVE_PHASES.has(phase) && convertProgress !== null && convertProgress !== undefined) {
+        parts.push(`Конвертация: ${Number(convertProgress)}%`);
+    }
+
+    const transferProgress = state.transfer_progress;
+    if (ACTIVE_PHASES.has(phase) && transferProgress !== null && transferProgress !== undefined) {
+        parts.push(`Загрузка: ${Number(transferProgress)}%`);
+    }
+
     const startedAt = Number(state.phase_started_at);
     if (ACTIVE_PHASES.has(phase) && Number.isFinite(startedAt) && startedAt > 0) {
         const elapsed = Math.max(0, (Date.now() / 1000) - startedAt);
@@ -606,12 +632,47 @@ function drawOverlay(state) {
     }
 }
 
-function renderEventLog(state) {
+function mergeEvents(batch) {
+    const incoming = Array.isArray(batch?.events) ? batch.events : [];
+    if (batch?.truncated || Number(batch?.last_seq) < lastEventSeq) {
+        eventLog = [];
+    }
+    for (const item of incoming) {
+        if (Number(item.seq) > lastEventSeq || !eventLog.length) {
+            eventLog.push(item);
+        }
+    }
+    if (eventLog.length > EVENT_LOG_LIMIT) {
+        eventLog = eventLog.slice(-EVENT_LOG_LIMIT);
+    }
+    const lastSeq = Number(batch?.last_seq);
+    if (Number.isFinite(lastSeq)) {
+        lastEventSeq = lastSeq;
+    }
+    renderEventLog();
+}
+
+async function loadEvents() {
+    const res = await fetch(`/events?after=${lastEventSeq}`, { cache: "no-store" });
+    if (!res.ok) {
+        throw new Error(`Events request failed: ${res.status}`);
+    }
+    mergeEvents(await res.json());
+}
+
+function renderStateLog(state) {
+    if (logsSelectionLocked) {
+        return;
+    }
+    stateLogBox.innerText = JSON.stringify(state, null, 2);
+}
+
+function renderEventLog() {
     if (logsSelectionLocked) {
         return;
     }
 
-    const events = Array.isArray(state.events) ? state.events : [];
+    const events = eventLog;
     if (!events.length) {
         eventLogBox.innerText = "Журнал событий пуст";
     } else {
@@ -626,9 +687,6 @@ function renderEventLog(state) {
         eventLogBox.innerText = lines.join("\n");
         eventLogBox.scrollTop = eventLogBox.scrollHeight;
     }
-
-    const { events: _events, ...stateWithoutEvents } = state;
-    stateLogBox.innerText = JSON.stringify(stateWithoutEvents, null, 2);
 }
 
 function renderState(state) {
@@ -641,7 +699,7 @@ function renderState(state) {
     syncVideoSource(state);
     renderSegments(state);
     drawOverlay(state);
-    renderEventLog(state);
+    renderStateLog(state);
 
     if (typeof state.results_text === "string" && document.activeElement !== resultsText) {
         resultsText.value = state.results_text;
@@ -670,6 +728,7 @@ async function loadState() {
         const state = await fetchState();
         stateLoadFailures = 0;
         renderState(state);
+        await loadEvents();
     } catch {
         stateLoadFailures += 1;
         if (stateLoadFailures >= 2) {
@@ -688,18 +747,50 @@ function connectStateStream() {
         stateEventSource.close();
     }
 
-    stateEventSource = new EventSource("/state/stream");
+    const params = new URLSearchParams({ after: String(lastEventSeq) });
+    if (stateVersion !== null && latestState) {
+        params.set("last_event_id", `${stateEpoch}:${stateVersion}`);
+    }
+    stateEventSource = new EventSource(`/state/stream?${params}`);
 
     stateEventSource.addEventListener("state", (event) => {
         try {
             const state = JSON.parse(event.data || "{}");
             stateLoadFailures = 0;
+            const cursor = String(event.lastEventId || "");
+            stateEpoch = cursor.slice(0, cursor.lastIndexOf(":"));
+            stateVersion = Number(cursor.slice(cursor.lastIndexOf(":") + 1));
             renderState(state);
         } catch {
             // ignore malformed event
         }
     });
 
+    stateEventSource.addEventListener("patch", (event) => {
+        try {
+            const patch = JSON.parse(event.data || "{}");
+            if (!latestState || stateVersion === null || patch.base > stateVersion) {
+                // Missed a delta: drop the cursor and reconnect for a full snapshot.
+                stateVersion = null;
+                connectStateStream();
+                return;
+            }
+            stateLoadFailures = 0;
+            stateVersion = patch.version;
+            renderState({ ...latestState, ...(patch.changes || {}) });
+        } catch {
+            // ignore malformed event
+        }
+    });
+
+    stateEventSource.addEventListener("log", (event) => {
+        try {
+            mergeEvents(JSON.parse(event.data || "{}"));
+        } catch {
+            // ignore malformed event
+        }
+    });
+
     stateEventSource.onerror = () => {
         if (stateEventSource) {
             stateEventSource.close();
@@ -782,10 +873,15 @@ fileInput.addEventListener("change", function () {
     setProgress(0);
 
     const formData = new FormData();
+    const streaming = streamAnalysisInput.checked;
+    if (streaming) {
+        // The server reads the body as it arrives: settings must come before the file.
+        formData.append("settings", JSON.stringify(readSettingsFromUI()));
+    }
     formData.append("file", file);
 
     const xhr = new XMLHttpRequest();
-    xhr.open("POST", "/upload", true);
+    xhr.open("POST", `/upload?size=${file.size}${streaming ? "&analyse=1" : ""}`, true);
 
     xhr.upload.onprogress = function (event) {
         if (event.lengthComputable) {
@@ -859,12 +955,17 @@ downloadBtn.addEventListener("click", async function () {
 
     try {
         const payload = { url };
+        if (streamAnalysisInput.checked) {
+            payload.analyse = true;
+            payload.settings = readSettingsFromUI();
+        }
         if (trimToggle.checked) {
             const startVal = clampInt(trimStartInput.value, 0, 0, 999999);
             const endVal = clampInt(trimEndInput.value, 0, 0, 999999);
             if (endVal > startVal) {
                 payload.start_time = startVal;
                 payload.end_time = endVal;
+                payload.trim_mode = trimModeInput.value;
             } else {
                 uploadStatus.innerText = "Конец должен быть больше начала";
                 return;
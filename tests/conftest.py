@@ -1,4 +1,29 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def _runtime_files(tmp_path, monkeypatch):
+    """Keep state.json, the logs and the ffprobe cache written by the app out of the repo tree."""
+    import logging
+
+    from app import main, media_info, state
+
+    monkeypatch.setattr(state, "STATE_FILE", tmp_path / "state.json")
+    monkeypatch.setattr(main, "LOG_DIR", tmp_path / "logs")
+    main.LOG_DIR.mkdir()
+    monkeypatch.setenv(media_info.CACHE_PATH_ENV, str(tmp_path / "media_info.json"))
+    handlers = []
+    for name in ("climbtag.events", "climbtag.events.jsonl", "climbtag.server"):
+        handler = logging.FileHandler(main.LOG_DIR / f"{name}.log", encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(handler)
+        monkeypatch.setattr(logging.getLogger(name), "handlers", [handler])
+    yield
+    state.flush_state()  # pending writes land in tmp_path, not in the real state.json
+    for handler in handlers:
+        handler.close()
@@ -1,10 +1,26 @@
 import os
+
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
 client = TestClient(app)
 
 
+def _isolated_storage(tmp_path, monkeypatch):
+    from app import main
+    from app.blob_store import BlobStore
+
+    uploads = tmp_path / "videos"
+    protocols = tmp_path / "protocols"
+    uploads.mkdir()
+    protocols.mkdir()
+    monkeypatch.setattr(main, "UPLOAD_DIR", uploads)
+    monkeypatch.setattr(main, "PROTOCOL_DIR", protocols)
+    monkeypatch.setattr(main, "_blob_store", BlobStore(uploads))
+    return main
+
+
 def test_health():
     response = client.get("/health")
     assert response.status_code == 200
@@ -17,7 +33,8 @@ def test_state():
     assert "video" in response.json()
 
 
-def test_upload_rejects_non_video(tmp_path):
+def test_upload_rejects_non_video(tmp_path, monkeypatch):
+    _isolated_storage(tmp_path, monkeypatch)
     test_file = tmp_path / "test.txt"
     test_file.write_text("hello")
 
@@ -29,3 +46,1180 @@ def test_upload_rejects_non_video(tmp_path):
 
     assert response.status_code == 400
     assert "error" in response.json()
+
+
+def test_metrics_endpoint_exposes_stage_histograms():
+    from app import metrics
+
+    metrics.observe_stage("decode", 0.02)
+    metrics.inc("climbtag_frames_total")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE climbtag_stage_seconds histogram" in body
+    assert 'climbtag_stage_seconds_bucket{stage="decode",le="0.025"}' in body
+    assert 'climbtag_stage_seconds_count{stage="decode"}' in body
+    assert "climbtag_frames_total" in body
+
+
+def test_metrics_snapshot_merge_and_summary():
+    from app import metrics
+
+    metrics.reset()
+    metrics.observe_stage("analysis", 2.0)
+    metrics.inc("climbtag_frames_total", 10)
+    data = metrics.snapshot()
+    metrics.merge(data)
+
+    summary = metrics.summarize(metrics.snapshot())
+    assert summary["frames"] == 20
+    assert summary["stages"]["analysis"]["count"] == 2
+    assert summary["fps"] == 5.0
+
+
+def test_trace_written_and_downloadable():
+    import json as _json
+
+    from app import metrics, tracing
+    from app.main import LOG_DIR
+
+    tracing.start("test pipeline")
+    with tracing.span("conversion", cat="convert"):
+        with metrics.stage("decode"):
+            pass
+    tracing.instant("marker")
+    trace_path = tracing.stop(LOG_DIR / "trace-test.json")
+    assert not tracing.active()
+
+    try:
+        data = _json.loads(trace_path.read_text(encoding="utf-8"))
+        names = {event["name"] for event in data["traceEvents"]}
+        assert {"conversion", "decode", "marker", "process_name"} <= names
+
+        response = client.get("/traces/trace-test.json")
+        assert response.status_code == 200
+        assert response.json()["traceEvents"]
+        assert client.get("/traces/backend.log").status_code == 404
+        assert any(item["file"] == "trace-test.json" for item in client.get("/traces").json()["traces"])
+    finally:
+        trace_path.unlink(missing_ok=True)
+
+
+def test_events_endpoint_is_cursor_based():
+    from app.state import append_event
+
+    entry = append_event("cursor probe", event_type="test")
+    response = client.get("/events", params={"after": entry["seq"] - 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["events"][0]["message"] == "cursor probe"
+    assert data["last_seq"] >= entry["seq"]
+    assert "events" not in client.get("/state").json()
+
+
+def test_broadcaster_drops_slow_subscribers():
+    import asyncio
+
+    from app.broadcast import SUBSCRIBER_QUEUE_SIZE, StateBroadcaster
+
+    async def scenario():
+        hub = StateBroadcaster()
+        slow, initial = hub.subscribe()
+        assert initial[0].startswith(b"id: ")
+        for _ in range(SUBSCRIBER_QUEUE_SIZE + 1):
+            hub._publish(b"event: ping\ndata: {}\n\n")
+        assert slow.dropped
+        assert hub.subscriber_count == 0
+        frames = [frame async for frame in hub.stream(slow, [])]
+        assert frames == []
+
+    asyncio.run(scenario())
+
+
+def test_state_stream_cursor_is_scoped_to_the_server_epoch():
+    import asyncio
+
+    from app import broadcast, state
+
+    async def scenario():
+        hub = broadcast.StateBroadcaster()
+        version, _ = state.get_state_snapshot()
+        state.update_state({"results_text": "epoch check"})
+        cursor = f"{state.state_epoch()}:{version}"
+        assert broadcast.parse_cursor(cursor) == version
+        _, frames = hub.subscribe(broadcast.parse_cursor(cursor))
+        assert b"event: patch" in frames[0] and frames[0].startswith(f"id: {state.state_epoch()}:".encode())
+
+        # A cursor handed out by a previous process (or a bare version) gets a full snapshot.
+        assert broadcast.parse_cursor(f"0123456789ab:{version}") is None
+        _, frames = hub.subscribe(broadcast.parse_cursor(str(version)))
+        assert b"event: state" in frames[0]
+
+    asyncio.run(scenario())
+    state.update_state({"results_text": ""})
+
+
+def test_state_reads_reuse_reconciliation_until_state_changes(monkeypatch):
+    import app.main as main_module
+
+    calls = []
+    original = main_module._reconcile_uncached
+
+    def counting(worker_active):
+        calls.append(worker_active)
+        return original(worker_active)
+
+    monkeypatch.setattr(main_module, "_reconcile_uncached", counting)
+    client.get("/state")
+    client.get("/state")
+    client.get("/state")
+    assert len(calls) <= 1
+
+    calls.clear()
+    # Progress ticks do not touch anything the reconcile step checks.
+    main_module.update_state({"progress": 1})
+    client.get("/state")
+    assert calls == []
+    main_module.update_state({"progress": 0, "protocol_csv": None, "video": "gone.mp4"})
+    client.get("/state")
+    assert len(calls) == 1
+    assert client.get("/state").json()["video"] is None
+    calls.clear()
+    main_module._fs_generation += 1
+    client.get("/state")
+    assert len(calls) == 1
+
+
+def test_state_reads_use_the_polled_job_lease(monkeypatch):
+    import threading
+
+    import app.main as main_module
+
+    lease_queries = []
+
+    def counting_lease():
+        if threading.current_thread().name != "fs-watch":
+            lease_queries.append(1)
+        return False
+
+    monkeypatch.setattr(main_module, "job_running_elsewhere", counting_lease)
+    client.get("/state")
+    lease_queries.clear()
+    for _ in range(3):
+        client.get("/state")
+    assert lease_queries == []
+
+    # A lease change seen by the poller invalidates the cached reconciliation.
+    calls = []
+    original = main_module._reconcile_uncached
+    monkeypatch.setattr(main_module, "_reconcile_uncached", lambda active: calls.append(active) or original(active))
+    monkeypatch.setattr(main_module, "_lease_elsewhere", True)
+    client.get("/state")
+    assert calls == [True]
+
+
+def test_request_events_are_logged_off_the_request_path():
+    from app import request_log
+    from app.state import get_events, get_event_seq
+
+    before = get_event_seq()
+    response = client.post("/protocol/clear")
+    assert response.status_code in (200, 409)
+    assert request_log.drain()
+
+    messages = [entry["message"] for entry in get_events(before)["events"]]
+    assert "POST /protocol/clear started" in messages
+    assert any(message.startswith("POST /protocol/clear -> ") for message in messages)
+
+
+def test_request_log_samples_high_frequency_paths():
+    from app import request_log
+
+    request_log._sample_counters.clear()
+    kept = sum(request_log.should_log("/video/clip.mp4") for _ in range(100))
+    assert kept == 100 // request_log.SAMPLE_EVERY["/video/"]
+    assert request_log.should_log("/download")
+
+
+def test_worker_channel_coalesces_patches_and_flushes_phase_changes():
+    import multiprocessing as mp
+    import queue as queue_module
+
+    from app.ipc import SharedProgress, WorkerChannel
+
+    sink = queue_module.Queue()
+    shared = SharedProgress(mp.get_context("spawn"))
+    channel = WorkerChannel(sink, shared, interval=3600)
+
+    channel.patch({"phase": "processing", "progress": 0})
+    for i in range(1, 101):
+        channel.progress(i)
+        channel.frame(i)
+        channel.patch({"results_text": f"line {i}"})
+    channel.event("Analysis progress: 50%")
+    assert shared.read() == (100, 100)
+
+    channel.send({"type": "final"})
+    messages = []
+    while not sink.empty():
+        messages.append(sink.get_nowait())
+
+    assert [m["type"] for m in messages] == ["batch", "batch", "final"]
+    assert messages[0]["patch"] == {"phase": "processing", "progress": 0}
+    assert messages[1]["patch"] == {"results_text": "line 100"}
+    assert messages[1]["events"][0]["message"] == "Analysis progress: 50%"
+
+
+def test_job_scheduler_respects_cpu_budget_priority_and_dependencies():
+    import threading
+    import time
+
+    from app.jobs import JobScheduler
+
+    release = threading.Event()
+    started: list[str] = []
+
+    def _runner(job, scheduler):
+        started.append(job.params["name"])
+        release.wait(5)
+        return {"video": job.params["name"]}
+
+    scheduler = JobScheduler({"convert": _runner, "analyse": _runner}, budget=3)
+    first = scheduler.submit("convert", {"name": "a"}, cost=2)
+    low = scheduler.submit("analyse", {"name": "low"}, cost=2)
+    high = scheduler.submit("analyse", {"name": "high"}, cost=2, priority=5)
+    child = scheduler.submit("analyse", {"name": "child"}, cost=1, depends_on=first.id)
+
+    assert started == ["a"]
+    assert scheduler.in_use == 2
+    release.set()
+    deadline = time.monotonic() + 5
+    while any(scheduler.get(j.id).status != "done" for j in (first, low, high, child)):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert started.index("high") < started.index("low")
+    assert "child" in started
+    assert scheduler.in_use == 0
+
+
+def test_job_scheduler_charges_the_pipeline_and_keeps_needed_dependencies(monkeypatch):
+    import time
+
+    from app import jobs
+    from app.jobs import JobScheduler
+
+    monkeypatch.setattr(jobs, "KEEP_FINISHED", 0)
+    scheduler = JobScheduler({"convert": lambda job, s: {"video": "a.mp4"}, "analyse": lambda job, s: None}, budget=2)
+    first = scheduler.submit("convert", cost=1)
+    deadline = time.monotonic() + 5
+    while scheduler.get(first.id).status != "done":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    snapshot = scheduler.list()[0]
+    assert snapshot["result"] == {"video": "a.mp4"} and snapshot["result"] is not first.result
+
+    scheduler.reserve("pipeline", 2)
+    child = scheduler.submit("analyse", cost=1, depends_on=first.id)
+    other = scheduler.submit("convert", cost=1)
+    assert child.status == "queued" and other.status == "queued"
+    # "other" finishing trims finished jobs, but "first" is still the input of "child".
+    scheduler.cancel(other.id)
+    assert scheduler.get(first.id) is not None
+    assert scheduler.dependency_result(child) == {"video": "a.mp4"}
+
+    scheduler.release("pipeline")
+    while scheduler.get(child.id) is not None and scheduler.get(child.id).status != "done":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert scheduler.in_use == 0
+
+
+def test_jobs_endpoint_chains_batches_and_fails_dependents():
+    response = client.post("/jobs", json={"kind": "download"})
+    assert response.status_code == 400
+
+    # A bad entry rejects the whole batch before any job is queued.
+    before = len(client.get("/jobs").json()["jobs"])
+    response = client.post("/jobs", json={"jobs": [
+        {"kind": "convert", "video": "missing.mp4"},
+        {"kind": "convert", "video": "missing.mp4", "depends_on": 5},
+    ]})
+    assert response.status_code == 400
+    assert len(client.get("/jobs").json()["jobs"]) == before
+
+    response = client.post("/jobs", json={"jobs": [
+        {"kind": "analyse", "video": "missing.mp4", "cost": 999, "priority": 1},
+        {"kind": "convert", "video": "missing.mp4", "depends_on": 0},
+    ]})
+    assert response.status_code == 200
+    jobs = response.json()["jobs"]
+    assert jobs[1]["depends_on"] == jobs[0]["id"]
+
+    listed = client.get("/jobs").json()
+    assert {job["id"] for job in jobs} <= {job["id"] for job in listed["jobs"]}
+    assert client.get("/jobs/nope").status_code == 404
+
+    import time
+
+    deadline = time.monotonic() + 5
+    while client.get(f"/jobs/{jobs[1]['id']}").json()["status"] != "error":
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert client.get(f"/jobs/{jobs[0]['id']}").json()["error"].startswith("source video not found")
+    assert client.post(f"/jobs/{jobs[1]['id']}/cancel").status_code == 409
+
+
+def test_full_hash_runs_in_the_calling_process_and_skips_growing_files(tmp_path, monkeypatch):
+    from app import fingerprint, growing, processing
+
+    monkeypatch.setenv(fingerprint.FULL_HASH_ENV, "1")
+    video = tmp_path / "race.mp4"
+    video.write_bytes(b"frames" * 1000)
+    live = tmp_path / "live.mp4"
+    live.write_bytes(b"head")
+    growing.begin(live)
+
+    processing.queue_full_hash(video, tmp_path / "converted")
+    processing.queue_full_hash(live, tmp_path / "converted")
+    fingerprint._hash_queue.join()
+    index = fingerprint.get_index(tmp_path / "converted" / processing.CONVERSION_INDEX_NAME)
+    assert index.cached_sha256(video) == fingerprint.sha256_file(video)
+    assert index.cached_sha256(live) is None
+
+
+def test_batch_cli_streams_results_and_skips_processed_hashes(tmp_path, monkeypatch):
+    import json
+    from pathlib import Path
+
+    from app import batch
+
+    videos = tmp_path / "videos"
+    videos.mkdir()
+    (videos / "a.mp4").write_bytes(b"route a")
+    (videos / "b.mov").write_bytes(b"route b")
+    (videos / "copy-of-a.mp4").write_bytes(b"route a")
+    (videos / "notes.txt").write_text("ignored")
+    protocol = tmp_path / "protocol.csv"
+    protocol.write_text("num,name\n1,Ann\n")
+
+    calls = []
+
+    def _fake_process(task, converted_dir, model_path, settings):
+        calls.append(Path(task["video"]).name)
+        return {
+            "video": Path(task["video"]).name,
+            "fingerprint": task["fingerprint"],
+            "sha256": f"sha-of-{Path(task['video']).name}",
+            "protocol_sha256": task["protocol_sha256"],
+            "status": "done",
+            "timestamps": [{"time": 1.0, "label": "#1 Ann"}],
+        }
+
+    monkeypatch.setattr(batch, "process_video", _fake_process)
+    output = tmp_path / "results.jsonl"
+    args = [str(videos), "--protocol", str(protocol), "--output", str(output), "--csv", str(tmp_path / "r.csv"), "--workers", "1"]
+
+    assert batch.main(args) == 0
+    assert sorted(calls) == ["a.mp4", "b.mov"]
+    assert len(output.read_text().splitlines()) == 2
+    assert (tmp_path / "r.csv").read_text().splitlines()[0] == "video,sha256,time,label"
+
+    calls.clear()
+    assert batch.main(args) == 0
+    assert calls == []
+    assert json.loads(output.read_text().splitlines()[0])["status"] == "done"
+
+
+def test_conversion_plan_prefers_stream_copy_and_falls_back(tmp_path, monkeypatch):
+    from app import processing
+
+    def _info(vcodec, acodec=None, pix_fmt="yuv420p"):
+        streams = [{"codec_type": "video", "codec_name": vcodec, "pix_fmt": pix_fmt}]
+        if acodec:
+            streams.append({"codec_type": "audio", "codec_name": acodec})
+        return {"streams": streams}
+
+    assert processing.plan_conversion(_info("h264", "aac")) == "copy"
+    assert processing.plan_conversion(_info("h264")) == "copy"
+    assert processing.plan_conversion(_info("h264", "pcm_s16le")) == "copy_video"
+    assert processing.plan_conversion(_info("h264", "aac", pix_fmt="yuv422p10le")) == "transcode"
+    assert processing.plan_conversion(_info("mpeg2video", "mp2")) == "transcode"
+
+    source = tmp_path / "broadcast.mkv"
+    source.write_bytes(b"mkv")
+    modes = []
+
+    def _fake_ffmpeg(src, target, mode, **kwargs):
+        modes.append(mode)
+        if mode == "transcode":
+            target.write_bytes(b"mp4")
+            return True
+        return False
+
+    monkeypatch.setattr(processing, "_ffprobe_duration", lambda path: 10.0)
+    monkeypatch.setattr(processing, "_ffprobe_stream_info", lambda path: _info("h264", "aac"))
+    monkeypatch.setattr(processing, "run_ffmpeg_conversion", _fake_ffmpeg)
+    events = []
+    target = processing.convert_for_web(
+        source, tmp_path / "out", check_cancel=lambda: False, progress_cb=lambda p: None, event_cb=events.append
+    )
+    assert modes == ["copy", "transcode"]
+    assert target.exists()
+    assert events[0].startswith("Remuxing (stream copy)")
+
+
+def test_conversion_cache_hit_uses_index_without_rehashing(tmp_path, monkeypatch):
+    from app import fingerprint, processing
+
+    source = tmp_path / "season.mkv"
+    source.write_bytes(b"x" * (fingerprint.SAMPLE_COUNT * fingerprint.SAMPLE_SIZE + 12345))
+    reads, probes, encodes = [], [], []
+    real_quick = fingerprint.quick_fingerprint
+
+    def _counting_quick(path, size=None):
+        reads.append(path)
+        return real_quick(path, size)
+
+    def _fake_ffmpeg(src, target, mode, **kwargs):
+        encodes.append(mode)
+        target.write_bytes(b"mp4")
+        return True
+
+    monkeypatch.setattr(fingerprint, "quick_fingerprint", _counting_quick)
+    monkeypatch.setattr(processing, "_ffprobe_duration", lambda path: probes.append(path) or 10.0)
+    monkeypatch.setattr(processing, "_ffprobe_stream_info", lambda path: {"streams": []})
+    monkeypatch.setattr(processing, "run_ffmpeg_conversion", _fake_ffmpeg)
+
+    kwargs = {"check_cancel": lambda: False, "progress_cb": lambda p: None, "event_cb": lambda m: None}
+    first = processing.convert_for_web(source, tmp_path / "out", **kwargs)
+    assert (len(reads), len(encodes)) == (1, 1)
+
+    probes.clear()
+    second = processing.convert_for_web(source, tmp_path / "out", **kwargs)
+    assert second == first
+    assert (len(reads), len(encodes), len(probes)) == (1, 1, 0)
+
+    index = fingerprint.get_index(tmp_path / "out" / processing.CONVERSION_INDEX_NAME)
+    assert index.sha256(source) == fingerprint.sha256_file(source)
+
+
+def test_reupload_is_deduplicated_without_reprobing(tmp_path, monkeypatch):
+    main = _isolated_storage(tmp_path, monkeypatch)
+    probes = []
+    info = {"duration": 12.5, "raw": {"format": {}, "streams": []}}
+    monkeypatch.setattr(main, "probe_video_file", lambda path: probes.append(path) or info)
+    payload = os.urandom(4096)
+
+    first = client.post("/upload", files={"file": ("dedup-a.mp4", payload, "video/mp4")}).json()
+    second = client.post("/upload", files={"file": ("dedup-b.mp4", payload, "video/mp4")}).json()
+
+    assert first["sha256"] == second["sha256"]
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert len(probes) == 1
+    a, b = main.UPLOAD_DIR / "dedup-a.mp4", main.UPLOAD_DIR / "dedup-b.mp4"
+    assert os.path.samefile(a, b)
+    assert main._blob_store.lookup(first["sha256"])["probe"] == info
+    assert main.media_info.probe(b) == info
+    assert not list(main._blob_store.objects_dir.glob("tmp-*"))
+
+
+def test_media_info_probes_once_and_persists_cache(tmp_path, monkeypatch):
+    import json
+    import subprocess
+
+    from app import media_info
+
+    monkeypatch.setenv(media_info.CACHE_PATH_ENV, str(tmp_path / "media_info.json"))
+    monkeypatch.setattr(media_info, "_cache", {})
+    monkeypatch.setattr(media_info, "_loaded_mtime", None)
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    calls = []
+    probe_json = json.dumps({
+        "format": {"duration": "42.5", "format_name": "mov,mp4"},
+        "streams": [{"codec_type": "video", "codec_name": "h264", "avg_frame_rate": "30000/1001", "pix_fmt": "yuv420p"}],
+    })
+
+    def _fake_run(cmd):
+        calls.append(cmd)
+        if "packet=pts_time,flags" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, "0.000,K_\n0.033,__\n2.002,K_\n4.004,K_\n", "")
+        return subprocess.CompletedProcess(cmd, 0, probe_json, "")
+
+    monkeypatch.setattr(media_info, "_run", _fake_run)
+    assert media_info.duration(video) == 42.5
+    assert media_info.probe(video)["video"]["fps"] == 29.97
+    assert len(calls) == 1
+    # Callers get a copy: changing it must not leak into the cache.
+    media_info.probe(video)["video"]["fps"] = 0
+    assert media_info.probe(video)["video"]["fps"] == 29.97
+
+    # A fresh process reads the persisted entry instead of spawning ffprobe.
+    monkeypatch.setattr(media_info, "_cache", {})
+    monkeypatch.setattr(media_info, "_loaded_mtime", None)
+    assert media_info.probe(video)["duration"] == 42.5
+    assert len(calls) == 1
+
+    assert media_info.keyframes(video) == [0.0, 2.002, 4.004]
+    assert media_info.keyframes(video) == [0.0, 2.002, 4.004]
+    assert len(calls) == 2
+    assert media_info.probe(video)["gop_sec"] == 2.002
+
+    video.write_bytes(b"changed video")
+    media_info.probe(video)
+    assert len(calls) == 3
+
+
+def test_media_info_reports_missing_ffprobe(tmp_path, monkeypatch):
+    from app import media_info
+
+    monkeypatch.setenv(media_info.CACHE_PATH_ENV, str(tmp_path / "media_info.json"))
+    monkeypatch.setenv("PATH", str(tmp_path))
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    try:
+        media_info.probe(video)
+    except RuntimeError as exc:
+        assert "not installed" in str(exc)
+    else:
+        raise AssertionError("probe should fail without ffprobe")
+
+
+def test_segment_plan_cuts_on_keyframes():
+    from app.parallel_encode import plan_segments
+
+    keyframes = [float(t) for t in range(0, 600, 4)]
+    segments = plan_segments(keyframes, 598.0, 4)
+    assert len(segments) == 4
+    assert segments[0][0] == 0.0 and segments[-1][1] == 598.0
+    assert all(start in keyframes for start, _end in segments)
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+    assert plan_segments(keyframes, 90.0, 4) == [(0.0, 90.0)]
+
+
+def test_segmented_encode_cancel_kills_every_child(tmp_path, monkeypatch):
+    import subprocess
+    import sys
+
+    from app import parallel_encode
+
+    spawned = []
+    real_popen = subprocess.Popen
+
+    def _sleeping_popen(cmd, **kwargs):
+        proc = real_popen([sys.executable, "-c", "import time; time.sleep(30)"], **kwargs)
+        spawned.append(proc)
+        return proc
+
+    monkeypatch.setattr(parallel_encode.subprocess, "Popen", _sleeping_popen)
+    polls = []
+
+    def _cancel_on_second_poll():
+        polls.append(1)
+        return len(polls) > 1
+
+    try:
+        parallel_encode.encode_segmented(
+            tmp_path / "src.mkv",
+            tmp_path / "out.mp4",
+            [(0.0, 100.0), (100.0, 200.0), (200.0, 300.0)],
+            duration=300.0,
+            has_audio=True,
+            check_cancel=_cancel_on_second_poll,
+            progress_cb=lambda p: None,
+            work_dir=tmp_path / "work",
+        )
+    except InterruptedError:
+        pass
+    else:
+        raise AssertionError("expected cancellation")
+
+    assert len(spawned) == 4
+    assert all(proc.returncode is not None for proc in spawned)
+    assert not (tmp_path / "work").exists()
+
+
+def test_analysis_proxy_is_built_once_and_keeps_timeline(tmp_path, monkeypatch):
+    from app import processing
+
+    source = tmp_path / "final-4k.mp4"
+    source.write_bytes(b"4k source")
+    builds = []
+    durations = {"final-4k.mp4": 300.0}
+
+    def _fake_ffmpeg(src, target, mode, **kwargs):
+        builds.append(mode)
+        target.write_bytes(b"proxy")
+        durations[target.name] = durations.pop("next", 300.2)
+        return True
+
+    monkeypatch.setattr(processing, "run_ffmpeg_conversion", _fake_ffmpeg)
+    monkeypatch.setattr(processing, "_ffprobe_duration", lambda path: durations[path.name])
+    kwargs = {"check_cancel": lambda: False, "progress_cb": lambda p: None, "event_cb": lambda m: None}
+
+    assert processing.select_analysis_input(source, source, tmp_path / "proxy", {}, **kwargs) == source
+    proxy = processing.select_analysis_input(source, source, tmp_path / "proxy", {"analysis_proxy": True}, **kwargs)
+    assert proxy != source and proxy.name.endswith(f"-{processing.proxy_height()}p.mp4")
+    again = processing.select_analysis_input(source, source, tmp_path / "proxy", {"analysis_proxy": True}, **kwargs)
+    assert again == proxy
+    assert builds == ["proxy"]
+
+    other = tmp_path / "drifting.mp4"
+    other.write_bytes(b"other source")
+    durations["drifting.mp4"] = 300.0
+    durations["next"] = 250.0
+    assert processing.select_analysis_input(other, other, tmp_path / "proxy", {"analysis_proxy": True}, **kwargs) == other
+
+
+def test_analysis_runs_while_conversion_reports_separately(tmp_path, monkeypatch):
+    import multiprocessing as mp
+    import queue as queue_module
+    import threading
+
+    from app import main
+    from app.ipc import SharedProgress, WorkerChannel
+
+    source = tmp_path / "final.mkv"
+    source.write_bytes(b"mkv")
+    converted = tmp_path / "final.mp4"
+    converting = threading.Event()
+    analysed = threading.Event()
+    stopped = []
+
+    def _fake_convert(src, out_dir, *, check_cancel, progress_cb, event_cb):
+        progress_cb(50)
+        converting.set()
+        while not analysed.is_set():
+            if check_cancel():
+                stopped.append(src.name)
+                raise main.CancelledError("cancelled during conversion")
+            analysed.wait(0.01)
+        converted.write_bytes(b"mp4")
+        return converted, True
+
+    monkeypatch.setattr(main, "ensure_playable_input", _fake_convert)
+    shared = SharedProgress(mp.get_context("spawn"))
+    channel = WorkerChannel(queue_module.Queue(), shared, interval=3600)
+    cancel_event = threading.Event()
+    seen = {}
+
+    def _analyse(video_path):
+        assert converting.wait(5)
+        seen["input"] = video_path
+        seen["convert"] = shared.read_convert()
+        analysed.set()
+        return {"timestamps": []}
+
+    analysis, playable, was_converted = main._analyse_during_conversion(source, {}, channel, cancel_event, _analyse)
+    assert analysis == {"timestamps": []}
+    assert (playable, was_converted) == (converted, True)
+    assert seen == {"input": source, "convert": 50}
+    assert shared.read_convert() is None
+
+    converting.clear()
+    analysed.clear()
+
+    def _fail(video_path):
+        assert converting.wait(5)
+        raise main.ProcessingError("detector crashed")
+
+    with pytest.raises(main.ProcessingError):
+        main._analyse_during_conversion(source, {}, channel, cancel_event, _fail)
+    assert stopped == ["final.mkv"]
+
+    def _broken_convert(src, out_dir, **kwargs):
+        raise RuntimeError("ffmpeg exited with 1")
+
+    monkeypatch.setattr(main, "ensure_playable_input", _broken_convert)
+    analysis, playable, was_converted = main._analyse_during_conversion(
+        source, {}, channel, cancel_event, lambda path: {"timestamps": [{"time": 1}]}
+    )
+    assert analysis == {"timestamps": [{"time": 1}]}
+    assert (playable, was_converted) == (source, False)
+
+
+def test_tail_chunks_follow_a_growing_file_until_the_marker_goes(tmp_path):
+    import threading
+    import time
+
+    from app import growing
+
+    path = tmp_path / "live.ts"
+    path.write_bytes(b"")
+    growing.begin(path, expected=6)
+    assert growing.is_growing(path) and growing.expected_size(path) == 6
+
+    def _transfer():
+        for part in (b"ab", b"cd", b"ef"):
+            time.sleep(0.05)
+            with path.open("ab") as fh:
+                fh.write(part)
+        growing.finish(path)
+
+    writer = threading.Thread(target=_transfer)
+    writer.start()
+    progress = []
+    data = b"".join(growing.tail_chunks(path, check_cancel=lambda: False, poll_sec=0.01, progress_cb=progress.append))
+    writer.join()
+    assert data == b"abcdef"
+    assert progress and progress[-1] == 99
+    assert not growing.is_growing(path)
+
+    aborted = tmp_path / "aborted.ts"
+    aborted.write_bytes(b"partial")
+    with pytest.raises(RuntimeError):
+        with growing.arriving(aborted):
+            raise RuntimeError("connection reset")
+    assert not aborted.exists() and not growing.marker_path(aborted).exists()
+    with pytest.raises(growing.TransferAborted):
+        growing.wait_complete(aborted, check_cancel=lambda: False)
+
+
+def test_streaming_upload_starts_analysis_before_the_body_ends(tmp_path, monkeypatch):
+    import asyncio
+
+    from app import growing
+
+    main = _isolated_storage(tmp_path, monkeypatch)
+    protocol = main.PROTOCOL_DIR / "stream-protocol.csv"
+    protocol.write_text("num,name\n1,Climber\n", encoding="utf-8")
+    main.update_state({"protocol_csv": protocol.name})
+    launched = []
+
+    def _fake_launch(path, protocol_path, settings, *, trace=False):
+        launched.append((path.name, growing.is_growing(path), growing.expected_size(path), settings["frame_interval_sec"]))
+
+    monkeypatch.setattr(main, "_launch_pipeline", _fake_launch)
+    monkeypatch.setattr(main, "probe_video_file", lambda path: {"duration": 1.0, "raw": {"format": {}, "streams": []}})
+
+    payload = os.urandom(256 * 1024)
+    boundary = "climbtagboundary"
+    head = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"settings\"\r\n\r\n"
+        '{"frame_interval_sec": 7}\r\n'
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"live-final.mp4\"\r\n"
+        "Content-Type: video/mp4\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    bodies = [head + payload[:1000], payload[1000:] + tail]
+    seen_before_end = []
+    messages = []
+
+    async def receive():
+        if not bodies:
+            await asyncio.sleep(3600)
+        if len(bodies) == 1:
+            # The second half is held back until the handler has started the analysis.
+            for _ in range(200):
+                if launched:
+                    break
+                await asyncio.sleep(0.01)
+            seen_before_end.append(list(launched))
+            path = main.UPLOAD_DIR / "live-final.mp4"
+            seen_before_end.append(path.stat().st_size)
+        body = bodies.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(bodies)}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/upload", "raw_path": b"/upload", "root_path": "",
+        "query_string": f"analyse=1&size={len(payload)}".encode(),
+        "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode()), (b"host", b"test")],
+        "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+    asyncio.run(main.app(scope, receive, send))
+
+    assert messages[0]["status"] == 200
+    # The pipeline was launched on the growing file, sized by the file part, before the body ended.
+    assert seen_before_end[0] == [("live-final.mp4", True, len(payload), 7)]
+    assert seen_before_end[1] == 1000
+    path = main.UPLOAD_DIR / "live-final.mp4"
+    assert path.read_bytes() == payload and not growing.is_growing(path)
+    state = client.get("/state").json()
+    assert state["video"] == "live-final.mp4" and state["transfer_progress"] is None
+    main.update_state({"phase": "idle", "processing": False, "progress": 0, "video": None, "protocol_csv": None})
+
+
+def test_keyframe_sampling_snaps_within_tolerance_and_dedupes():
+    from app import processing
+
+    keyframes = [0.0, 2.0, 4.1, 6.0, 8.0, 30.0]
+    samples = processing.plan_keyframe_samples(keyframes, 10, 4)
+    # 10 -> 8.0 (2s away, within 5s); 20 has no keyframe closer than 10s; 30 is a keyframe.
+    assert samples == [(0.0, True), (8.0, True), (20.0, False), (30.0, True)]
+
+    # Two targets snapping to the same keyframe give one sample.
+    assert processing.plan_keyframe_samples([0.0, 5.0], 2, 4) == [(0.0, True), (2.0, False), (5.0, True)]
+
+    from app import main
+
+    assert main._parse_settings({"settings": {"sampling": "bogus"}})["sampling"] == "exact"
+    assert main._parse_settings({"settings": {"sampling": "keyframes"}})["sampling"] == "keyframes"
+
+
+def test_keyframe_pass_decodes_only_keyframes(monkeypatch):
+    import io
+    import subprocess
+    import sys
+    import types
+    from pathlib import Path
+
+    from app import processing
+
+    # 40 s at 25 fps with a keyframe every 2 s, none between 14 s and 26 s.
+    fps = 25
+    frame_times = [n / fps for n in range(40 * fps)]
+    keyframes = [t for t in frame_times if t % 2 == 0 and not 14 < t < 26]
+    info = {"video": {"width": 2, "height": 1}}
+    decoded = []
+
+    class _Ffmpeg:
+        # Decodes what its arguments ask for: only keyframes under -skip_frame nokey.
+        def __init__(self, args, **kwargs):
+            skip = "-skip_frame" in args and args[args.index("-skip_frame") + 1] == "nokey"
+            assert not skip or args.index("-skip_frame") < args.index("-i")
+            times = keyframes if skip else frame_times
+            decoded.extend(times)
+            self.stdout = io.BytesIO(b"\0" * 6 * len(times))
+            self.stderr = io.BytesIO("".join(
+                f"[Parsed_showinfo_0 @ 0x1] n:{n} pts:{round(t * 12800)} pts_time:{t:g} duration:512\n"
+                for n, t in enumerate(times)
+            ).encode())
+            self.returncode = None
+
+        def poll(self):
+            return self.returncode
+
+        def wait(self):
+            self.returncode = 0
+            return 0
+
+        def kill(self):
+            self.returncode = -9
+
+    class _Cap:
+        def __init__(self):
+            self.reads = []
+
+        def set(self, prop, value):
+            self.pos = value
+
+        def read(self):
+            self.reads.append(self.pos)
+            return True, f"frame@{self.pos}"
+
+        def release(self):
+            pass
+
+    numpy = types.SimpleNamespace(uint8="uint8", frombuffer=lambda buf, dtype: types.SimpleNamespace(reshape=lambda *shape: buf))
+    monkeypatch.setitem(sys.modules, "numpy", numpy)
+    monkeypatch.setattr(subprocess, "Popen", _Ffmpeg)
+
+    samples = processing.plan_keyframe_samples(keyframes, 10, 4)
+    assert samples == [(0.0, True), (10.0, True), (20.0, False), (30.0, True)]
+    cap = _Cap()
+    cv2 = type("cv2", (), {"CAP_PROP_POS_MSEC": 0})
+    frames = list(processing._keyframe_frames(cap, cv2, Path("race.mp4"), info, samples))
+
+    assert [ms for ms, _ in frames] == [0, 10000, 20000, 30000]
+    # One pass over the keyframes and one exact seek, instead of a GOP of catch-up per sample.
+    assert decoded == keyframes and len(decoded) < len(frame_times) / 40
+    assert cap.reads == [20000]
+
+
+def test_trim_prefers_keyframe_paths_and_falls_back(tmp_path, monkeypatch):
+    from app import main, trim
+
+    keyframes = [0.0, 4.0, 8.0, 12.0, 16.0]
+    assert trim.copy_start(keyframes, 9) == 8.0
+    assert trim.copy_start(keyframes, 8) == 8.0
+    assert trim.smart_cut_plan(keyframes, 5, 14) == [("encode", 5, 8.0), ("copy", 8.0, 12.0), ("encode", 12.0, 14)]
+    assert trim.smart_cut_plan(keyframes, 5, 10) == []
+
+    source = tmp_path / "race.mp4"
+    source.write_bytes(b"mp4")
+    calls = []
+    monkeypatch.setattr(main.media_info, "keyframes", lambda path: keyframes)
+    monkeypatch.setattr(main.media_info, "probe", lambda path: {"video": {"codec": "hevc"}, "audio": None})
+    monkeypatch.setattr(trim, "trim_smart", lambda *args, **kwargs: calls.append("smart") or False)
+    monkeypatch.setattr(trim, "trim_copy", lambda *args, **kwargs: calls.append("copy") or True)
+
+    target = main._trim_video(source, tmp_path / "out", start_time=5, end_time=14, check_cancel=lambda: False, mode="smart")
+    assert target.name == "race_trim_5_14.mp4"
+    assert calls == ["smart", "copy"]
+
+    response = client.post("/download", json={"url": "http://example.invalid/a.mp4", "trim_mode": "fast"})
+    assert response.status_code == 400
+
+
+def test_trim_smart_encodes_edges_with_source_sps_and_relative_keyframes(tmp_path, monkeypatch):
+    import json
+    import subprocess
+    from pathlib import Path
+
+    from app import media_info, trim
+
+    monkeypatch.setattr(media_info, "_cache", {})
+    monkeypatch.setattr(media_info, "_loaded_mtime", None)
+    source = tmp_path / "race.ts"
+    source.write_bytes(b"ts")
+    stream = {"codec_type": "video", "codec_name": "h264", "profile": "High", "level": 40, "refs": 3, "pix_fmt": "yuv420p"}
+    probe_json = json.dumps({"format": {"duration": "20", "start_time": "1.400000"}, "streams": [stream]})
+
+    def _fake_probe(cmd):
+        if "packet=pts_time,flags" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, "1.400,K_\n5.400,K_\n9.400,K_\n13.400,K_\n", "")
+        return subprocess.CompletedProcess(cmd, 0, probe_json, "")
+
+    monkeypatch.setattr(media_info, "_run", _fake_probe)
+    # MPEG-TS pts start at 1.4 s, -ss counts from the first frame.
+    keyframes = media_info.keyframes(source)
+    assert keyframes == [0.0, 4.0, 8.0, 12.0]
+    info = media_info.probe(source)
+    assert trim.edge_codec(info["video"])[-8:] == ["-profile:v", "high", "-level:v", "4.0", "-refs", "3", "-pix_fmt", "yuv420p"]
+    assert trim.edge_codec({**info["video"], "profile": "Baseline"}) is None
+
+    encoded = {"video": dict(info["video"]), "duration": 9.0}
+    commands = []
+
+    def _fake_run(cmd, check_cancel):
+        commands.append(cmd)
+        Path(cmd[-1]).write_bytes(b"part")
+        return True
+
+    monkeypatch.setattr(trim, "_run", _fake_run)
+    monkeypatch.setattr(trim.media_info, "probe", lambda path, cache=True: encoded)
+    cut = dict(check_cancel=lambda: False, work_dir=tmp_path / "parts")
+    assert trim.trim_smart(source, tmp_path / "out.mp4", 3, 12, keyframes, info, **cut)
+    assert [cmd[cmd.index("-ss") + 1] for cmd in commands[:3]] == ["3.000000", "4.000000", "8.000000"]
+    assert "-profile:v" in commands[0] and "copy" in commands[1]
+
+    # An edge whose SPS still differs from the source must not be spliced in.
+    encoded["video"]["refs"] = 1
+    commands.clear()
+    assert not trim.trim_smart(source, tmp_path / "out.mp4", 3, 12, keyframes, info, **cut)
+    assert len(commands) == 1
+
+
+def test_direct_download_uses_parallel_ranges_and_resumes(tmp_path, monkeypatch):
+    import hashlib
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from app import downloader
+
+    payload = os.urandom(100_000)
+    ranges = []
+
+    class _Handler(BaseHTTPRequestHandler):
+        honour_ranges = True
+
+        def do_GET(self):
+            header = self.headers.get("Range")
+            ranges.append(header)
+            if header and self.honour_ranges:
+                start, end = (int(v) for v in header.split("=")[1].split("-"))
+                body = payload[start:end + 1]
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            else:
+                body = payload
+                self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/clip.mp4"
+    monkeypatch.setattr(downloader, "PART_SIZE", 30_000)
+    digests = []
+    try:
+        target = tmp_path / "clip.mp4"
+        downloader.download(url, target, connections=4, on_digest=digests.append)
+        assert target.read_bytes() == payload
+        assert len([r for r in ranges if r != "bytes=0-0"]) == 4
+        assert not downloader.sidecar_path(target).exists()
+        assert digests == []  # parallel ranges land out of order: the caller hashes the file
+
+        # One connection writes in order, so the hash is taken as the bytes arrive.
+        single = tmp_path / "single.mp4"
+        downloader.download(url, single, connections=1, on_digest=digests.append)
+        assert digests == [hashlib.sha256(payload).hexdigest()]
+
+        # A checkpoint from an interrupted run: only the missing bytes are requested again.
+        resumed = tmp_path / "resumed.mp4"
+        resumed.write_bytes(payload[:60_000] + bytes(40_000))
+        downloader.sidecar_path(resumed).write_text(json.dumps({
+            "url": url, "size": len(payload), "validator": '"v1"',
+            "parts": [[0, 49_999, 50_000], [50_000, 99_999, 10_000]],
+        }), encoding="utf-8")
+        ranges.clear()
+        downloader.download(url, resumed, connections=4)
+        assert resumed.read_bytes() == payload
+        assert ranges == ["bytes=0-0", "bytes=60000-99999"]
+
+        _Handler.honour_ranges = False
+        ranges.clear()
+        plain = tmp_path / "plain.mp4"
+        downloader.download(url, plain, connections=4, on_digest=digests.append)
+        assert plain.read_bytes() == payload and ranges == ["bytes=0-0"]
+        assert digests[-1] == hashlib.sha256(payload).hexdigest()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ytdlp_fetches_sections_with_parallel_fragments(tmp_path, monkeypatch):
+    import types
+
+    from app import main
+
+    captured = {}
+    polls = []
+
+    class _FakeYDL:
+        def __init__(self, opts):
+            captured.update(opts)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def extract_info(self, url, download=True):
+            hook = captured["progress_hooks"][0]
+            for done in range(0, 101, 10):
+                hook({"status": "downloading", "downloaded_bytes": done, "total_bytes": 100})
+            (main.UPLOAD_DIR / "vk123.mp4").write_bytes(b"mp4")
+            return {"id": "vk123", "ext": "mp4"}
+
+        def prepare_filename(self, info):
+            return str(main.UPLOAD_DIR / f"{info['id']}.{info['ext']}")
+
+    fake = types.SimpleNamespace(
+        YoutubeDL=_FakeYDL,
+        utils=types.SimpleNamespace(download_range_func=lambda chapters, ranges: ("ranges", ranges)),
+    )
+    monkeypatch.setattr(main, "yt_dlp", fake)
+    progress = []
+    path = main._download_with_ytdlp(
+        "https://vk.example/video",
+        start_time=30,
+        end_time=90,
+        progress_cb=progress.append,
+        check_cancel=lambda: polls.append(1) or False,
+    )
+    assert path.name == "vk123.mp4"
+    assert captured["download_ranges"] == ("ranges", [(30, 90)])
+    assert captured["force_keyframes_at_cuts"] is False
+    assert captured["concurrent_fragment_downloads"] >= 1
+    assert "external_downloader" not in captured
+    # Eleven callbacks in a burst: one progress update and one cancel poll.
+    assert progress == [0] and len(polls) == 1
+
+    flag = []
+    cancelled = main._latched_cancel(lambda: bool(flag), interval_sec=0)
+    assert not cancelled()
+    flag.append(1)
+    assert cancelled()
+    flag.clear()
+    assert cancelled()
+    with pytest.raises(main.CancelledError):
+        main._download_with_ytdlp("https://vk.example/video", check_cancel=lambda: True)
+    path.unlink()
+
+
+def test_blob_store_drops_blob_when_its_last_name_is_repointed(tmp_path):
+    import hashlib
+
+    from app.blob_store import BlobStore
+
+    store = BlobStore(tmp_path)
+    for payload in (b"first take", b"second take"):
+        writer = store.writer()
+        writer.write(payload)
+        store.commit(writer, "route.mp4")
+
+    old, new = (hashlib.sha256(p).hexdigest() for p in (b"first take", b"second take"))
+    assert not store.blob_path(old).exists()
+    assert store._load().keys() == {new}
+    assert (tmp_path / "route.mp4").read_bytes() == b"second take"
+
+
+def test_storage_sweep_evicts_lru_units_and_keeps_referenced(tmp_path, monkeypatch):
+    import time
+
+    from app import storage
+    from app.blob_store import BlobStore
+
+    monkeypatch.setattr(storage, "MIN_AGE_SEC", 0)
+    videos, converted, proxy = (tmp_path / name for name in ("videos", "converted", "proxy"))
+    for root in (videos, converted, proxy):
+        root.mkdir()
+    store = BlobStore(videos)
+
+    def _stored(name: str, payload: bytes):
+        writer = store.writer()
+        writer.write(payload)
+        store.commit(writer, name)
+        time.sleep(0.02)
+
+    _stored("a.mp4", b"a" * 100)
+    _stored("a-copy.mp4", b"a" * 100)  # same bytes: one blob, two names
+    (converted / "b-0123456789ab.mp4").write_bytes(b"b" * 100)
+    time.sleep(0.02)
+    (proxy / "c-0123456789ab-720p.mp4").write_bytes(b"c" * 100)
+    time.sleep(0.02)
+    _stored("d.mp4", b"d" * 100)
+
+    manager = storage.StorageManager(
+        {"videos": videos, "converted": converted, "proxy": proxy},
+        tmp_path / "access.json",
+        blob_store=store,
+        budget=250,
+    )
+    manager.touch(videos / "a.mp4")
+    usage = manager.usage()
+    assert usage["used"] == 400 and usage["areas"]["videos"] == {"files": 2, "bytes": 200}
+
+    evicted = manager.sweep({"d.mp4"})
+    assert [item["files"] for item in evicted] == [["converted/b-0123456789ab.mp4"], ["proxy/c-0123456789ab-720p.mp4"]]
+
+    evicted = manager.sweep({"d.mp4"}, budget=50)
+    assert len(evicted) == 1 and evicted[0]["bytes"] == 100
+    assert sorted(p.name for p in videos.iterdir() if not p.name.startswith(".")) == ["d.mp4"]
+    assert [entry["names"] for entry in store._load().values()] == [["d.mp4"]]
+    assert manager.usage()["used"] == 100
+    assert storage.parse_size("1.5G") == 1536 * 1024 * 1024 and storage.parse_size("0") is None
+
+    assert client.get("/storage").json()["areas"].keys() == {"videos", "converted", "proxy"}
+
+
+def test_sqlite_backend_continues_event_seq_after_the_journal(tmp_path):
+    from app import state
+    from app.state_backend import SQLiteStateBackend
+
+    backend = SQLiteStateBackend(tmp_path / "state.db")
+    seq = state._initial_event_seq(backend, 12630)
+    assert seq == 12630
+    appended = backend.append_events([{"message": "first"}], seq)
+    assert [entry["seq"] for entry in appended] == [12631]
+
+    # A second worker with an older journal must not move the sequence back.
+    other = SQLiteStateBackend(tmp_path / "state.db")
+    assert state._initial_event_seq(other, 5) == 12631
+    assert [entry["message"] for entry in other.events_since(12630)] == ["first"]
@@ -0,0 +1,117 @@
+from app import state as state_module
+from app.state import flush_state, get_state_version, load_state, update_state
+
+
+def test_progress_ticks_do_not_rewrite_state_file(monkeypatch):
+    writes = []
+    monkeypatch.setattr(state_module, "_write_atomic", lambda path, text: writes.append(text))
+    load_state()
+    flush_state()
+    writes.clear()
+
+    version = get_state_version()
+    for progress in range(50):
+        update_state({"progress": progress})
+    flush_state()
+
+    assert get_state_version() == version + 50
+    assert load_state()["progress"] == 49
+    assert writes == []
+
+    update_state({"results_text": "00:00 Начало трансляции"})
+    flush_state()
+    assert len(writes) == 1
+    update_state({"results_text": ""})
+    flush_state()
+
+
+def test_load_state_returns_independent_copy():
+    snapshot = load_state()
+    snapshot["progress"] = -1
+    assert load_state()["progress"] != -1
+
+
+def test_events_use_ring_buffer_with_sequence_ids():
+    from app.state import EVENT_BUFFER_SIZE, append_event, get_events
+
+    first = append_event("ring test start")
+    for i in range(EVENT_BUFFER_SIZE + 5):
+        append_event(f"ring test {i}")
+
+    batch = get_events(first["seq"])
+    assert batch["truncated"] is True
+    assert len(batch["events"]) == EVENT_BUFFER_SIZE
+    seqs = [entry["seq"] for entry in batch["events"]]
+    assert seqs == sorted(seqs) and seqs[-1] == batch["last_seq"]
+
+    tail = get_events(batch["last_seq"] - 2)
+    assert [entry["message"] for entry in tail["events"]] == [
+        f"ring test {EVENT_BUFFER_SIZE + 3}",
+        f"ring test {EVENT_BUFFER_SIZE + 4}",
+    ]
+    assert tail["truncated"] is False
+    assert "events" not in load_state()
+
+
+def test_state_delta_merges_changed_keys_since_version():
+    from app.state import STATE_HISTORY_SIZE, get_state_delta
+
+    update_state({"progress": 1})
+    base = get_state_version()
+    update_state({"progress": 2})
+    update_state({"progress": 3, "phase_started_at": 123.0})
+
+    version, changes = get_state_delta(base)
+    assert version == base + 2
+    assert changes == {"progress": 3, "phase_started_at": 123.0}
+    assert get_state_delta(version) == (version, {})
+
+    for i in range(STATE_HISTORY_SIZE + 1):
+        update_state({"progress": i})
+    assert get_state_delta(base)[1] is None
+    update_state({"progress": 0, "phase_started_at": None})
+
+
+def test_sqlite_backend_shares_versions_events_and_job_lease(tmp_path):
+    from app.state_backend import SQLiteStateBackend
+
+    worker_a = SQLiteStateBackend(tmp_path / "state.db")
+    worker_b = SQLiteStateBackend(tmp_path / "state.db")
+
+    version, data, missed = worker_a.commit({"phase": "idle", "progress": 0}, 0)
+    assert (version, missed) == (1, [])
+    version, data, missed = worker_b.commit({"progress": 40}, 0)
+    assert version == 2 and data == {"phase": "idle", "progress": 40}
+    assert missed == [(1, {"phase": "idle", "progress": 0})]
+
+    head_version, rows_data, rows = worker_a.changes_since(1)
+    assert head_version == 2 and rows == [(2, {"progress": 40})] and rows_data["progress"] == 40
+
+    worker_a.append_events([{"message": "from a"}], 0)
+    merged = worker_b.append_events([{"message": "from b"}], 0)
+    assert [(e["seq"], e["message"]) for e in merged] == [(1, "from a"), (2, "from b")]
+    assert worker_a.head() == (2, 2)
+
+    # Jobs are merged by id: each worker's publish keeps the other's entries.
+    worker_a.commit({"jobs": {"a1": {"status": "running"}}}, 0, merge=("jobs",))
+    _, data, _ = worker_b.commit({"jobs": {"b1": {"status": "queued"}}}, 0, merge=("jobs",))
+    assert data["jobs"] == {"a1": {"status": "running"}, "b1": {"status": "queued"}}
+    _, data, _ = worker_a.commit({"jobs": {"a1": None}}, 0, merge=("jobs",))
+    assert data["jobs"] == {"b1": {"status": "queued"}}
+
+    assert worker_a.claim_job("owner-a", "process")
+    assert not worker_b.claim_job("owner-b", "download")
+    assert worker_b.job_owner()["owner"] == "owner-a"
+    worker_a.release_job("owner-a")
+    assert worker_b.claim_job("owner-b", "download")
+
+
+def test_merge_state_sets_and_removes_entries_by_key():
+    from app.state import merge_state
+
+    others = load_state().get("jobs") or {}
+    merge_state("jobs", {"a": {"status": "running"}})
+    merge_state("jobs", {"b": {"status": "queued"}})
+    assert load_state()["jobs"] == {**others, "a": {"status": "running"}, "b": {"status": "queued"}}
+    merge_state("jobs", {"a": None, "b": None})
+    assert load_state()["jobs"] == others